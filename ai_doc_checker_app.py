@@ -1,7 +1,17 @@
+import getpass
+import json
+import os
 import streamlit as st
 import time
-import os
-from openai import OpenAI
+
+import context_packer
+import instrumentation
+import rule_checks
+from check_registry import CHECKS, CHECK_FILES
+from findings_store import DEFAULT_HISTORY_FILE, FindingStore
+from response_cache import ResponseCache
+from verification_engine import VerificationEngine, create_client
+from verification_server import SERVER_URL_ENV, cancel_job, submit_job, wait_job
 
 # 追加: 横幅を広げるカスタムCSS
 st.markdown(
@@ -17,185 +27,278 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# --- OpenAIクライアント初期化 ---
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Streamlitは操作のたびにスクリプト全体を再実行するため、作り直す必要のないものはプロセスで1つだけ作る
+@st.cache_resource
+def get_client():
+    """
+    OpenAIクライアント（接続プールを含む）。再実行・セッションをまたいで共有する。
+    openaiの読み込みが重いため、最初の画面表示では作らず検証の実行時に作る。
+    再試行はcheck_runner側でバックオフ付きで行う。
+    """
+    return create_client()
+
+
+@st.cache_resource
+def get_response_cache():
+    """応答キャッシュ（プロンプトと検証対象ファイルが前回と同じなら結果を再利用）"""
+    return ResponseCache()
+
+
+def get_finding_store():
+    """
+    検証履歴（SQLiteの接続）。セッションごとに1つだけ開き、画面の再実行で使い回す。
+    再実行は別のスレッドで順に行われるため、作成したスレッド以外からも使えるように開く。
+    """
+    if "finding_store" not in st.session_state:
+        st.session_state["finding_store"] = FindingStore(DEFAULT_HISTORY_FILE, check_same_thread=False)
+    return st.session_state["finding_store"]
+
+
+cache = get_response_cache()
 
 # --- タイトル・説明 ---
 st.title("📘 AI検証ツール")
 st.markdown("""PlantUML/テキストで記述された仕様ドキュメントをAIが検証します。""")
 
-# --- ドキュメントファイルパス定義 ---
-usecase = ["./ユースケース図/ユースケース_要素.md",]
-
-usecase_description = ["./ユースケース記述/お金を投入する.md",
-                       "./ユースケース記述/機械の状態を確認する.md",
-                       "./ユースケース記述/故障対応を行う.md",
-                       "./ユースケース記述/商品を選択し購入する.md",
-                       "./ユースケース記述/商品を補充する.md",
-                       "./ユースケース記述/商品一覧を表示する.md",
-                       "./ユースケース記述/釣銭・返金を受け取る.md",
-                       "./ユースケース記述/釣銭を補充する.md",
-                       "./ユースケース記述/売上金を回収する.md",
-                       "./ユースケース記述/販売商品を変更する.md",
-                       ]
-
-activiry_usecase = [   "./アクティビティ図_ユースケース/お金を投入する.wsd",
-                       "./アクティビティ図_ユースケース/機械の状態を確認する.wsd",
-                       "./アクティビティ図_ユースケース/故障対応を行う.wsd",
-                       "./アクティビティ図_ユースケース/商品を選択し購入する.wsd",
-                       "./アクティビティ図_ユースケース/商品を補充する.wsd",
-                       "./アクティビティ図_ユースケース/商品一覧を表示する.wsd",
-                       "./アクティビティ図_ユースケース/釣銭_返金を受け取る.wsd",
-                       "./アクティビティ図_ユースケース/釣銭を補充する.wsd",
-                       "./アクティビティ図_ユースケース/売上金を回収する.wsd",
-                       "./アクティビティ図_ユースケース/販売商品を変更する.wsd",
-                    ]
-
-statemachine = ["./ステートマシン図/自動販売機_メイン.wsd",
-                "./ステートマシン図/自動販売機_メンテナンスモード.wsd",
-                "./ステートマシン図/自動販売機_管理モード.wsd",
-                "./ステートマシン図/自動販売機_故障中.wsd"]
-
-activity_function = ["./アクティビティ図_機能/お金投入を監視する.wsd",
-                    "./アクティビティ図_機能/合計投入金額を表示する.wsd",
-                    "./アクティビティ図_機能/商品ボタン押下を監視する.wsd",
-                    "./アクティビティ図_機能/商品一覧を表示する.wsd",
-                    "./アクティビティ図_機能/商品在庫を確認する.wsd",
-                    "./アクティビティ図_機能/投入金または釣銭を返金する.wsd",
-                    "./アクティビティ図_機能/購入可能な商品ボタンを選択可能にする.wsd",
-                    "./アクティビティ図_機能/購入商品を払いだす.wsd",
-                    "./アクティビティ図_機能/釣銭を確認する.wsd",
-                    "./アクティビティ図_機能/釣銭有無を表示する.wsd"]
-
-sequence = ["./シミュレーション_機能/自動販売機.wsd",]
-
-request = ["./要求図/要求図_要素.md",]
-
-system = ["./システム構成図/自動販売機_システム構成図.wsd",]
-
-glossary = ["./用語集/用語集.md"]
-
-fmea = ["./リスク評価/FMEA.md"]
-
-fta = ["./リスク評価/FTA_商品が出ない_誤表示.wsd",
-       "./リスク評価/FTA_釣銭不足_返金不可.wsd",
-       "./リスク評価/FTA_投入不可_金額誤認識.wsd"
-       ]
-
 # --- 検証オプション ---
-options = ["",
-           "図妥当性チェック ユースケース図",
-           "図間整合性チェック 要求図とユースケース図",
-           "図面間整合チェック ユースケース図とユースケース記述",
-           "図間整合性チェック ユースケース記述内のフローとアクティビティ図（ユースケース）",
-           "図間整合性チェック アクティビティ図（ユースケース）とステートマシン図",
-           "図間整合性チェック ステートマシン図と関連ドキュメント",
-           "図間整合性チェック システム構成図とシーケンス図",
-           "図間整合性チェック 用語_ID整合性チェック",
-           "網羅性チェック 要求カバレッジ",
-           "網羅性チェック フローカバレッジ",
-           "網羅性チェック 状態_遷移カバレッジ",
-           "網羅性チェック リスク対応カバレッジ",
-           "シミュレーションベースの検証 シーケンス図の妥当性検証 (シナリオ生成とシミュレーション実行)",
-           "シミュレーションベースの検証 ステートマシン図の動的検証 (イベントシーケンス生成と動的解析)"
-        ]
+options = [""] + [check["name"] for check in CHECKS]
 
 # --- メイン処理 ---
 choice = st.selectbox("検証項目を指定してください", options)
-files = []
-txt_content = ""
 
-# プロンプトを読み出す
-if choice and os.path.exists("./プロンプト/" + choice + ".txt"):
-    with open("./プロンプト/" + choice + ".txt", "r", encoding="utf-8") as f:
-        txt_content = f.read()
+force_rerun = st.checkbox("キャッシュを使わずに再実行する", value=False)
+# 計測結果はプロセス内に残るため、画面を操作しても前回までの区間に追加していく
+if st.checkbox("処理時間を計測する", value=instrumentation.enabled()):
+    instrumentation.enable()
 else:
-    if choice:
+    instrumentation.disable()
+context_budget = st.number_input("1回の検証に載せるコンテキストの上限トークン数（超えたら分割して検証）",
+                                 min_value=4000, value=context_packer.DEFAULT_CONTEXT_BUDGET, step=4000)
+col1, col2 = st.columns(2)
+concurrency = col1.number_input("同時実行数", min_value=1, max_value=16, value=4)
+tokens_per_minute = col2.number_input("1分あたりのトークン上限 (TPM)", min_value=1000, value=30000, step=1000)
+if st.button("🗑 応答キャッシュを削除"):
+    cache.clear()
+    st.info("応答キャッシュを削除しました。")
+
+# 検証の実行はすべてエンジンに任せる（画面は入力と結果の表示のみ）
+# プロンプト・検証対象ファイル・XMIの抽出結果は、ファイルが変わるまでプロセス内のキャッシュから返る
+# エンジンは再実行ごとに作るが、検証履歴の接続はセッションで共有する（再実行ごとに開かない）
+engine = VerificationEngine(".", None, cache,
+                            concurrency=int(concurrency),
+                            tokens_per_minute=int(tokens_per_minute),
+                            context_budget=int(context_budget),
+                            store=get_finding_store())
+
+# プロンプトと検証対象ファイル
+txt_content = ""
+runs_locally = engine.runs_locally(choice)
+if runs_locally:
+    st.info("この検証項目は生成AIを使わず、状態遷移図・アクティビティ図のシミュレーションで実行します。")
+elif choice:
+    txt_content = engine.prompt(choice) or ""
+    if not txt_content:
         st.info(f"{choice}.txt ファイルが見つかりません。")
+files = CHECK_FILES.get(choice, [])
 
-# コンテキストファイル選択
-if choice == "図妥当性チェック ユースケース図":
-    files =  usecase
-
-if choice == "図面間整合チェック ユースケース図とユースケース記述":
-    files = usecase + usecase_description
-
-if choice == "図間整合性チェック 用語_ID整合性チェック":
-    files = request + usecase + usecase_description + system + statemachine + glossary
-
-if choice == "図間整合性チェック 要求図とユースケース図":
-    files =  request + usecase
-
-if choice == "図間整合性チェック ユースケース記述内のフローとアクティビティ図（ユースケース）":
-    files =  usecase_description + activiry_usecase
+# 事前チェックの結果（XMIから機械的に判定できる指摘はAIに委ねず事実としてプロンプトに含める）
+findings, rule_names = engine.findings(choice)
+if rule_names:
+    with st.expander(f"ルールベースの事前チェック結果（{len(findings)}件）", expanded=bool(findings)):
+        st.markdown(rule_checks.format_findings(findings, rule_names))
 
-if choice == "図間整合性チェック アクティビティ図（ユースケース）とステートマシン図":
-    files =  usecase_description + activiry_usecase + statemachine
 
-if choice == "図間整合性チェック ステートマシン図と関連ドキュメント":
-    files =  statemachine + usecase_description + activity_function
-
-if choice == "図間整合性チェック システム構成図とシーケンス図":
-    files =  system + sequence
-
-if choice == "網羅性チェック 要求カバレッジ":
-    files =  request + usecase
+def stream_renderer(placeholder, interval=0.1):
+    """
+    受信した差分を貯めて placeholder に描画する on_delta を返す。
+    描画は interval 秒ごとにまとめる（差分ごとに描画すると画面の更新が追いつかない）。
+    """
+    parts = []
+    last_render = [0.0]
 
-if choice == "網羅性チェック フローカバレッジ":
-    files =  usecase_description + activiry_usecase
+    def on_delta(check, text):
+        parts.append(text)
+        now = time.monotonic()
+        if now - last_render[0] >= interval:
+            last_render[0] = now
+            placeholder.markdown(''.join(parts) + " ▌")
 
-if choice == "網羅性チェック 状態_遷移カバレッジ":
-    files =  statemachine
+    return on_delta
 
-if choice == "網羅性チェック リスク対応カバレッジ":
-    files =  fmea + fta + usecase_description + statemachine
 
 # --- AI検証 ---
-if st.button("🔍 AI検証を実行"):
+# 実行中に「中止」を押すと、画面の再実行で検証が止まり、APIの接続も閉じる（生成とトークン消費が止まる）
+col_run, col_cancel = st.columns(2)
+run_clicked = col_run.button("🔍 AI検証を実行")
+if col_cancel.button("⏹ 検証を中止", key="cancel_single"):
+    st.warning("検証を中止しました。途中までの結果は検証結果ファイルに保存されています。")
+
+if run_clicked:
     if not files:
         st.warning("検証対象のファイルが選択されていません。")
         st.stop()
-    if not txt_content:
+    if not txt_content and not runs_locally:
         st.warning("プロンプトファイルが読み込まれていません。")
         st.stop()
-    with st.spinner("AIが仕様ドキュメントを分析中..."):
-        try:
-            st.markdown("#### 検証対象ファイル一覧")
-            st.code('\n'.join(files))
-
-            context_parts = []
-            for file_name in files:
-                if os.path.exists(file_name):
-                    with open(file_name, "r", encoding="utf-8") as f:
-                        content = f.read()
-                    context_parts.append(f"\n### ドキュメント: {file_name}\n{content}\n")
-                else:
-                    st.warning(f"ファイルがありません: {file_name}")
-
-            context = ''.join(context_parts)
-            prompt = f"{txt_content}\n\n---\n\n{context}"
-
-            response = client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": "あなたはMBSE仕様ドキュメントの整合性検証を支援するAIです。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=10000
-            )
-            result = response.choices[0].message.content
-            st.success("✅ AI検証の結果")
-            with st.expander("AI検証の詳細結果", expanded=True):
-                st.markdown(result)
-
-            # Save the verification result to a file
-            result_dir = "./検証結果"
-            os.makedirs(result_dir, exist_ok=True)
-            result_file = os.path.join(result_dir, f"{choice}_検証結果.txt")
-            with open(result_file, "w", encoding="utf-8") as f:
-                f.write(result)
-            st.info(f"検証結果がファイルに保存されました: {result_file}")
-
-        except Exception as e:
-            st.error(f"エラーが発生しました: {e}")
\ No newline at end of file
+    try:
+        st.markdown("#### 検証対象ファイル一覧")
+        st.code('\n'.join(files))
+
+        status = st.empty()
+        status.info("AIが仕様ドキュメントを分析中...")
+        with st.expander("AI検証の詳細結果", expanded=True):
+            output = st.empty()
+
+        def show_status(check, status_text, detail=None):
+            if status_text in ("実行中", "統合中") or status_text.startswith("分割検証中"):
+                status.info(f"AIが仕様ドキュメントを分析中...（{status_text}）")
+
+        engine.client = get_client()
+        outcome = engine.run([choice], force=force_rerun, on_progress=show_status,
+                             on_delta=stream_renderer(output))[choice]
+        status.empty()
+        for file_name in outcome['missing']:
+            st.warning(f"ファイルがありません: {file_name}")
+        if outcome['error']:
+            raise RuntimeError(outcome['error'])
+        if outcome['cached']:
+            st.info("入力に変更がないため、前回の検証結果を表示します。")
+        elif outcome['chunks'] > 1:
+            st.info(f"コンテキストが上限を超えたため、{outcome['chunks']}分割で検証して統合しました。")
+        result = outcome['result']
+        output.markdown(result)
+        st.success("✅ AI検証の結果")
+
+        # Save the verification result to a file
+        st.info(f"検証結果がファイルに保存されました: {outcome['result_file']}")
+
+        # 構造化された指摘（検証履歴に保存済み）
+        if outcome['status'] == 'invalid':
+            st.warning(f"構造化された指摘を取り出せませんでした: {outcome['parse_error']}")
+        else:
+            new_findings = engine.store.new_findings(choice)
+            st.info(f"構造化された指摘: {len(outcome['findings'])}件（前回からの新規: {len(new_findings)}件）")
+
+    except Exception as e:
+        st.error(f"エラーが発生しました: {e}")
+
+# --- 一括検証（並列実行） ---
+st.markdown("---")
+st.subheader("🚀 一括検証")
+selected = st.multiselect("一括で実行する検証項目（未選択ならすべて）", engine.checks())
+# ジョブサーバ（verification_server.py）に送ると、同じ内容の検証をチームで共有し、待ち行列で順に実行する
+server_url = st.text_input("ジョブサーバのURL（空ならこの画面のプロセスで実行）", os.getenv(SERVER_URL_ENV, "")).strip()
+
+col_batch, col_batch_cancel = st.columns(2)
+batch_clicked = col_batch.button("▶ 一括でAI検証を実行")
+if col_batch_cancel.button("⏹ 一括検証を中止", key="cancel_batch"):
+    if server_url and st.session_state.get("server_job"):
+        cancel_job(server_url, st.session_state.pop("server_job"))
+    st.warning("一括検証を中止しました。途中までの結果は検証結果ファイルに保存されています。")
+
+if batch_clicked and server_url:
+    placeholders = {check: st.empty() for check in selected or engine.checks()}
+
+    def show_job(job):
+        for check, status_text in job['progress'].items():
+            if check in placeholders:
+                placeholders[check].info(f"**{check}**: {status_text}（ジョブ {job['id']}: {job['status']}）")
+
+    start_time = time.time()
+    try:
+        submitted = submit_job(server_url, os.path.abspath("."), selected or None, getpass.getuser(), force_rerun)
+        st.session_state["server_job"] = submitted['id']
+        if submitted['deduplicated']:
+            st.info(f"同じ内容のジョブ（{submitted['id']}）が実行中のため、その結果を待ちます。")
+        job = wait_job(server_url, submitted['id'], show_job)
+    except RuntimeError as e:
+        st.error(f"ジョブサーバでエラーが発生しました: {e}")
+        st.stop()
+    st.session_state.pop("server_job", None)
+    elapsed = time.time() - start_time
+    for check, outcome in job['outcomes'].items():
+        if outcome['skipped']:
+            placeholders[check].warning(f"**{check}**: スキップ（{outcome['skipped']}）")
+        elif outcome['error']:
+            placeholders[check].error(f"**{check}**: エラー ({outcome['error']})")
+        else:
+            placeholders[check].success(f"**{check}**: 完了 → {outcome['result_file']}")
+    succeeded = [check for check, outcome in job['outcomes'].items() if not outcome['skipped'] and not outcome['error']]
+    cached = sum(1 for outcome in job['outcomes'].values() if outcome['cached'])
+    st.success(f"✅ ジョブ {job['id']} が終了しました（{job['status']}, 成功: {len(succeeded)}件 / "
+               f"{len(job['outcomes'])}件, うちキャッシュ: {cached}件, {elapsed:.1f} 秒）")
+    for check in succeeded:
+        with st.expander(f"{check} の検証結果"):
+            st.markdown(job['outcomes'][check]['result'])
+
+elif batch_clicked:
+    # 検証項目ごとの進捗表示
+    placeholders = {check: st.empty() for check in selected or engine.checks()}
+    received = {}
+
+    def show_received(check, text):
+        # 受信した文字数を表示する（画面の更新のたびに中止ボタンの操作が反映される）
+        received[check] = received.get(check, 0) + len(text)
+        placeholders[check].info(f"**{check}**: 受信中（{received[check]}文字）")
+
+    def show_progress(check, status, detail=None):
+        text = f"**{check}**: {status}"
+        if status.startswith("完了"):
+            placeholders[check].success(f"{text} → {detail}")
+        elif status == "エラー":
+            placeholders[check].error(f"{text} ({detail})")
+        else:
+            placeholders[check].info(text)
+
+    start_time = time.time()
+    engine.client = get_client()
+    outcomes = engine.run(selected or None, force=force_rerun, on_progress=show_progress, on_delta=show_received)
+    elapsed = time.time() - start_time
+
+    for check, outcome in outcomes.items():
+        if outcome.get('skipped'):
+            placeholders[check].warning(f"**{check}**: スキップ（{outcome['skipped']}）")
+        for file_name in outcome['missing']:
+            st.warning(f"{check}: ファイルがありません: {file_name}")
+    succeeded = [check for check, outcome in outcomes.items()
+                 if not outcome.get('skipped') and outcome['error'] is None]
+    cached = sum(1 for outcome in outcomes.values() if outcome['cached'])
+    st.success(f"✅ 一括検証が終了しました（成功: {len(succeeded)}件 / {len(outcomes)}件, "
+               f"うちキャッシュ: {cached}件, {elapsed:.1f} 秒）")
+    for check in succeeded:
+        with st.expander(f"{check} の検証結果"):
+            st.markdown(outcomes[check]['result'])
+
+# --- 検証履歴（構造化された指摘から都度レポートを作る） ---
+st.markdown("---")
+st.subheader("📊 検証履歴")
+col_report, col_element = st.columns(2)
+report_check = col_report.selectbox("レポートの検証項目（未選択ならすべて）", options, key="report_check")
+element = col_element.text_input("要素ごとの未解決の指摘（要求IDなど）")
+if element:
+    open_findings = engine.store.open_findings(element.strip())
+    st.markdown(f"**{element}** の未解決の指摘: {len(open_findings)}件")
+    for f in open_findings:
+        st.markdown(f"- [{f['severity']}] {f['check_name']}: {f['message']}")
+if st.button("📄 レポートを作成"):
+    st.markdown(engine.store.report(report_check or None))
+
+# --- 処理時間の計測結果（API呼び出し・レート制限の待ち・キャッシュの利用状況など） ---
+spans, counter_values = instrumentation.summary()
+if instrumentation.enabled() or spans:
+    st.markdown("---")
+    st.subheader("⏱ 計測")
+    if spans:
+        st.dataframe([{"区間": s['name'], "回数": s['count'], "合計(ms)": round(s['total_ms'], 1),
+                       "平均(ms)": round(s['mean_ms'], 2), "最大(ms)": round(s['max_ms'], 1)} for s in spans])
+    if counter_values:
+        st.dataframe([{"カウンタ": name, "値": value} for name, value in counter_values.items()])
+    if not spans and not counter_values:
+        st.info("まだ計測結果はありません。検証を実行すると表示されます。")
+    col_trace, col_reset = st.columns(2)
+    col_trace.download_button("⬇ トレースをダウンロード（chrome://tracing・Perfetto用）",
+                              json.dumps(instrumentation.trace(), ensure_ascii=False),
+                              file_name="trace.json", mime="application/json")
+    if col_reset.button("🗑 計測結果を消去"):
+        instrumentation.reset()
+        st.rerun()
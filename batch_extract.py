@@ -0,0 +1,152 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrumentation
+from model_snapshot import SNAPSHOT_DIR, is_fresh, load_model, snapshot_path
+from model_extractors import extract_requirements, extract_use_cases, extract_activity
+from markdown_report import report_file_name, format_requirement_report, format_use_case_report, format_activity_report
+from extraction_cache import DEFAULT_CACHE_FILE, ExtractionCache, write_text_atomic
+
+# XMIのdiagramType → 抽出の種別（CustomDiagramなどは要求の有無で判定する）
+_DIAGRAM_KINDS = {
+    'UseCaseDiagram': 'use_case',
+    'ActivityDiagram': 'activity',
+}
+
+
+def is_xmi_file(path):
+    """先頭部分を読み、EAのXMIエクスポートかどうかを判定する"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(512)
+    except OSError:
+        return False
+    return b'<XMI' in head
+
+
+def discover_xmi_files(root_dir):
+    """ディレクトリ配下のXMIファイルをパス順に列挙する"""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if filename.lower().endswith('.xml') and is_xmi_file(path):
+                found.append(path)
+    return found
+
+
+def diagram_kinds(model):
+    """XMIに含まれるダイアグラムの種別を、抽出の種別の集合として返す"""
+    kinds = set()
+    for diagram in model.diagrams:
+        kind = _DIAGRAM_KINDS.get(diagram.type)
+        if kind:
+            kinds.add(kind)
+    if any(elem.stereotype == 'requirement' for elem in model.elements.values()):
+        kinds.add('requirement')
+    return kinds
+
+
+def output_paths(xmi_path, kinds, output_dir=None, root_dir=None):
+    """
+    種別ごとのMarkdown出力先を返します。
+    既定では入力XMIと同じディレクトリに出力し、output_dirを指定した場合は
+    root_dirからの相対構成を保ったまま出力します。
+    ファイル名は.qeaからの出力（qea_repository）と同じく検証項目が読む名前とし、
+    アクティビティ図だけは入力XMIのファイル名から付けます。
+    """
+    directory = os.path.dirname(xmi_path)
+    if output_dir:
+        directory = os.path.join(output_dir, os.path.relpath(directory, root_dir))
+    stem = os.path.splitext(os.path.basename(xmi_path))[0]
+    return {kind: os.path.join(directory, report_file_name(kind, stem)) for kind in kinds}
+
+
+def extract_file(xmi_path, output_dir=None, root_dir=None, snapshot_dir=None):
+    """
+    1つのXMIファイルを解析し、含まれる図の種別に応じたMarkdownを書き出します。
+    プロセスプールのワーカーで実行されます。
+    snapshot_dirを指定すると、最新のスナップショットがあれば解析せずに開き、
+    なければ解析した結果をスナップショットとして書き出します。
+
+    Returns:
+        tuple: (xmi_path, 書き出したMarkdownのパスのリスト)
+    """
+    model = load_model(xmi_path, snapshot_dir, write=True)
+    kinds = diagram_kinds(model)
+    reports = {}
+    for kind, path in sorted(output_paths(xmi_path, kinds, output_dir, root_dir).items()):
+        if kind == 'requirement':
+            reports[path] = format_requirement_report(*extract_requirements(model))
+        elif kind == 'use_case':
+            reports[path] = format_use_case_report(*extract_use_cases(model))
+        else:
+            reports[path] = format_activity_report(*extract_activity(model))
+    # 抽出が済んだらモデルを手放し、書き出しの間は出力の大きさのメモリだけを持つ
+    del model
+    written = []
+    for path, report in reports.items():
+        with instrumentation.span('markdown.write', file=path):
+            write_text_atomic(path, report)
+        written.append(path)
+    return xmi_path, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ディレクトリ配下のXMIファイルをすべて並列に抽出してMarkdownを出力します')
+    parser.add_argument('root_dir', nargs='?', default='.', help='XMIファイルを探すディレクトリ')
+    parser.add_argument('-o', '--output-dir', help='Markdownの出力先（省略時は各XMIと同じディレクトリ）')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='並列に実行するプロセス数')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE, help='抽出キャッシュのファイル')
+    parser.add_argument('--force', action='store_true', help='キャッシュを無視してすべて再生成する')
+    parser.add_argument('--snapshot', action='store_true',
+                        help=f'抽出したモデルのスナップショットも root_dir/{SNAPSHOT_DIR} に書き出す（ルールチェック等が解析せずに読める）')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+    snapshot_dir = os.path.join(args.root_dir, SNAPSHOT_DIR) if args.snapshot else None
+
+    with instrumentation.tracing(args.trace):
+        start_time = time.time()
+        cache = ExtractionCache(args.cache_file)
+
+        # 前回の出力がすべて最新のファイルは解析しない
+        pending = {}
+        skipped = 0
+        for xmi_path in discover_xmi_files(args.root_dir):
+            key = cache.file_key(xmi_path)
+            if not args.force and cache.is_source_fresh(xmi_path, key) and (
+                    not snapshot_dir or is_fresh(snapshot_path(xmi_path, snapshot_dir), xmi_path)):
+                skipped += 1
+                continue
+            pending[xmi_path] = key
+
+        failed = 0
+        if pending:
+            with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(pending)))) as pool:
+                # 計測中はワーカーでも計測し、区間とカウンタを親に集める
+                trace = instrumentation.enabled()
+                futures = {pool.submit(instrumentation.worker_call, trace, extract_file,
+                                       xmi_path, args.output_dir, args.root_dir, snapshot_dir): xmi_path
+                           for xmi_path in pending}
+                for future in as_completed(futures):
+                    try:
+                        (xmi_path, written), state = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"  エラー: {futures[future]}: {e}")
+                        continue
+                    instrumentation.merge(state)
+                    cache.record_source(xmi_path, pending[xmi_path], written)
+                    print(f"Exported: {xmi_path} -> {', '.join(written) or '(対象の図なし)'}")
+        cache.save()
+
+        elapsed = time.time() - start_time
+        print(f"抽出: {len(pending) - failed}件, 変更なしで省略: {skipped}件, 失敗: {failed}件")
+        print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from xmi_generator import KINDS, generate_xmi
+from xmi_parser import parse_xmi
+from model_extractors import EXTRACTOR_VERSION, extract_requirements, extract_use_cases, extract_activity
+from markdown_report import format_requirement_report, format_use_case_report, format_activity_report
+
+# 結果ファイルの形式のバージョン（項目を変えたら上げる）
+RESULT_FORMAT = 1
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+# 種別ごとの (抽出, Markdown出力)
+_PIPELINES = {
+    'requirement': (extract_requirements, format_requirement_report),
+    'use_case': (extract_use_cases, format_use_case_report),
+    'activity': (extract_activity, format_activity_report),
+}
+STAGES = ('parse', 'extract', 'format')
+
+# 増え方を判定する計測値 → 表示名
+_METRIC_LABELS = {'seconds': '時間', 'peak_bytes': '確保したメモリ'}
+
+CSV_FIELDS = ('kind', 'size', 'stage', 'seconds', 'peak_bytes', 'retained_bytes', 'rss_kb', 'file_bytes')
+
+
+def _stage_functions(kind, path):
+    """段階名 → 前の段階の結果を受け取って実行する関数"""
+    extract, report = _PIPELINES[kind]
+    return {
+        'parse': lambda _: parse_xmi(path),
+        'extract': extract,
+        'format': lambda result: report(*result),
+    }
+
+
+def _peak_rss_kb():
+    """このプロセスのこれまでの最大RSS（KB、取得できない環境ではNone）"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト単位、Linuxはキロバイト単位
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_case(kind, size, path, repeat=3):
+    """
+    1つの種別・規模について、解析・抽出・Markdown出力の各段階を計測します。
+    最大RSSがほかの規模の影響を受けないよう、規模ごとに新しいプロセスで呼び出します。
+
+    時間は repeat 回の最小値です。最大RSSはその段階までのプロセスの最大値、
+    確保したメモリ（tracemallocの最大値と段階の後も残った量）は時間の計測の後に別に測ります
+    （tracemallocは処理を遅くするため）。
+
+    Returns:
+        list: 段階ごとの計測結果の辞書。
+    """
+    functions = _stage_functions(kind, path)
+    results = []
+    value = None
+    # 抽出処理の進捗表示は計測結果の表示を乱すため捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        for stage in STAGES:
+            best = math.inf
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                output = functions[stage](value)
+                best = min(best, time.perf_counter() - start)
+            value = output
+            results.append({'kind': kind, 'size': size, 'stage': stage, 'seconds': best,
+                            'rss_kb': _peak_rss_kb(), 'file_bytes': os.path.getsize(path)})
+
+        value = None
+        tracemalloc.start()
+        for record in results:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            output = functions[record['stage']](value)
+            current, peak = tracemalloc.get_traced_memory()
+            record['peak_bytes'] = peak - before
+            record['retained_bytes'] = current - before
+            value = output
+        tracemalloc.stop()
+    return results
+
+
+def growth_exponent(size1, value1, size2, value2):
+    """2つの規模の計測値から増え方の次数を求める（1なら線形、2なら2乗）"""
+    if size1 == size2 or value1 <= 0 or value2 <= 0:
+        return None
+    return math.log(value2 / value1) / math.log(size2 / size1)
+
+
+def find_regressions(results, baseline=None, max_exponent=1.3, tolerance=1.5, min_seconds=0.05):
+    """
+    規模に対して線形より速く増える段階と、基準の結果より遅くなった段階を探します。
+    計測の揺らぎで誤検知しないよう、min_seconds未満の時間は判定しません。
+
+    Args:
+        results (list): run_caseの計測結果。
+        baseline (list): 比較する前回の計測結果（Noneなら比較しない）。
+        max_exponent (float): 許容する増え方の次数（時間・確保したメモリ）。
+        tolerance (float): 基準の結果に対して許容する時間の倍率。
+
+    Returns:
+        list: 検出した問題の辞書 {'kind', 'stage', 'size', 'metric', 'value', 'message'} のリスト。
+    """
+    regressions = []
+    by_stage = {}
+    for record in results:
+        by_stage.setdefault((record['kind'], record['stage']), []).append(record)
+    for (kind, stage), records in by_stage.items():
+        records.sort(key=lambda r: r['size'])
+        for smaller, larger in zip(records, records[1:]):
+            for metric, floor in (('seconds', min_seconds), ('peak_bytes', 1024 * 1024)):
+                if larger[metric] is None or larger[metric] < floor:
+                    continue
+                exponent = growth_exponent(smaller['size'], smaller[metric], larger['size'], larger[metric])
+                if exponent is not None and exponent > max_exponent:
+                    regressions.append({
+                        'kind': kind, 'stage': stage, 'size': larger['size'], 'metric': metric, 'value': exponent,
+                        'message': f"{kind}/{stage}: {smaller['size']}→{larger['size']}件で{_METRIC_LABELS[metric]}が"
+                                   f"規模の{exponent:.2f}乗で増えています"})
+
+    if baseline:
+        previous = {(r['kind'], r['size'], r['stage']): r for r in baseline}
+        for record in results:
+            before = previous.get((record['kind'], record['size'], record['stage']))
+            if not before or record['seconds'] < min_seconds or before['seconds'] <= 0:
+                continue
+            ratio = record['seconds'] / before['seconds']
+            if ratio > tolerance:
+                regressions.append({
+                    'kind': record['kind'], 'stage': record['stage'], 'size': record['size'],
+                    'metric': 'baseline', 'value': ratio,
+                    'message': f"{record['kind']}/{record['stage']}: {record['size']}件で基準より"
+                               f"{ratio:.2f}倍遅くなっています（{before['seconds']:.3f}→{record['seconds']:.3f}秒）"})
+    return regressions
+
+
+def run_benchmark(kinds=KINDS, sizes=DEFAULT_SIZES, repeat=3, work_dir=None, seed=0):
+    """
+    合成モデルを生成し、種別・規模ごとに別プロセスで計測します。
+    work_dirを指定した場合は生成したXMIを残し、次回は同じファイルを使います。
+
+    Returns:
+        list: 段階ごとの計測結果の辞書。
+    """
+    results = []
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        for kind in kinds:
+            for size in sorted(sizes):
+                path = os.path.join(work_dir, f"{kind}_{size}_{seed}.xml")
+                if not os.path.exists(path):
+                    generate_xmi(path, kind, size, seed)
+                # spawnで起動し、親プロセスのメモリを引き継がない状態で最大RSSを測る
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    case = pool.submit(run_case, kind, size, path, repeat).result()
+                for record in case:
+                    print(f"  {kind} {size}件 {record['stage']}: {record['seconds']:.3f} 秒")
+                results.extend(case)
+    return results
+
+
+def format_table(results):
+    """計測結果を表形式の文字列にする"""
+    lines = [f"{'種別':<12}{'件数':>8}  {'段階':<8}{'時間(秒)':>10}{'最大確保(MB)':>14}{'残存(MB)':>10}"
+             f"{'最大RSS(MB)':>13}{'XMI(MB)':>9}"]
+    for r in results:
+        rss = f"{r['rss_kb'] / 1024:.1f}" if r['rss_kb'] is not None else '-'
+        lines.append(f"{r['kind']:<12}{r['size']:>8}  {r['stage']:<8}{r['seconds']:>10.3f}"
+                     f"{r['peak_bytes'] / 1024 / 1024:>14.1f}{r['retained_bytes'] / 1024 / 1024:>10.1f}"
+                     f"{rss:>13}{r['file_bytes'] / 1024 / 1024:>9.1f}")
+    return '\n'.join(lines)
+
+
+def load_results(path):
+    """保存した結果ファイルの計測結果を読み込む"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('format') != RESULT_FORMAT:
+        print(f"警告: {path} は結果ファイルの形式が異なります（format={data.get('format')}）")
+    return data.get('results', [])
+
+
+def save_results(path, results, regressions, repeat, seed):
+    """計測結果を実行環境の情報とともにJSONで保存する"""
+    data = {
+        'format': RESULT_FORMAT,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'extractor_version': EXTRACTOR_VERSION,
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+        'regressions': regressions,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+
+
+def save_csv(path, results):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for record in results:
+            writer.writerow({field: record[field] for field in CSV_FIELDS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成した大規模モデルで、XMIの解析・抽出・Markdown出力の時間とメモリを計測します')
+    parser.add_argument('--kind', action='append', choices=KINDS, help='計測する図の種別（複数指定可、省略時はすべて）')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='計測する規模（主要素の件数）')
+    parser.add_argument('--repeat', type=int, default=3, help='時間を測る回数（最小値を採る）')
+    parser.add_argument('--seed', type=int, default=0, help='合成モデルの乱数の種')
+    parser.add_argument('--work-dir', help='生成したXMIを置くディレクトリ（省略時は一時ディレクトリ）')
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help='計測結果のJSONファイル')
+    parser.add_argument('--csv', help='計測結果をCSVでも書き出す')
+    parser.add_argument('--baseline', help='比較する前回の計測結果のJSONファイル')
+    parser.add_argument('--max-exponent', type=float, default=1.3, help='許容する規模に対する増え方の次数')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='基準の結果に対して許容する時間の倍率')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='これより短い時間は判定しない（計測の揺らぎ対策）')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    baseline = load_results(args.baseline) if args.baseline else None
+    kinds = tuple(dict.fromkeys(args.kind or KINDS))
+    results = run_benchmark(kinds, args.sizes, args.repeat, args.work_dir, args.seed)
+    regressions = find_regressions(results, baseline, args.max_exponent, args.tolerance, args.min_seconds)
+
+    print(format_table(results))
+    save_results(args.output, results, regressions, args.repeat, args.seed)
+    print(f"Exported: {args.output}")
+    if args.csv:
+        save_csv(args.csv, results)
+        print(f"Exported: {args.csv}")
+    for regression in regressions:
+        print(f"警告: {regression['message']}")
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
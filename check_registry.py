@@ -0,0 +1,156 @@
+import os
+
+from context_packer import structured_candidate
+
+PROMPT_DIR = "./プロンプト"
+
+# --- ドキュメントファイルパス定義 ---
+usecase = ["./ユースケース図/ユースケース_要素.md",]
+
+usecase_description = ["./ユースケース記述/お金を投入する.md",
+                       "./ユースケース記述/機械の状態を確認する.md",
+                       "./ユースケース記述/故障対応を行う.md",
+                       "./ユースケース記述/商品を選択し購入する.md",
+                       "./ユースケース記述/商品を補充する.md",
+                       "./ユースケース記述/商品一覧を表示する.md",
+                       "./ユースケース記述/釣銭・返金を受け取る.md",
+                       "./ユースケース記述/釣銭を補充する.md",
+                       "./ユースケース記述/売上金を回収する.md",
+                       "./ユースケース記述/販売商品を変更する.md",
+                       ]
+
+activiry_usecase = [   "./アクティビティ図_ユースケース/お金を投入する.wsd",
+                       "./アクティビティ図_ユースケース/機械の状態を確認する.wsd",
+                       "./アクティビティ図_ユースケース/故障対応を行う.wsd",
+                       "./アクティビティ図_ユースケース/商品を選択し購入する.wsd",
+                       "./アクティビティ図_ユースケース/商品を補充する.wsd",
+                       "./アクティビティ図_ユースケース/商品一覧を表示する.wsd",
+                       "./アクティビティ図_ユースケース/釣銭_返金を受け取る.wsd",
+                       "./アクティビティ図_ユースケース/釣銭を補充する.wsd",
+                       "./アクティビティ図_ユースケース/売上金を回収する.wsd",
+                       "./アクティビティ図_ユースケース/販売商品を変更する.wsd",
+                    ]
+
+statemachine = ["./ステートマシン図/自動販売機_メイン.wsd",
+                "./ステートマシン図/自動販売機_メンテナンスモード.wsd",
+                "./ステートマシン図/自動販売機_管理モード.wsd",
+                "./ステートマシン図/自動販売機_故障中.wsd"]
+
+activity_function = ["./アクティビティ図_機能/お金投入を監視する.wsd",
+                    "./アクティビティ図_機能/合計投入金額を表示する.wsd",
+                    "./アクティビティ図_機能/商品ボタン押下を監視する.wsd",
+                    "./アクティビティ図_機能/商品一覧を表示する.wsd",
+                    "./アクティビティ図_機能/商品在庫を確認する.wsd",
+                    "./アクティビティ図_機能/投入金または釣銭を返金する.wsd",
+                    "./アクティビティ図_機能/購入可能な商品ボタンを選択可能にする.wsd",
+                    "./アクティビティ図_機能/購入商品を払いだす.wsd",
+                    "./アクティビティ図_機能/釣銭を確認する.wsd",
+                    "./アクティビティ図_機能/釣銭有無を表示する.wsd"]
+
+sequence = ["./シミュレーション_機能/自動販売機.wsd",]
+
+request = ["./要求図/要求図_要素.md",]
+
+system = ["./システム構成図/自動販売機_システム構成図.wsd",]
+
+glossary = ["./用語集/用語集.md"]
+
+fmea = ["./リスク評価/FMEA.md"]
+
+fta = ["./リスク評価/FTA_商品が出ない_誤表示.wsd",
+       "./リスク評価/FTA_釣銭不足_返金不可.wsd",
+       "./リスク評価/FTA_投入不可_金額誤認識.wsd"
+       ]
+
+# ファイルグループ名 → ファイルのリスト（CHECKSのgroupsで参照する）
+FILE_GROUPS = {
+    "usecase": usecase,
+    "usecase_description": usecase_description,
+    "activiry_usecase": activiry_usecase,
+    "statemachine": statemachine,
+    "activity_function": activity_function,
+    "sequence": sequence,
+    "request": request,
+    "system": system,
+    "glossary": glossary,
+    "fmea": fmea,
+    "fta": fta,
+}
+
+
+def _check(name, *groups, runner=None, send_files=True):
+    """
+    検証項目の定義（プロンプトは ./プロンプト/<検証項目>.txt）。
+    runnerを指定した項目は生成AIを使わず、その名前のローカルの検証（プロンプト不要）で実行する。
+    send_files=False の項目は検証対象ファイルを生成AIに送らず（変更の検知にだけ使う）、
+    プロンプトに追記した事前チェックの結果だけを検証させる。
+    """
+    return {"name": name, "prompt": name + ".txt", "groups": list(groups), "runner": runner, "send_files": send_files}
+
+
+# --- 検証項目の定義（画面の選択肢の順。シーケンス図のシミュレーションは検証対象ファイルなし） ---
+CHECKS = [
+    _check("図妥当性チェック ユースケース図", "usecase"),
+    # 要求図の全体ではなく、類似度で絞り込んだ要求の組（事前チェックの結果）だけをAIに判定させる
+    _check("図妥当性チェック 要求の重複_矛盾", "request", send_files=False),
+    _check("図間整合性チェック 要求図とユースケース図", "request", "usecase"),
+    _check("図面間整合チェック ユースケース図とユースケース記述", "usecase", "usecase_description"),
+    _check("図間整合性チェック ユースケース記述内のフローとアクティビティ図（ユースケース）",
+           "usecase_description", "activiry_usecase"),
+    _check("図間整合性チェック アクティビティ図（ユースケース）とステートマシン図",
+           "usecase_description", "activiry_usecase", "statemachine"),
+    _check("図間整合性チェック ステートマシン図と関連ドキュメント",
+           "statemachine", "usecase_description", "activity_function"),
+    _check("図間整合性チェック システム構成図とシーケンス図", "system", "sequence"),
+    _check("図間整合性チェック 用語_ID整合性チェック",
+           "request", "usecase", "usecase_description", "system", "statemachine", "glossary"),
+    _check("網羅性チェック 要求カバレッジ", "request", "usecase"),
+    _check("網羅性チェック フローカバレッジ", "usecase_description", "activiry_usecase"),
+    _check("網羅性チェック 状態_遷移カバレッジ", "statemachine"),
+    _check("網羅性チェック リスク対応カバレッジ", "fmea", "fta", "usecase_description", "statemachine"),
+    _check("シミュレーションベースの検証 シーケンス図の妥当性検証 (シナリオ生成とシミュレーション実行)"),
+    _check("シミュレーションベースの検証 ステートマシン図の動的検証 (イベントシーケンス生成と動的解析)",
+           "statemachine", runner="state_machine_simulation"),
+]
+
+CHECKS_BY_NAME = {check["name"]: check for check in CHECKS}
+
+
+def check_files(name):
+    """検証項目の検証対象ファイル（ファイルグループを定義順に連結したもの）"""
+    check = CHECKS_BY_NAME.get(name)
+    if check is None:
+        return []
+    return [path for group in check["groups"] for path in FILE_GROUPS[group]]
+
+
+# 検証項目 → 検証対象ファイル（検証対象ファイルのある項目のみ）
+CHECK_FILES = {check["name"]: check_files(check["name"]) for check in CHECKS if check["groups"]}
+
+
+def _normalize(path):
+    return os.path.normpath(path)
+
+
+def prompt_path(choice):
+    """検証項目のプロンプトファイルのパス"""
+    check = CHECKS_BY_NAME.get(choice)
+    return os.path.join(PROMPT_DIR, check["prompt"] if check else choice + ".txt")
+
+
+def checks_for_files(paths):
+    """
+    変更されたファイルを検証対象またはプロンプトに含む検証項目を返します。
+    生ファイルの代わりに送る抽出結果のMarkdown（context_packer.STRUCTURED_OUTPUTS）の変更も対象とします。
+
+    Args:
+        paths (iterable): 変更されたファイルのパス。
+
+    Returns:
+        list: 該当する検証項目（CHECK_FILESの順）。
+    """
+    changed = {_normalize(path) for path in paths}
+    return [choice for choice, files in CHECK_FILES.items()
+            if _normalize(prompt_path(choice)) in changed
+            or any(_normalize(file_name) in changed or _normalize(structured_candidate(file_name) or file_name) in changed
+                   for file_name in files)]
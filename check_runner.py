@@ -0,0 +1,366 @@
+import asyncio
+import os
+import random
+import time
+
+import context_packer
+import file_cache
+import instrumentation
+from check_registry import prompt_path
+import response_cache
+
+MODEL = "gpt-4.1"
+TEMPERATURE = 0.1
+MAX_TOKENS = 10000
+# TPMの制限で予約する応答のトークン数（見積もり）。受信後に実際の量との差を精算する
+EXPECTED_COMPLETION_TOKENS = 2000
+SYSTEM_PROMPT = "あなたはMBSE仕様ドキュメントの整合性検証を支援するAIです。"
+
+RESULT_DIR = "./検証結果"
+
+# 検証を中断したときに検証結果ファイルの末尾に付ける注記
+CANCELLED_NOTE = "\n\n---\n※ 検証を中断しました（ここまでは途中の結果です）\n"
+
+# 再試行の対象とするHTTPステータス（レート制限とサーバーエラー）
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# コンテキストが上限を超えて分割したときに、各分割（map）と統合（reduce）のプロンプトに付ける指示
+MAP_INSTRUCTION = ("※ 検証対象ドキュメントが多いため、{total}分割したうちの{index}番目のみを示します。"
+                   "このドキュメント群から判断できる指摘だけを挙げてください。"
+                   "他の分割に含まれる可能性がある要素の欠落は「未確認」として挙げてください。")
+REDUCE_INSTRUCTION = ("以下は同じ検証を{total}分割したドキュメント群ごとに実行した部分結果です。"
+                      "上記の検証指示に従い、部分結果を統合して1つの検証結果にまとめてください。"
+                      "重複する指摘は1つにまとめ、ある分割で「未確認」とされた要素が"
+                      "他の分割で確認できている場合は指摘から除いてください。")
+
+
+def load_prompt(choice, root_dir='.'):
+    """検証項目のプロンプトを読み出す（ファイルがなければNone）"""
+    prompt_file = os.path.join(root_dir, prompt_path(choice))
+    try:
+        # 画面の再実行のたびに読み直さないよう、変更のないファイルは前回の内容を使う
+        return file_cache.read_text(prompt_file)
+    except FileNotFoundError:
+        return None
+
+
+def build_prompt(txt_content, context):
+    return f"{txt_content}\n\n---\n\n{context}"
+
+
+def build_map_prompt(txt_content, context, index, total):
+    return build_prompt(f"{txt_content}\n\n{MAP_INSTRUCTION.format(index=index, total=total)}", context)
+
+
+def build_reduce_prompt(txt_content, partial_results):
+    partials = ''.join(f"\n### 部分結果 {i}/{len(partial_results)}\n{result}\n"
+                       for i, result in enumerate(partial_results, 1))
+    return build_prompt(f"{txt_content}\n\n{REDUCE_INSTRUCTION.format(total=len(partial_results))}", partials)
+
+
+def plan_check(txt_content, files, budget=context_packer.DEFAULT_CONTEXT_BUDGET, root_dir='.'):
+    """
+    検証1件のコンテキストを上限トークン数に収まるよう分割します。
+
+    Returns:
+        tuple: (contexts, missing) のタプル。contextsが2つ以上なら map-reduce で検証する。
+    """
+    documents, missing = context_packer.load_documents(files, root_dir)
+    # プロンプト本文と分割の指示の分を差し引いた残りをドキュメントに使う
+    overhead = context_packer.count_tokens(build_map_prompt(txt_content, "", 99, 99))
+    contexts = context_packer.pack_documents(documents, max(1000, budget - overhead))
+    return contexts, missing
+
+
+def build_messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def check_cache_key(prompt_text, files, budget=context_packer.DEFAULT_CONTEXT_BUDGET, root_dir='.'):
+    """検証1件の応答キャッシュのキー（モデル・温度・プロンプト・各コンテキストファイルの内容ハッシュ）"""
+    files = [context_packer.structured_path(path, root_dir) for path in files]
+    return response_cache.cache_key(MODEL, TEMPERATURE, MAX_TOKENS, SYSTEM_PROMPT, prompt_text, files,
+                                    root_dir, context_budget=budget)
+
+
+def result_path(choice, root_dir='.'):
+    """検証結果の保存先 <root_dir>/検証結果/<検証項目>_検証結果.txt（ディレクトリは作成する）"""
+    result_dir = os.path.join(root_dir, RESULT_DIR) if root_dir != '.' else RESULT_DIR
+    os.makedirs(result_dir, exist_ok=True)
+    return os.path.join(result_dir, f"{choice}_検証結果.txt")
+
+
+def save_result(choice, result, root_dir='.'):
+    """検証結果を保存し、保存先を返す"""
+    result_file = result_path(choice, root_dir)
+    with open(result_file, "w", encoding="utf-8") as f:
+        f.write(result)
+    return result_file
+
+
+class CheckCancelled(Exception):
+    """検証が中断されたことを示す例外"""
+
+
+class ResultWriter:
+    """
+    ストリーミングで受信した検証結果を検証結果ファイルに追記します。
+    最初の差分を受け取るまではファイルを開かない（エラー時に前回の結果を消さない）。
+    """
+
+    def __init__(self, choice, root_dir='.'):
+        self.choice = choice
+        self.root_dir = root_dir
+        self.path = None
+        self._file = None
+
+    def write(self, text):
+        if self._file is None:
+            self.path = result_path(self.choice, self.root_dir)
+            self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write(text)
+        self._file.flush()
+
+    def close(self, note=None):
+        if self._file is None:
+            return
+        if note:
+            self._file.write(note)
+        self._file.close()
+        self._file = None
+
+
+class TokenRateLimiter:
+    """
+    1分あたりのトークン数（TPM）を制限するトークンバケット。
+    要求の前に見積もりのトークン数を予約し、応答を受け取ったらsettleで実際の量との差を精算します。
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        # 1回の要求が上限を超える場合は、上限まで溜まった時点で通す
+        tokens = min(tokens, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                await asyncio.sleep((tokens - self.available) / self.rate)
+
+    def settle(self, reserved, used):
+        """予約したトークン数と実際に使った量の差を精算する（余りは返し、超過分は以降の要求で待つ）"""
+        self.available = min(self.capacity, self.available + reserved - used)
+
+
+def _retry_delay(error, attempt, base_delay):
+    """Retry-Afterヘッダーがあれば従い、なければ指数バックオフ（ジッター付き）"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return min(60.0, base_delay * (2 ** attempt)) + random.uniform(0, base_delay)
+
+
+async def _stream_content(response, on_delta=None, output=None, cancel=None):
+    """
+    ストリーミング応答を受け取りながら、差分を通知・ファイルに追記して本文を返します。
+    中断されたときや途中で例外が起きたときも、接続は必ず閉じます（以降のトークン生成を止める）。
+    受信の途中で接続が切れた場合などは例外（openai.APIConnectionErrorなど）をそのまま送出します。
+    """
+    parts = []
+    try:
+        async for chunk in response:
+            if cancel is not None and cancel.is_set():
+                raise CheckCancelled()
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            parts.append(delta)
+            if output is not None:
+                output.write(delta)
+            if on_delta:
+                on_delta(delta)
+    finally:
+        await response.close()
+    return ''.join(parts)
+
+
+def _is_retryable(error):
+    # openaiの読み込みは重いため、エラーの判定が必要になるまで遅らせる（クライアントの作成時に読み込み済み）
+    import openai
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRY_STATUS_CODES
+
+
+async def run_checks(client, jobs, concurrency=4, tokens_per_minute=30000,
+                     max_retries=5, base_delay=1.0, on_progress=None, cache=None, force=False,
+                     context_budget=context_packer.DEFAULT_CONTEXT_BUDGET, root_dir='.',
+                     semaphore=None, limiter=None, stream=True, on_delta=None, cancel=None):
+    """
+    複数の検証を非同期クライアントで並列に実行し、結果を保存します。
+    コンテキストが上限トークン数を超える検証は、分割ごとに並列に検証（map）してから
+    部分結果を統合（reduce）します。
+    ストリーミング時は、最終結果（分割なしの検証または統合）を受信しながら検証結果ファイルに追記します。
+
+    Args:
+        client (openai.AsyncOpenAI): 非同期クライアント（再試行はこの関数で行うため max_retries=0 を推奨）。
+        jobs (list): (choice, prompt_text, files) のタプルのリスト。prompt_textは ./プロンプト/ の本文。
+        concurrency (int): 同時に実行するAPI呼び出しの上限。
+        tokens_per_minute (int): 1分あたりのトークン数の上限。プロンプト＋応答の見積もり
+            （EXPECTED_COMPLETION_TOKENS）を予約し、応答の受信後に実際のトークン数で精算する。
+        max_retries (int): 429/5xx・接続エラー時の再試行回数。再試行もTPMの予約の対象とし、
+            待つ間は同時実行の枠を空ける。ストリーミングの受信途中のエラーは、
+            まだ差分を通知・ファイルに書いていなければ再試行し、書いた後なら再試行せずにエラーとする
+            （同じ内容を二重に渡さないため。途中までの結果は注記を付けて検証結果ファイルに残る）。
+        base_delay (float): バックオフの基準秒数。
+        on_progress (callable): on_progress(choice, status, detail) の形で進捗を通知する関数。
+        cache (ResponseCache): 応答キャッシュ。入力が前回と同じ検証はAPIを呼ばずに結果を返す。
+        force (bool): Trueならキャッシュを参照せずに再実行する（結果はキャッシュに保存する）。
+        context_budget (int): 1回のAPI呼び出しに載せるトークン数の上限。
+        root_dir (str): 検証対象ファイル（jobsのfilesは相対パス）と検証結果の基準ディレクトリ。
+        semaphore (asyncio.Semaphore): 複数の呼び出しで共有する同時実行数の制限（省略時はconcurrencyから作る）。
+        limiter (TokenRateLimiter): 複数の呼び出しで共有するTPM制限（省略時はtokens_per_minuteから作る）。
+        stream (bool): 応答をストリーミングで受け取るか。
+        on_delta (callable): on_delta(choice, text) の形で最終結果の受信差分を通知する関数。
+        cancel (threading.Event): is_set() がTrueになったら実行中の検証を中断する（途中の結果は保存する）。
+
+    Returns:
+        dict: choice をキーとする {'result', 'error', 'result_file', 'cached', 'chunks', 'missing', 'cancelled'} の辞書。
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(concurrency)
+    if limiter is None:
+        limiter = TokenRateLimiter(tokens_per_minute)
+
+    def notify(choice, status, detail=None):
+        if on_progress:
+            on_progress(choice, status, detail)
+
+    # 中断・エラー時に途中の結果を書いた検証結果ファイル
+    outcome_files = {}
+
+    def check_cancel():
+        if cancel is not None and cancel.is_set():
+            raise CheckCancelled()
+
+    async def complete(choice, prompt, label, output=None):
+        prompt_tokens = context_packer.count_tokens(prompt)
+        # max_tokensの分まで予約すると実際の応答よりずっと多く待つため、見積もりで予約して受信後に精算する
+        reserved = prompt_tokens + EXPECTED_COMPLETION_TOKENS
+        for attempt in range(max_retries + 1):
+            retry_error = None
+            async with semaphore:
+                check_cancel()
+                # 再試行でもプロンプト全体を送り直すため、試行ごとに予約する
+                with instrumentation.span('llm.rate_limit', check=choice):
+                    await limiter.acquire(reserved)
+                check_cancel()
+                notify(choice, label if attempt == 0 else f"{label} 再試行中 ({attempt}/{max_retries})")
+                instrumentation.count('llm.requests')
+                instrumentation.count('llm.tokens_sent', prompt_tokens)
+                # 応答の受信（ストリーミングでは最後の差分まで）を含めてAPIの所要時間とする
+                with instrumentation.span('llm.request', check=choice, label=label, attempt=attempt) as request:
+                    try:
+                        response = await client.chat.completions.create(
+                            model=MODEL,
+                            messages=build_messages(prompt),
+                            temperature=TEMPERATURE,
+                            max_tokens=MAX_TOKENS,
+                            stream=stream
+                        )
+                        if not stream:
+                            content = response.choices[0].message.content
+                        else:
+                            delta_handler = (lambda text: on_delta(choice, text)) if on_delta and output is not None else None
+                            content = await _stream_content(response, delta_handler, output, cancel)
+                    except Exception as e:
+                        # 受信の途中で失敗しても、差分をまだ書いていなければ最初からやり直せる
+                        delivered = output is not None and output.path is not None
+                        if delivered or not (attempt < max_retries and _is_retryable(e)):
+                            raise
+                        request.set(retry=type(e).__name__)
+                        retry_error = e
+                if retry_error is None:
+                    completion_tokens = context_packer.count_tokens(content or '')
+                    limiter.settle(EXPECTED_COMPLETION_TOKENS, completion_tokens)
+                    instrumentation.count('llm.tokens_received', completion_tokens)
+                    return content
+                # 失敗した試行では応答を受け取っていないため、応答の見積もり分だけ返す
+                limiter.settle(EXPECTED_COMPLETION_TOKENS, 0)
+            # 再試行を待つ間は同時実行の枠を空け、他の検証を先に進める
+            instrumentation.count('llm.retries')
+            await asyncio.sleep(_retry_delay(retry_error, attempt, base_delay))
+
+    async def complete_final(choice, prompt, label):
+        """最終結果の呼び出し。受信しながら検証結果ファイルに書き、中断時は注記を付けて残す"""
+        if not stream:
+            return await complete(choice, prompt, label)
+        output = ResultWriter(choice, root_dir)
+        try:
+            result = await complete(choice, prompt, label, output)
+        except BaseException:
+            # 中断（画面の中止・Ctrl-Cを含む）やエラーでも、途中までの結果が分かるようにする
+            output.close(CANCELLED_NOTE)
+            outcome_files[choice] = output.path
+            raise
+        output.close()
+        return result
+
+    async def run_one(choice, prompt_text, files):
+        outcome = {'result': None, 'error': None, 'result_file': None, 'cached': False, 'chunks': 0, 'missing': [],
+                   'cancelled': False}
+        key = check_cache_key(prompt_text, files, context_budget, root_dir)
+        if cache is not None and not force:
+            result = cache.get(key)
+            if result is not None:
+                instrumentation.count('llm.cache_hits')
+                outcome.update(result=result, result_file=save_result(choice, result, root_dir), cached=True)
+                notify(choice, "完了（キャッシュ）", outcome['result_file'])
+                return choice, outcome
+
+        notify(choice, "待機中")
+        contexts, outcome['missing'] = plan_check(prompt_text, files, context_budget, root_dir)
+        outcome['chunks'] = len(contexts)
+        try:
+            if len(contexts) == 1:
+                result = await complete_final(choice, build_prompt(prompt_text, contexts[0]), "実行中")
+            else:
+                total = len(contexts)
+                partial_results = await asyncio.gather(*(
+                    complete(choice, build_map_prompt(prompt_text, context, i, total), f"分割検証中 ({total}分割)")
+                    for i, context in enumerate(contexts, 1)))
+                result = await complete_final(choice, build_reduce_prompt(prompt_text, partial_results), "統合中")
+        except CheckCancelled:
+            outcome.update(error="中断しました", cancelled=True, result_file=outcome_files.get(choice))
+            notify(choice, "中断", outcome['result_file'])
+            return choice, outcome
+        except Exception as e:
+            outcome.update(error=str(e), result_file=outcome_files.get(choice))
+            notify(choice, "エラー", str(e))
+            return choice, outcome
+
+        if cache is not None:
+            cache.put(key, result, check=choice, model=MODEL)
+        outcome.update(result=result, result_file=save_result(choice, result, root_dir))
+        notify(choice, "完了", outcome['result_file'])
+        return choice, outcome
+
+    outcomes = await asyncio.gather(*(run_one(choice, prompt_text, files) for choice, prompt_text, files in jobs))
+    return dict(outcomes)
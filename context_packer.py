@@ -0,0 +1,158 @@
+import os
+import re
+
+import file_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 1回のAPI呼び出しに載せるコンテキストの上限トークン数（プロンプト本文を含む）
+DEFAULT_CONTEXT_BUDGET = 60000
+
+# tiktokenがあればgpt-4.1と同じ符号化で数える
+_ENCODING_NAME = 'o200k_base'
+_encoding = None
+
+# 生のPlantUMLの代わりに使う抽出スクリプトの出力（EAのXMIから生成したMarkdown）
+# 生ファイルのディレクトリ → (抽出結果のディレクトリ, ファイル名の接尾辞)
+STRUCTURED_OUTPUTS = {
+    './アクティビティ図_ユースケース/': ('./ユースケース記述/', '_アクティビティ図.md'),
+}
+
+# PlantUMLのうち検証に関係しない行（コメント・開始/終了・見た目の設定）
+_WSD_NOISE = re.compile(r"^\s*(?:'.*|@startuml.*|@enduml|skinparam\b.*|!theme\b.*|hide\b.*|left to right direction|top to bottom direction)\s*$")
+
+
+def count_tokens(text):
+    """
+    トークン数を数えます。tiktokenがなければ概算（UTF-8のバイト数/3）を返します。
+    日本語は1文字あたり約1トークン、英数字は過大に見積もる側に倒れます。
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding(_ENCODING_NAME)
+        return len(_encoding.encode(text))
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+def structured_candidate(path):
+    """生ファイルに対応する抽出結果のMarkdownのパス（対応するものがなければNone。存在は確認しない）"""
+    for raw_dir, (output_dir, suffix) in STRUCTURED_OUTPUTS.items():
+        if path.startswith(raw_dir):
+            stem = os.path.splitext(path[len(raw_dir):])[0]
+            return output_dir + stem + suffix
+    return None
+
+
+def structured_path(path, root_dir='.'):
+    """
+    生ファイルに対応する抽出結果のMarkdownがあればそのパスを、なければ元のパスを返す。
+    pathはモデルのルート（root_dir）からの相対パス。
+    """
+    candidate = structured_candidate(path)
+    if candidate and os.path.exists(os.path.join(root_dir, candidate)):
+        return candidate
+    return path
+
+
+def compact_text(path, text):
+    """
+    検証に関係しない部分を除いてトークン数を減らします。
+    PlantUMLはコメント・見た目の設定・空行を、Markdownは行末の空白と連続する空行を除きます。
+    """
+    lines = [line.rstrip() for line in text.splitlines()]
+    if path.endswith(('.wsd', '.puml', '.pu')):
+        lines = [line for line in lines if line and not _WSD_NOISE.match(line)]
+    compacted = []
+    for line in lines:
+        if not line and (not compacted or not compacted[-1]):
+            continue
+        compacted.append(line)
+    return '\n'.join(compacted).strip('\n')
+
+
+def format_document(name, content):
+    return f"\n### ドキュメント: {name}\n{content}\n"
+
+
+def _read_compacted(path, full_path):
+    with open(full_path, 'r', encoding='utf-8') as f:
+        return compact_text(path, f.read())
+
+
+def load_documents(files, root_dir='.'):
+    """
+    検証対象ファイルを読み込み、抽出結果への置き換えと圧縮を行います。
+    ファイルはroot_dirからの相対パスで指定し、ドキュメント名にも相対パスを使います。
+
+    Returns:
+        tuple: (documents, missing) のタプル。
+               documentsは(ファイル名, 本文)のリスト、missingは存在しなかったファイルのリスト。
+    """
+    documents = []
+    missing = []
+    for file_name in files:
+        path = structured_path(file_name, root_dir)
+        full_path = os.path.join(root_dir, path)
+        if not os.path.exists(full_path):
+            missing.append(file_name)
+            continue
+        # 圧縮した本文はファイルが変わるまで使い回す
+        content = file_cache.cached(('document', os.path.abspath(full_path)), (full_path,),
+                                    lambda: _read_compacted(path, full_path))
+        documents.append((path, content))
+    return documents, missing
+
+
+def _split_document(name, content, budget):
+    """上限を超える1つのドキュメントを行単位で分割する"""
+    parts = []
+    current = []
+    current_tokens = 0
+    for line in content.split('\n'):
+        line_tokens = count_tokens(line) + 1
+        if current and current_tokens + line_tokens > budget:
+            parts.append('\n'.join(current))
+            current = []
+            current_tokens = 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        parts.append('\n'.join(current))
+    return [(f"{name}（{i}/{len(parts)}）", part) for i, part in enumerate(parts, 1)]
+
+
+def pack_documents(documents, budget):
+    """
+    ドキュメントを上限トークン数以内のコンテキストに詰めます。
+    ドキュメントの順序は保ち、1つのドキュメントが上限を超える場合だけ行単位で分割します。
+
+    Args:
+        documents (list): load_documents が返す(ファイル名, 本文)のリスト。
+        budget (int): 1つのコンテキストの上限トークン数。
+
+    Returns:
+        list: コンテキスト文字列のリスト（ドキュメントがなければ空文字列1つ）。
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for name, content in documents:
+        part = format_document(name, content)
+        tokens = count_tokens(part)
+        pieces = [(part, tokens)]
+        if tokens > budget:
+            pieces = [(format_document(n, c), count_tokens(format_document(n, c)))
+                      for n, c in _split_document(name, content, budget - count_tokens(format_document(name, '')))]
+        for piece, piece_tokens in pieces:
+            if current and current_tokens + piece_tokens > budget:
+                chunks.append(''.join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    chunks.append(''.join(current))
+    return chunks
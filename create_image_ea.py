@@ -2,6 +2,8 @@ import win32com.client
 import os
 import time
 
+import instrumentation
+
 
 def ensure_directory(path):
     """指定されたディレクトリが存在しない場合は作成する"""
@@ -11,7 +13,10 @@ def ensure_directory(path):
 def export_diagram(diagram, output_path):
     """ダイアグラムをPNG形式で保存する"""
     try:
-        diagram.SaveImagePage(1, 1, 0, 0, output_path, 1)
+        # EAの画像出力はCOM呼び出しの往復を含むため、図ごとの所要時間を計測する（環境変数EA_TRACE）
+        with instrumentation.span('ea.export_diagram', diagram=diagram.Name):
+            diagram.SaveImagePage(1, 1, 0, 0, output_path, 1)
+        instrumentation.count('ea.diagrams')
         print(f"Exported: {diagram.Name} -> {output_path}")
     except Exception as e:
         print(f"  エラー: {e}")
@@ -32,7 +37,8 @@ def export_diagrams_from_ea(ea_file_path):
     """EAファイルからダイアグラムをPNG形式で出力する"""
     ea_app = win32com.client.Dispatch("EA.App")
     repository = ea_app.Repository
-    repository.OpenFile(ea_file_path)
+    with instrumentation.span('ea.open_file'):
+        repository.OpenFile(ea_file_path)
 
     try:
         for root_package in repository.Models:
@@ -0,0 +1,480 @@
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+import instrumentation
+from extraction_cache import DEFAULT_CACHE_FILE, ExtractionCache, write_text_atomic
+from qea_repository import QeaRepository
+
+# 描画処理を変えたら上げる（前回の画像を再生成させる）
+RENDERER_VERSION = '1'
+
+FORMATS = ('svg', 'png')
+FONT_SIZE = 11
+FONT_FAMILY = "Meiryo, 'Hiragino Sans', 'Noto Sans CJK JP', 'IPAexGothic', sans-serif"
+# PNGの描画に使う日本語フォントの候補（見つからなければPillowの既定のフォント）
+FONT_CANDIDATES = (
+    'C:/Windows/Fonts/meiryo.ttc',
+    'C:/Windows/Fonts/msgothic.ttc',
+    '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/fonts-japanese-gothic.ttf',
+    '/usr/share/fonts/opentype/ipaexfont-gothic/ipaexg.ttf',
+)
+MARGIN = 20
+
+STROKE = '#333333'
+FILLS = {
+    'UseCase': '#fffde7',
+    'Requirement': '#fff3e0',
+    'Class': '#e3f2fd',
+    'Action': '#e8f5e9',
+    'Activity': '#e8f5e9',
+    'ActivityPartition': 'none',
+    'Boundary': 'none',
+    'Package': '#fafafa',
+}
+
+# 関連の種別 → (破線か, 終点の矢印)
+_LINK_STYLES = {
+    'ControlFlow': (False, 'arrow'),
+    'ObjectFlow': (False, 'arrow'),
+    'StateFlow': (False, 'arrow'),
+    'Dependency': (True, 'open'),
+    'Abstraction': (True, 'open'),
+    'Realisation': (True, 'triangle'),
+    'Generalization': (False, 'triangle'),
+    'Nesting': (False, 'nesting'),
+    'Association': (False, None),
+}
+
+
+def text_width(text):
+    """文字列の描画幅の概算（全角は1文字、半角は0.6文字分）"""
+    return sum(FONT_SIZE if ord(ch) > 0x2000 else FONT_SIZE * 0.6 for ch in text)
+
+
+def wrap_text(text, width):
+    """文字列を描画幅に収まるよう1文字単位で折り返す"""
+    lines = []
+    for paragraph in (text or '').splitlines() or ['']:
+        line = ''
+        for ch in paragraph:
+            if line and text_width(line + ch) > width:
+                lines.append(line)
+                line = ''
+            line += ch
+        lines.append(line)
+    return lines
+
+
+def _text_lines(lines, cx, top, bold=False):
+    """上端topから中央揃えで並べる行のテキスト"""
+    height = FONT_SIZE + 3
+    return [('text', cx, top + height * (i + 0.5), line, 'middle', bold) for i, line in enumerate(lines)]
+
+
+def _centered_text(lines, cx, cy, bold=False):
+    height = FONT_SIZE + 3
+    return _text_lines(lines, cx, cy - height * len(lines) / 2, bold)
+
+
+def _node_shapes(obj, box):
+    """要素1つの描画要素（種別ごとの形とラベル）"""
+    x, y, w, h = box
+    cx, cy = x + w / 2, y + h / 2
+    kind = obj['type']
+    # 名前のないインスタンス（パーティションなど）は「:分類子名」と表示する
+    name = obj['name'] or (f":{obj['classifier']}" if obj['classifier'] else '')
+    fill = FILLS.get(kind, '#ffffff')
+    if kind == 'StateNode' and obj['ntype'] in (100, 101, 102):
+        label = [('text', cx, y + h + FONT_SIZE / 2 + 2, name, 'middle', False)] if name else []
+        if obj['ntype'] == 100:
+            return [('ellipse', cx, cy, w / 2, h / 2, STROKE)] + label
+        shapes = [('ellipse', cx, cy, w / 2, h / 2, '#ffffff')]
+        if obj['ntype'] == 101:
+            return shapes + [('ellipse', cx, cy, w / 2 - 4, h / 2 - 4, STROKE)] + label
+        d = w / 2 * 0.7
+        return shapes + [('line', [(cx - d, cy - d), (cx + d, cy + d)], False, None),
+                         ('line', [(cx - d, cy + d), (cx + d, cy - d)], False, None)] + label
+    if kind in ('Decision', 'MergeNode'):
+        shapes = [('polygon', [(cx, y), (x + w, cy), (cx, y + h), (x, cy)], '#ffffff')]
+        if name:
+            # 判断ノードの名前（条件の説明）は左上に添える
+            shapes += [('text', x, y - 4, name, 'end', False)]
+        return shapes
+    if kind == 'Actor':
+        head = min(w, h) / 5
+        shapes = [('ellipse', cx, y + head, head, head, '#ffffff'),
+                  ('line', [(cx, y + head * 2), (cx, y + h * 0.65)], False, None),
+                  ('line', [(x + w * 0.15, y + h * 0.4), (x + w * 0.85, y + h * 0.4)], False, None),
+                  ('line', [(x + w * 0.15, y + h), (cx, y + h * 0.65), (x + w * 0.85, y + h)], False, None)]
+        return shapes + _text_lines(wrap_text(name, max(w * 2, 80)), cx, y + h + 2)
+    if kind == 'UseCase':
+        return [('ellipse', cx, cy, w / 2, h / 2, fill)] + _centered_text(wrap_text(name, w * 0.75), cx, cy)
+    if kind in ('Boundary', 'ActivityPartition'):
+        shapes = [('rect', x, y, w, h, 0, fill)]
+        if kind == 'ActivityPartition':
+            shapes.append(('line', [(x, y + 22), (x + w, y + 22)], False, None))
+            return shapes + _text_lines(wrap_text(name, w - 8)[:1], cx, y + 4, True)
+        return shapes + [('text', x + 6, y + FONT_SIZE + 4, name, 'start', True)]
+    if kind == 'Package':
+        tab = min(w / 2, text_width(name) + 16)
+        return [('rect', x, y, tab, 18, 0, fill), ('rect', x, y + 18, w, h - 18, 0, fill),
+                ('text', x + 8, y + FONT_SIZE + 3, name, 'start', True)]
+    if kind == 'ActionPin':
+        return [('rect', x, y, w, h, 0, '#ffffff'), ('text', cx, y - 4, name, 'middle', False)]
+
+    radius = 10 if kind in ('Action', 'Activity') else 0
+    shapes = [('rect', x, y, w, h, radius, fill)]
+    lines = wrap_text(name, w - 10)
+    if obj['stereotype']:
+        shapes += _text_lines([f"«{obj['stereotype']}»"], cx, y + 4)
+        shapes += _text_lines(lines, cx, y + FONT_SIZE + 10, True)
+    else:
+        shapes += _centered_text(lines, cx, cy)
+    return shapes
+
+
+def _clip(box, inside, outside):
+    """矩形の中心側の点insideから外側の点outsideへの線分が矩形の枠と交わる点"""
+    x, y, w, h = box
+    dx, dy = outside[0] - inside[0], outside[1] - inside[1]
+    if dx == 0 and dy == 0:
+        return inside
+    scales = []
+    if dx:
+        scales += [((x + w if dx > 0 else x) - inside[0]) / dx]
+    if dy:
+        scales += [((y + h if dy > 0 else y) - inside[1]) / dy]
+    t = min(s for s in scales if s >= 0) if any(s >= 0 for s in scales) else 0
+    t = min(t, 1.0)
+    return inside[0] + dx * t, inside[1] + dy * t
+
+
+def _parse_path(path, to_canvas):
+    """t_diagramlinks.Path（"x:y;x:y;"）の折れ点を描画座標にする"""
+    points = []
+    for pair in (path or '').split(';'):
+        if ':' not in pair:
+            continue
+        try:
+            px, py = (int(value) for value in pair.split(':')[:2])
+        except ValueError:
+            continue
+        points.append(to_canvas(px, py))
+    return points
+
+
+def _link_shapes(link, boxes, to_canvas):
+    """関連1本の描画要素（折れ線・矢印・ラベル）"""
+    source, target = boxes.get(link['source']), boxes.get(link['target'])
+    if source is None or target is None:
+        return []
+    center = lambda b: (b[0] + b[2] / 2, b[1] + b[3] / 2)
+    bends = _parse_path(link['path'], to_canvas)
+    points = [center(source)] + bends + [center(target)]
+    if link['source'] == link['target'] and not bends:
+        # 自己遷移は右上に小さなループを描く
+        x, y, w, h = source
+        points = [(x + w, y + h * 0.3), (x + w + 20, y + h * 0.3), (x + w + 20, y - 15),
+                  (x + w * 0.7, y - 15), (x + w * 0.7, y)]
+    else:
+        points[0] = _clip(source, points[0], points[1])
+        points[-1] = _clip(target, points[-1], points[-2])
+    dashed, head = _LINK_STYLES.get(link['type'], (False, None))
+    shapes = [('line', points, dashed, head)]
+
+    label = f"«{link['stereotype']}»" if link['stereotype'] else (link['name'] or '')
+    if link['guard']:
+        label = f"{label} [{link['guard']}]".strip()
+    if label:
+        middle = len(points) // 2
+        (x1, y1), (x2, y2) = points[middle - 1], points[middle]
+        shapes.append(('text', (x1 + x2) / 2 + 4, (y1 + y2) / 2 - 4, label, 'start', False))
+    return shapes
+
+
+def layout_shapes(layout):
+    """
+    ダイアグラムの配置から描画要素のリストを作ります（SVGとPNGで共通）。
+
+    Returns:
+        tuple: (width, height, shapes) のタプル。座標は左上を原点とする描画座標。
+    """
+    objects = layout['objects']
+    if not objects:
+        return MARGIN * 2, MARGIN * 2, []
+    # EAの座標はyが上向き（図の上端が0、下へ行くほど負）
+    min_x = min(o['left'] for o in objects)
+    min_y = min(-o['top'] for o in objects)
+    max_x = max(o['right'] for o in objects)
+    max_y = max(-o['bottom'] for o in objects)
+    # 判断ノードやアクターのラベルが枠の外にはみ出す分の余白
+    offset_x, offset_y = MARGIN - min_x + 40, MARGIN - min_y + 20
+
+    def to_canvas(px, py):
+        return px + offset_x, -py + offset_y
+
+    boxes = {}
+    for o in objects:
+        x, y = to_canvas(o['left'], o['top'])
+        boxes[o['id']] = (x, y, o['right'] - o['left'], o['top'] - o['bottom'])
+
+    shapes = []
+    # 大きい要素（境界・パーティション・パッケージ）から描いて、小さい要素を上に重ねる
+    for o in sorted(objects, key=lambda o: -(boxes[o['id']][2] * boxes[o['id']][3])):
+        shapes += _node_shapes(o, boxes[o['id']])
+    for link in layout['links']:
+        shapes += _link_shapes(link, boxes, to_canvas)
+    width = max_x - min_x + MARGIN * 2 + 80
+    height = max_y - min_y + MARGIN * 2 + 60
+    return int(width), int(height), shapes
+
+
+def _arrow_head(points, head):
+    """終点の矢印の多角形（Noneなら矢印なし）"""
+    (x1, y1), (x2, y2) = points[-2], points[-1]
+    angle = math.atan2(y2 - y1, x2 - x1)
+    size = 10
+    left = (x2 - size * math.cos(angle - 0.45), y2 - size * math.sin(angle - 0.45))
+    right = (x2 - size * math.cos(angle + 0.45), y2 - size * math.sin(angle + 0.45))
+    if head == 'arrow':
+        return ('polygon', [(x2, y2), left, right], STROKE)
+    if head == 'triangle':
+        return ('polygon', [(x2, y2), left, right], '#ffffff')
+    if head == 'open':
+        return ('line', [left, (x2, y2), right], False, None)
+    if head == 'nesting':
+        return ('ellipse', x2 - 5 * math.cos(angle), y2 - 5 * math.sin(angle), 5, 5, '#ffffff')
+    return None
+
+
+def _svg_shape(shape):
+    """描画要素1つのSVG要素（矢印付きの線は2要素）"""
+    kind = shape[0]
+    if kind == 'rect':
+        _, x, y, w, h, radius, fill = shape
+        return [f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" rx="{radius}" '
+                f'fill="{fill}" stroke="{STROKE}"/>']
+    if kind == 'ellipse':
+        _, cx, cy, rx, ry, fill = shape
+        return [f'<ellipse cx="{cx:.1f}" cy="{cy:.1f}" rx="{rx:.1f}" ry="{ry:.1f}" fill="{fill}" stroke="{STROKE}"/>']
+    if kind == 'polygon':
+        _, points, fill = shape
+        return [f'<polygon points="{" ".join(f"{x:.1f},{y:.1f}" for x, y in points)}" '
+                f'fill="{fill}" stroke="{STROKE}"/>']
+    if kind == 'line':
+        _, points, dashed, head = shape
+        dash = ' stroke-dasharray="6,4"' if dashed else ''
+        lines = [f'<polyline points="{" ".join(f"{x:.1f},{y:.1f}" for x, y in points)}" '
+                 f'fill="none" stroke="{STROKE}"{dash}/>']
+        arrow = _arrow_head(points, head) if head else None
+        return lines + (_svg_shape(arrow) if arrow else [])
+    _, x, y, text, anchor, bold = shape
+    weight = ' font-weight="bold"' if bold else ''
+    return [f'<text x="{x:.1f}" y="{y:.1f}" text-anchor="{anchor}" '
+            f'dominant-baseline="middle"{weight}>{escape(text)}</text>']
+
+
+def to_svg(width, height, shapes):
+    """描画要素をSVG文字列にする"""
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+           f'viewBox="0 0 {width} {height}" font-family="{escape(FONT_FAMILY)}" font-size="{FONT_SIZE}">',
+           f'<rect width="{width}" height="{height}" fill="#ffffff"/>']
+    for shape in shapes:
+        out.extend(_svg_shape(shape))
+    out.append('</svg>')
+    return '\n'.join(out)
+
+
+def find_font(font_path=None):
+    """PNGの描画に使うフォントのパス（指定がなければ候補から探す。見つからなければNone）"""
+    if font_path:
+        return font_path
+    return next((path for path in FONT_CANDIDATES if os.path.exists(path)), None)
+
+
+def to_png(width, height, shapes, output_path, font_path=None):
+    """描画要素をPillowでPNGに描く"""
+    if Image is None:
+        raise RuntimeError("PNGの出力にはPillowが必要です（pip install pillow）")
+    image = Image.new('RGB', (width, height), '#ffffff')
+    draw = ImageDraw.Draw(image)
+    font_path = find_font(font_path)
+    # 太字は区別しない（フォントファイルが1つのため）
+    font = ImageFont.truetype(font_path, FONT_SIZE) if font_path else ImageFont.load_default()
+
+    def polyline(points, dashed):
+        if not dashed:
+            draw.line(points, fill=STROKE, width=1)
+            return
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            length = math.hypot(x2 - x1, y2 - y1)
+            for start in range(0, int(length), 10):
+                end = min(start + 6, length)
+                draw.line([(x1 + (x2 - x1) * start / length, y1 + (y2 - y1) * start / length),
+                           (x1 + (x2 - x1) * end / length, y1 + (y2 - y1) * end / length)], fill=STROKE)
+
+    def fill_color(fill):
+        return None if fill == 'none' else fill
+
+    for shape in shapes:
+        kind = shape[0]
+        if kind == 'rect':
+            _, x, y, w, h, radius, fill = shape
+            draw.rounded_rectangle([x, y, x + w, y + h], radius=radius, fill=fill_color(fill), outline=STROKE)
+        elif kind == 'ellipse':
+            _, cx, cy, rx, ry, fill = shape
+            draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], fill=fill_color(fill), outline=STROKE)
+        elif kind == 'polygon':
+            _, points, fill = shape
+            draw.polygon(points, fill=fill_color(fill), outline=STROKE)
+        elif kind == 'line':
+            _, points, dashed, head = shape
+            polyline(points, dashed)
+            arrow = _arrow_head(points, head) if head else None
+            if arrow and arrow[0] == 'line':
+                polyline(arrow[1], False)
+            elif arrow and arrow[0] == 'polygon':
+                draw.polygon(arrow[1], fill=arrow[2], outline=STROKE)
+            elif arrow:
+                _, cx, cy, rx, ry, fill = arrow
+                draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], fill=fill, outline=STROKE)
+        elif kind == 'text':
+            _, x, y, text, anchor, _ = shape
+            pil_anchor = {'start': 'lm', 'middle': 'mm', 'end': 'rm'}[anchor]
+            draw.text((x, y), text, fill=STROKE, font=font, anchor=pil_anchor)
+
+    tmp_path = f"{output_path}.tmp{os.getpid()}"
+    image.save(tmp_path, format='PNG')
+    os.replace(tmp_path, output_path)
+
+
+def diagram_image_path(diagram, output_dir, fmt):
+    """画像の出力先（create_image_ea.py と同じく <パッケージ名>/<ダイアグラム名>）"""
+    name = diagram['name'].replace(' ', '_')
+    return os.path.join(output_dir, diagram['package'] or '', f"{name}.{fmt}")
+
+
+def render_diagram(qea_path, diagram_id, output_paths, font_path=None):
+    """
+    ダイアグラム1つを描画して書き出します（ワーカープロセスで実行する）。
+
+    Args:
+        output_paths (dict): 形式（'svg' / 'png'）→ 出力先のパス。
+
+    Returns:
+        list: 書き出したファイルのパス。
+    """
+    span = instrumentation.span
+    with span('render.layout'), QeaRepository(qea_path) as repo:
+        layout = repo.diagram_layout(diagram_id)
+    with span('render.shapes'):
+        width, height, shapes = layout_shapes(layout)
+    instrumentation.count('render.shapes', len(shapes))
+    written = []
+    for fmt, output_path in output_paths.items():
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with span(f'render.{fmt}', file=output_path):
+            if fmt == 'svg':
+                write_text_atomic(output_path, to_svg(width, height, shapes))
+            else:
+                to_png(width, height, shapes, output_path, font_path)
+        written.append(output_path)
+    return written
+
+
+def render_diagrams(qea_path, output_dir='.', formats=('svg',), cache=None, force=False, jobs=None, font_path=None):
+    """
+    .qeaのすべてのダイアグラムを画像に描画します。
+    配置の行バージョンが前回の描画から変わっていないダイアグラムは省略し、
+    残りを複数のワーカープロセスで並列に描画します。
+
+    Args:
+        qea_path (str): .qeaファイルのパス。
+        output_dir (str): 画像の出力先ディレクトリ。
+        formats (tuple): 出力する形式（'svg', 'png'）。
+        cache (ExtractionCache): 描画済みの配置を記録するキャッシュ（呼び出し側で保存する）。
+        force (bool): Trueならキャッシュを無視してすべて描画する。
+        jobs (int): ワーカープロセス数（省略時はCPU数）。
+        font_path (str): PNGの描画に使うフォント。
+
+    Returns:
+        tuple: (written, skipped) のタプル。writtenは書き出したファイルのパスのリスト、skippedは省略した件数。
+    """
+    if cache is None:
+        cache = ExtractionCache()
+    pending = []
+    skipped = 0
+    with QeaRepository(qea_path) as repo:
+        for diagram in repo.diagrams():
+            layout = repo.diagram_layout(diagram['id'])
+            output_paths = {fmt: diagram_image_path(layout['diagram'], output_dir, fmt) for fmt in formats}
+            key = f"render{RENDERER_VERSION}:{repo.layout_version(diagram['id'], layout)}"
+            if not force and all(cache.is_fresh(path, key) for path in output_paths.values()):
+                skipped += 1
+                continue
+            pending.append((diagram, output_paths, key))
+
+    written = []
+    if len(pending) <= 1 or jobs == 1:
+        results = [render_diagram(qea_path, diagram['id'], output_paths, font_path)
+                   for diagram, output_paths, _ in pending]
+    else:
+        # 計測中はワーカーでも計測し、区間とカウンタを親に集める
+        trace = instrumentation.enabled()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = []
+            for paths, state in executor.map(instrumentation.worker_call, [trace] * len(pending),
+                                             [render_diagram] * len(pending), [qea_path] * len(pending),
+                                             [diagram['id'] for diagram, _, _ in pending],
+                                             [output_paths for _, output_paths, _ in pending],
+                                             [font_path] * len(pending)):
+                instrumentation.merge(state)
+                results.append(paths)
+    for (diagram, output_paths, key), paths in zip(pending, results):
+        for path in paths:
+            cache.record(path, key)
+            print(f"Exported: {diagram['name']} -> {path}")
+        written.extend(paths)
+    return written, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='.qeaの配置情報からダイアグラムの画像（SVG/PNG）を描画します（EA不要）')
+    parser.add_argument('qea_file', nargs='?', default='自動販売機.qea', help='.qeaファイルのパス')
+    parser.add_argument('-o', '--output-dir', default='.', help='画像の出力先ディレクトリ')
+    parser.add_argument('--format', action='append', choices=FORMATS, help='出力形式（複数指定可、省略時はsvg）')
+    parser.add_argument('-j', '--jobs', type=int, help='ワーカープロセス数（省略時はCPU数）')
+    parser.add_argument('--font', help='PNGの描画に使う日本語フォントのパス')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE, help='描画済みの配置を記録するキャッシュのファイル')
+    parser.add_argument('--force', action='store_true', help='キャッシュを無視してすべて描画する')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+
+    formats = tuple(dict.fromkeys(args.format or ['svg']))
+    if 'png' in formats and not find_font(args.font):
+        print("警告: 日本語フォントが見つかりません。--font で指定してください（PNGの日本語が表示されない場合があります）")
+
+    start_time = time.time()
+    with instrumentation.tracing(args.trace):
+        cache = ExtractionCache(args.cache_file)
+        _, skipped = render_diagrams(args.qea_file, args.output_dir, formats, cache, args.force, args.jobs, args.font)
+        cache.save()
+    elapsed = time.time() - start_time
+    print(f"変更なしで省略: {skipped}件")
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
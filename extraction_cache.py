@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+
+from model_extractors import EXTRACTOR_VERSION
+
+DEFAULT_CACHE_FILE = '.extract_cache.json'
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def write_text_atomic(path, text):
+    """一時ファイルに書き込んでから置き換え、途中まで書かれたファイルが残らないようにする"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class ExtractionCache:
+    """
+    XMI/.qea → Markdown 生成のための内容ハッシュ付きキャッシュ。
+
+    出力Markdownごとに、生成元のキー（抽出処理のバージョン＋入力の内容ハッシュ、
+    または.qeaの行バージョン）を記録します。記録済みのキーのいずれかが一致し、
+    出力が存在すれば再生成を省略します。
+    入力ファイルのハッシュはサイズと更新時刻が変わったときだけ計算し直します。
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE):
+        self.cache_file = cache_file
+        self.outputs = {}   # 出力パス → 生成元キーのリスト
+        self.files = {}     # 入力パス → {'size', 'mtime_ns', 'sha256'}
+        self.sources = {}   # 入力パス → {'key', 'outputs'}（入力1件から生成した出力の一覧）
+        self.dirty = False
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.outputs = data.get('outputs', {})
+            self.files = data.get('files', {})
+            self.sources = data.get('sources', {})
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def file_digest(self, path):
+        """ファイル内容のSHA-256を返す（サイズと更新時刻が前回と同じなら記録値を使う）"""
+        st = os.stat(path)
+        path = os.path.abspath(path)
+        entry = self.files.get(path)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return entry['sha256']
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self.files[path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+        self.dirty = True
+        return digest
+
+    def file_key(self, path):
+        """入力ファイルの生成元キー"""
+        return f"{EXTRACTOR_VERSION}:{self.file_digest(path)}"
+
+    def is_fresh(self, output_path, key):
+        """出力が存在し、前回と同じキーから生成されていればTrue"""
+        output_path = os.path.abspath(output_path)
+        return key in self.outputs.get(output_path, ()) and os.path.exists(output_path)
+
+    def record(self, output_path, *keys):
+        """出力を生成した入力のキーを記録する（ファイル全体のキーと行バージョンなど複数可）"""
+        self.outputs[os.path.abspath(output_path)] = list(keys)
+        self.dirty = True
+
+    def is_source_fresh(self, source_path, key):
+        """入力から前回生成した出力がすべて同じキーで最新ならTrue（出力のない入力も含む）"""
+        entry = self.sources.get(os.path.abspath(source_path))
+        if entry is None or entry['key'] != key:
+            return False
+        return all(self.is_fresh(path, key) for path in entry['outputs'])
+
+    def record_source(self, source_path, key, output_paths):
+        """入力1件から生成した出力をまとめて記録する"""
+        for path in output_paths:
+            self.record(path, key)
+        self.sources[os.path.abspath(source_path)] = {
+            'key': key, 'outputs': [os.path.abspath(path) for path in output_paths]}
+        self.dirty = True
+
+    def save(self):
+        if self.dirty:
+            write_text_atomic(self.cache_file, json.dumps(
+                {'outputs': self.outputs, 'files': self.files, 'sources': self.sources},
+                ensure_ascii=False, indent=1))
+            self.dirty = False
@@ -0,0 +1,58 @@
+import os
+import threading
+
+# プロセス内で共有するキャッシュ（画面の再実行・複数のセッションで使い回す）
+_lock = threading.Lock()
+_entries = {}   # キー → (ファイルの状態, 値)
+
+
+def file_stamp(path):
+    """ファイルの更新時刻とサイズ（存在しなければNone）"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def cached(key, paths, loader):
+    """
+    pathsのファイルの更新時刻とサイズが前回と同じなら、loaderを呼ばずに前回の値を返します。
+    ファイルが変わった（追加・削除を含む）ときだけloaderを呼び直します。
+    返す値は呼び出し元の間で共有されるため、変更しないでください。
+
+    Args:
+        key: キャッシュのキー（ハッシュ可能な値）。
+        paths (list): 値の元になるファイル・ディレクトリのパス。
+        loader (callable): 引数なしで値を作る関数。
+    """
+    stamp = tuple(file_stamp(path) for path in paths)
+    with _lock:
+        entry = _entries.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    value = loader()
+    with _lock:
+        _entries[key] = (stamp, value)
+    return value
+
+
+def _read(path, encoding):
+    with open(path, 'r', encoding=encoding) as f:
+        return f.read()
+
+
+def read_text(path, encoding='utf-8'):
+    """
+    テキストファイルを読み込みます（前回から変わっていなければ読み直さない）。
+
+    Raises:
+        FileNotFoundError: ファイルが存在しない場合。
+    """
+    path = os.path.abspath(path)
+    return cached(('text', path, encoding), (path,), lambda: _read(path, encoding))
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,373 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+# 検証履歴のデータベース（モデルのディレクトリ直下）
+DEFAULT_HISTORY_FILE = '.verification_history.sqlite3'
+
+SEVERITIES = ('error', 'warning', 'info')
+# AIが日本語で重大度を返したときの読み替え
+_SEVERITY_ALIASES = {'エラー': 'error', '重大': 'error', '高': 'error',
+                     '警告': 'warning', '中': 'warning',
+                     '情報': 'info', '低': 'info', '参考': 'info'}
+
+# 検証結果の末尾に構造化された指摘を付けさせる指示（プロンプトの末尾に追記する）
+FINDINGS_INSTRUCTION = """## 出力形式（構造化された指摘）
+検証結果の本文の最後に、すべての指摘を次の形式のJSONコードブロック（```json）で1つだけ出力してください。
+指摘がない場合は "findings" を空の配列にしてください。
+- severity: "error"（不整合・欠落）, "warning"（要確認）, "info"（改善提案）のいずれか
+- elements: 指摘の対象となる要素のID・名前（要求ID、ユースケース名、状態名など、ドキュメントに記載の表記）
+- message: 指摘の内容（1〜2文）
+```json
+{"findings": [{"severity": "error", "elements": ["R1"], "message": "要求R1を詳細化するユースケースがありません"}]}
+```"""
+
+_JSON_BLOCK = re.compile(r"```json\s*(.*?)```", re.S)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    check_name TEXT NOT NULL,
+    created REAL NOT NULL,
+    model TEXT,
+    status TEXT NOT NULL,
+    cached INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    parse_error TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_check ON runs (check_name, status, id);
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    check_name TEXT NOT NULL,
+    source TEXT NOT NULL,
+    rule TEXT,
+    severity TEXT NOT NULL,
+    message TEXT NOT NULL,
+    fingerprint TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS findings_run ON findings (run_id, fingerprint);
+CREATE TABLE IF NOT EXISTS finding_elements (
+    finding_id INTEGER NOT NULL REFERENCES findings (id),
+    element TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS finding_elements_element ON finding_elements (element, finding_id);
+CREATE INDEX IF NOT EXISTS finding_elements_finding ON finding_elements (finding_id);
+"""
+
+# 検証項目ごとの最新の正常な実行（構造化された指摘を取り出せた実行）
+_LATEST_RUNS = """
+SELECT MAX(id) FROM runs WHERE status = 'ok' {where} GROUP BY check_name
+"""
+
+
+def _normalize_severity(value):
+    value = str(value or '').strip()
+    if value.lower() in SEVERITIES:
+        return value.lower()
+    return _SEVERITY_ALIASES.get(value)
+
+
+def parse_findings(text):
+    """
+    検証結果の末尾のJSONコードブロックから指摘を取り出して検証します。
+
+    Returns:
+        tuple: (findings, error) のタプル。findingsは {'severity', 'elements', 'message'} のリスト。
+               JSONがない・壊れている場合はfindingsがNoneでerrorに理由が入る。
+               一部の指摘だけが不正な場合は、正しい指摘を返してerrorに件数を入れる。
+    """
+    blocks = _JSON_BLOCK.findall(text or '')
+    if not blocks:
+        return None, "構造化された指摘（JSONコードブロック）がありません"
+    try:
+        data = json.loads(blocks[-1])
+    except ValueError as e:
+        return None, f"JSONを解析できません: {e}"
+    items = data.get('findings') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None, "findings が配列ではありません"
+
+    findings = []
+    invalid = 0
+    for item in items:
+        if not isinstance(item, dict):
+            invalid += 1
+            continue
+        severity = _normalize_severity(item.get('severity'))
+        message = item.get('message')
+        elements = item.get('elements') or []
+        if isinstance(elements, str):
+            elements = [elements]
+        if severity is None or not isinstance(message, str) or not message.strip() or not isinstance(elements, list):
+            invalid += 1
+            continue
+        findings.append({'severity': severity,
+                         'elements': [str(element).strip() for element in elements if str(element).strip()],
+                         'message': message.strip()})
+    return findings, (f"不正な指摘を{invalid}件除外しました" if invalid else None)
+
+
+def fingerprint(check_name, source, finding):
+    """実行をまたいで同じ指摘を同一視するためのハッシュ（要素の順序と空白の違いは無視する）"""
+    material = [check_name, source, finding.get('rule') or '', sorted(finding['elements']),
+                re.sub(r'\s+', '', finding['message'])]
+    return hashlib.sha1(json.dumps(material, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class FindingStore:
+    """
+    検証の実行と構造化された指摘をSQLiteに保存し、実行間の差分や要素ごとの未解決の指摘を問い合わせます。
+    実行は上書きせずにすべて残します（検証結果ファイルは最新の1件のみ）。
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_FILE, check_same_thread=True):
+        # check_same_thread=Falseなら、開いたスレッド以外からも使える（同時に使わない場合に限る）
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def record_run(self, check_name, status, findings=(), rule_findings=(), result=None, model=None,
+                   cached=False, parse_error=None):
+        """
+        検証1件の実行を保存します。
+
+        Args:
+            check_name (str): 検証項目。
+            status (str): 'ok'（指摘を取り出せた）, 'invalid'（取り出せなかった）, 'error', 'cancelled'。
+            findings (list): AIの指摘（parse_findings の結果）。
+            rule_findings (list): ルールベースの事前チェックの指摘（'rule' を持つ）。
+            result (str): 検証結果の本文。
+
+        Returns:
+            int: 実行のID。
+        """
+        with self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (check_name, created, model, status, cached, result, parse_error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (check_name, time.time(), model, status, int(cached), result, parse_error)).lastrowid
+            for source, items in (('llm', findings), ('rule', rule_findings)):
+                for item in items:
+                    finding_id = self.conn.execute(
+                        "INSERT INTO findings (run_id, check_name, source, rule, severity, message, fingerprint) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (run_id, check_name, source, item.get('rule'), item['severity'], item['message'],
+                         fingerprint(check_name, source, item))).lastrowid
+                    self.conn.executemany("INSERT INTO finding_elements (finding_id, element) VALUES (?, ?)",
+                                          [(finding_id, element) for element in dict.fromkeys(item['elements'])])
+        return run_id
+
+    def runs(self, check_name=None, limit=20):
+        """実行の一覧（新しい順）"""
+        where, params = ("WHERE check_name = ?", [check_name]) if check_name else ("", [])
+        return [dict(row) for row in self.conn.execute(
+            f"SELECT id, check_name, created, model, status, cached, parse_error, "
+            f"(SELECT COUNT(*) FROM findings f WHERE f.run_id = runs.id) AS findings "
+            f"FROM runs {where} ORDER BY id DESC LIMIT ?", params + [limit])]
+
+    def latest_runs(self, check_name=None):
+        """検証項目ごとの最新の正常な実行のID"""
+        where, params = ("AND check_name = ?", [check_name]) if check_name else ("", [])
+        return [row[0] for row in self.conn.execute(_LATEST_RUNS.format(where=where), params)]
+
+    def previous_run(self, run_id):
+        """同じ検証項目の1つ前の正常な実行のID（なければNone）"""
+        row = self.conn.execute(
+            "SELECT MAX(id) FROM runs WHERE status = 'ok' AND id < ? "
+            "AND check_name = (SELECT check_name FROM runs WHERE id = ?)", (run_id, run_id)).fetchone()
+        return row[0]
+
+    def findings(self, run_ids):
+        """実行の指摘（要素のリストを含む）"""
+        run_ids = list(run_ids)
+        if not run_ids:
+            return []
+        placeholders = ','.join('?' * len(run_ids))
+        rows = self.conn.execute(
+            f"SELECT f.id, f.run_id, f.check_name, f.source, f.rule, f.severity, f.message, f.fingerprint, "
+            f"GROUP_CONCAT(e.element, char(31)) AS elements "
+            f"FROM findings f LEFT JOIN finding_elements e ON e.finding_id = f.id "
+            f"WHERE f.run_id IN ({placeholders}) GROUP BY f.id ORDER BY f.check_name, f.id", run_ids)
+        return [dict(row, elements=row['elements'].split('\x1f') if row['elements'] else []) for row in rows]
+
+    def _diff(self, check_name, newer):
+        """最新の実行と1つ前の実行の差分（newer=Trueなら新規、Falseなら解消した指摘）"""
+        results = []
+        for latest in self.latest_runs(check_name):
+            previous = self.previous_run(latest)
+            current_run, other_run = (latest, previous) if newer else (previous, latest)
+            if current_run is None:
+                continue
+            if other_run is None:
+                results += self.findings([current_run]) if newer else []
+                continue
+            other = {row[0] for row in self.conn.execute(
+                "SELECT fingerprint FROM findings WHERE run_id = ?", (other_run,))}
+            results += [f for f in self.findings([current_run]) if f['fingerprint'] not in other]
+        return results
+
+    def new_findings(self, check_name=None):
+        """前回の実行以降に新しく出た指摘"""
+        return self._diff(check_name, newer=True)
+
+    def resolved_findings(self, check_name=None):
+        """前回の実行にはあり、最新の実行で出なくなった指摘"""
+        return self._diff(check_name, newer=False)
+
+    def open_findings(self, element=None, check_name=None):
+        """
+        未解決の指摘（各検証項目の最新の正常な実行の指摘）。elementを指定するとその要素の指摘だけを返す。
+        """
+        run_ids = self.latest_runs(check_name)
+        if element is None or not run_ids:
+            return self.findings(run_ids)
+        placeholders = ','.join('?' * len(run_ids))
+        finding_ids = {row[0] for row in self.conn.execute(
+            f"SELECT e.finding_id FROM finding_elements e JOIN findings f ON f.id = e.finding_id "
+            f"WHERE e.element = ? AND f.run_id IN ({placeholders})", [element] + run_ids)}
+        return [f for f in self.findings(run_ids) if f['id'] in finding_ids]
+
+    def open_counts_by_element(self, pattern=None):
+        """
+        要素ごとの未解決の指摘の件数（件数の多い順）。patternはSQLのLIKEパターン（例: 'R%'）。
+
+        Returns:
+            list: (要素, 件数) のタプルのリスト。
+        """
+        run_ids = self.latest_runs()
+        if not run_ids:
+            return []
+        placeholders = ','.join('?' * len(run_ids))
+        where, params = ("AND e.element LIKE ?", [pattern]) if pattern else ("", [])
+        return [tuple(row) for row in self.conn.execute(
+            f"SELECT e.element, COUNT(*) AS n FROM finding_elements e JOIN findings f ON f.id = e.finding_id "
+            f"WHERE f.run_id IN ({placeholders}) {where} GROUP BY e.element ORDER BY n DESC, e.element",
+            run_ids + params)]
+
+    def trend(self, check_name=None, limit=20):
+        """
+        実行ごとの重大度別の件数（古い順）。
+
+        Returns:
+            list: {'run_id', 'check_name', 'created', 'error', 'warning', 'info'} のリスト。
+        """
+        where, params = ("AND r.check_name = ?", [check_name]) if check_name else ("", [])
+        rows = self.conn.execute(
+            f"SELECT r.id AS run_id, r.check_name, r.created, "
+            f"SUM(f.severity = 'error') AS error, SUM(f.severity = 'warning') AS warning, "
+            f"SUM(f.severity = 'info') AS info "
+            f"FROM runs r LEFT JOIN findings f ON f.run_id = r.id "
+            f"WHERE r.status = 'ok' {where} GROUP BY r.id ORDER BY r.id DESC LIMIT ?", params + [limit])
+        return [{key: row[key] or 0 if key in SEVERITIES else row[key] for key in row.keys()}
+                for row in reversed(rows.fetchall())]
+
+    def report(self, check_name=None, include_text=False):
+        """
+        最新の実行の指摘からMarkdownのレポートを組み立てます（前回からの新規の指摘に印を付ける）。
+
+        Args:
+            check_name (str): 検証項目（省略時はすべて）。
+            include_text (bool): 検証結果の本文も含めるか。
+
+        Returns:
+            str: Markdown文字列。
+        """
+        new_ids = {f['id'] for f in self.new_findings(check_name)}
+        lines = ["### AI検証 結果レポート ###\n"]
+        latest = self.latest_runs(check_name)
+        if not latest:
+            lines.append("記録された検証結果がありません。")
+            return "\n".join(lines)
+        by_run = {}
+        for f in self.findings(latest):
+            by_run.setdefault(f['run_id'], []).append(f)
+        for row in self.conn.execute(
+                f"SELECT id, check_name, created, model, result FROM runs WHERE id IN ({','.join('?' * len(latest))}) "
+                f"ORDER BY check_name", latest):
+            findings = by_run.get(row['id'], [])
+            counts = ', '.join(f"{severity}: {sum(f['severity'] == severity for f in findings)}"
+                               for severity in SEVERITIES)
+            lines.append(f"## {row['check_name']}\n")
+            lines.append(f"- 実行: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['created']))}"
+                         f"（{row['model'] or '-'}）")
+            lines.append(f"- 指摘: {len(findings)}件（{counts}, 新規: {sum(f['id'] in new_ids for f in findings)}件）\n")
+            if findings:
+                lines.append("| 重大度 | 出典 | 対象要素 | 指摘 | 新規 |")
+                lines.append("|----|----|----|----|----|")
+                for f in findings:
+                    source = f['rule'] if f['source'] == 'rule' else 'AI'
+                    lines.append(f"| {f['severity']} | {source} | {', '.join(f['elements'])} | "
+                                 f"{f['message'].replace('|', '/')} | {'★' if f['id'] in new_ids else ''} |")
+                lines.append("")
+            if include_text and row['result']:
+                lines.append("### 検証結果の本文\n")
+                lines.append(row['result'])
+                lines.append("")
+            lines.append("---\n")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='検証履歴（構造化された指摘）を問い合わせます')
+    parser.add_argument('command', choices=('report', 'new', 'resolved', 'open', 'elements', 'trend', 'runs'),
+                        help='report: レポート, new: 新規の指摘, resolved: 解消した指摘, open: 未解決の指摘, '
+                             'elements: 要素ごとの件数, trend: 件数の推移, runs: 実行の一覧')
+    parser.add_argument('root_dir', nargs='?', default='.', help='モデルのディレクトリ')
+    parser.add_argument('--check', help='検証項目')
+    parser.add_argument('--element', help='対象要素（open）またはLIKEパターン（elements, 例: R%%）')
+    parser.add_argument('--text', action='store_true', help='レポートに検証結果の本文を含める')
+    parser.add_argument('-o', '--output', help='レポートを書き出すファイル（省略時は標準出力）')
+    args = parser.parse_args()
+
+    path = os.path.join(args.root_dir, DEFAULT_HISTORY_FILE)
+    if not os.path.exists(path):
+        print(f"検証履歴がありません: {path}")
+        return
+    start_time = time.time()
+    store = FindingStore(path)
+    if args.command == 'report':
+        report = store.report(args.check, args.text)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(report)
+            print(f"Exported: {args.output}")
+        else:
+            print(report)
+    elif args.command in ('new', 'resolved', 'open'):
+        if args.command == 'new':
+            findings = store.new_findings(args.check)
+        elif args.command == 'resolved':
+            findings = store.resolved_findings(args.check)
+        else:
+            findings = store.open_findings(args.element, args.check)
+        for f in findings:
+            print(f"[{f['severity']}] {f['check_name']}: {f['message']} ({', '.join(f['elements'])})")
+        print(f"{len(findings)}件")
+    elif args.command == 'elements':
+        for element, count in store.open_counts_by_element(args.element):
+            print(f"{element}\t{count}")
+    elif args.command == 'trend':
+        for row in store.trend(args.check):
+            created = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['created']))
+            print(f"{created}\t{row['check_name']}\terror={row['error']}\twarning={row['warning']}\tinfo={row['info']}")
+    else:
+        for row in store.runs(args.check):
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['created']))
+            print(f"#{row['id']}\t{created}\t{row['check_name']}\t{row['status']}\t指摘: {row['findings']}件"
+                  f"{'（キャッシュ）' if row['cached'] else ''}")
+    store.close()
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# 設定するとスクリプトの開始時から計測し、終了時にこのパスへトレースを書き出す
+TRACE_ENV = 'EA_TRACE'
+
+_enabled = False
+_lock = threading.Lock()
+_events = []        # 区間（Chromeトレースの完了イベント）
+_counters = {}      # カウンタ名 → 値
+_tracks = {}        # (種別, スレッド/タスクのid) → トレース上のtid
+_track_names = {}   # (pid, tid) → 行の表示名
+
+
+class _NullSpan:
+    """計測しないときの区間（何もしない）"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start', 'tid')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.tid = _track_id()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        event = {'name': self.name, 'ph': 'X', 'ts': self.start * 1e6, 'dur': (end - self.start) * 1e6,
+                 'pid': os.getpid(), 'tid': self.tid, 'args': self.args}
+        with _lock:
+            _events.append(event)
+        return False
+
+    def set(self, **args):
+        """区間に付ける情報を追加する（件数・ファイル名など）"""
+        self.args.update(args)
+
+
+def _track_id():
+    """
+    区間を並べるトレース上の行。asyncioのタスク内ならタスクごと、それ以外はスレッドごとに分ける
+    （並行して待つAPI呼び出しが同じ行で重ならないようにする）。
+    """
+    task = None
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+    if task is not None:
+        key, label = ('task', id(task)), task.get_name()
+    else:
+        thread = threading.current_thread()
+        key, label = ('thread', thread.ident), thread.name
+    with _lock:
+        tid = _tracks.get(key)
+        if tid is None:
+            tid = _tracks[key] = len(_tracks) + 1
+            _track_names[(os.getpid(), tid)] = label
+    return tid
+
+
+def enable():
+    """計測を開始する（すでに計測中なら何もしない）"""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """計測を止める（記録済みの区間とカウンタは残る）"""
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    """計測中か（計測用の値を求める処理そのものを省くときに使う）"""
+    return _enabled
+
+
+def reset():
+    """記録済みの区間とカウンタを消す"""
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _tracks.clear()
+        _track_names.clear()
+
+
+def span(name, **args):
+    """
+    名前付きの区間を計測するコンテキストマネージャを返します。
+    計測していないときは何もしない共有オブジェクトを返すため、ほぼ費用はかかりません。
+
+    Args:
+        name (str): 区間名（'xmi.parse' のように「処理系.処理」で付ける）。
+        **args: トレースの区間に付ける情報。
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def count(name, value=1):
+    """カウンタに値を加える（計測していないときは何もしない）"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def traced(name):
+    """関数の呼び出し全体を区間として計測するデコレータ"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def drain():
+    """
+    記録済みの区間とカウンタを取り出して消します（プロセスプールのワーカーから親へ渡す用）。
+
+    Returns:
+        dict: {'events', 'counters', 'tracks'} の辞書。tracksは (pid, tid, 表示名) のリスト。
+    """
+    with _lock:
+        state = {'events': list(_events), 'counters': dict(_counters),
+                 'tracks': [(pid, tid, label) for (pid, tid), label in _track_names.items()]}
+    reset()
+    return state
+
+
+def merge(state):
+    """ワーカーで記録した区間とカウンタ（drainの戻り値）を取り込む"""
+    if not state:
+        return
+    with _lock:
+        # ワーカーの区間はpidが異なるため、トレース上は別のプロセスの行として並ぶ
+        _events.extend(state['events'])
+        for name, value in state['counters'].items():
+            _counters[name] = _counters.get(name, 0) + value
+        for pid, tid, label in state['tracks']:
+            _track_names[(pid, tid)] = label
+
+
+def worker_call(trace, func, *args):
+    """
+    プロセスプールのワーカーで関数を呼び、(戻り値, 計測結果) を返します。
+    traceがTrueのときだけワーカー内でも計測し、計測結果は親でmergeします。
+    """
+    if not trace:
+        return func(*args), None
+    # fork で起動したワーカーは親の記録を引き継いでいるため消してから測る
+    reset()
+    enable()
+    try:
+        result = func(*args)
+    except BaseException:
+        reset()
+        raise
+    return result, drain()
+
+
+def summary():
+    """
+    区間名ごとの集計とカウンタを返します。
+
+    Returns:
+        tuple: (spans, counters) のタプル。spansは {'name', 'count', 'total_ms', 'mean_ms', 'max_ms'} の
+               リスト（合計時間の長い順）、countersはカウンタ名 → 値の辞書。
+    """
+    totals = {}
+    with _lock:
+        for event in _events:
+            entry = totals.setdefault(event['name'], [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += event['dur']
+            entry[2] = max(entry[2], event['dur'])
+        values = dict(_counters)
+    spans = [{'name': name, 'count': n, 'total_ms': total / 1000, 'mean_ms': total / n / 1000,
+              'max_ms': longest / 1000}
+             for name, (n, total, longest) in totals.items()]
+    spans.sort(key=lambda s: s['total_ms'], reverse=True)
+    return spans, dict(sorted(values.items()))
+
+
+def summary_table():
+    """区間名ごとの回数・合計・平均・最大時間と、カウンタの表"""
+    spans, values = summary()
+    width = max([len(s['name']) for s in spans] + [len(name) for name in values] + [24])
+    lines = [f"{'区間':<{width}}{'回数':>8}{'合計(ms)':>12}{'平均(ms)':>12}{'最大(ms)':>12}"]
+    for s in spans:
+        lines.append(f"{s['name']:<{width}}{s['count']:>8}{s['total_ms']:>12.1f}{s['mean_ms']:>12.2f}"
+                     f"{s['max_ms']:>12.1f}")
+    if values:
+        lines.append('')
+        lines.append(f"{'カウンタ':<{width}}{'値':>14}")
+        for name, value in values.items():
+            lines.append(f"{name:<{width}}{value:>14,.0f}")
+    return '\n'.join(lines)
+
+
+def trace():
+    """
+    Chromeトレース形式（chrome://tracing・Perfettoで開ける）の辞書を返します。
+    カウンタは最後の区間の終了時刻の値として書きます。
+    """
+    with _lock:
+        events = list(_events)
+        values = dict(_counters)
+        names = dict(_track_names)
+    end = max((event['ts'] + event['dur'] for event in events), default=time.perf_counter() * 1e6)
+    metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': label}}
+                for (pid, tid), label in names.items()]
+    counter_events = [{'name': name, 'ph': 'C', 'ts': end, 'pid': os.getpid(), 'tid': 0, 'args': {'value': value}}
+                      for name, value in values.items()]
+    return {'traceEvents': metadata + events + counter_events, 'displayTimeUnit': 'ms',
+            'otherData': {'counters': values}}
+
+
+def write_trace(path):
+    """トレースをJSONファイルに書き出す"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trace(), f, ensure_ascii=False)
+
+
+def add_trace_argument(parser):
+    """CLIに --trace オプションを追加する"""
+    parser.add_argument('--trace', metavar='FILE',
+                        help='処理時間とカウンタを計測し、Chromeトレース形式のJSONに書き出して集計表を表示する')
+
+
+@contextlib.contextmanager
+def tracing(path):
+    """
+    pathが指定されていれば、ブロックの間を計測して終了時にトレースを書き出し、集計表を表示します。
+    pathがNoneなら何もしません（環境変数 EA_TRACE による計測はそのまま続く）。
+    """
+    if not path:
+        yield
+        return
+    enable()
+    try:
+        yield
+    finally:
+        write_trace(path)
+        print(summary_table())
+        print(f"Exported: {path}")
+
+
+def _write_at_exit(path):
+    if _events or _counters:
+        write_trace(path)
+        print(summary_table(), file=sys.stderr)
+        print(f"Exported: {path}", file=sys.stderr)
+
+
+# 環境変数が設定されていれば、引数を持たないスクリプトも含めて開始時から計測する
+if os.environ.get(TRACE_ENV):
+    enable()
+    atexit.register(_write_at_exit, os.environ[TRACE_ENV])
@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+import instrumentation
+
+# 種別ごとのMarkdownの出力先（ディレクトリ, ファイル名）。検証項目（check_registry）が読むファイル名に合わせる。
+# アクティビティ図は図ごとに出力するため、ファイル名の{name}に図の名前（XMIではファイル名の拡張子を除いた部分）が入る
+REPORT_FILES = {
+    'requirement': ('要求図', '要求図_要素.md'),
+    'use_case': ('ユースケース図', 'ユースケース_要素.md'),
+    'activity': ('ユースケース記述', '{name}_アクティビティ図.md'),
+}
+
+
+def report_file_name(kind, name):
+    """種別（'requirement' / 'use_case' / 'activity'）と図の名前からMarkdownのファイル名を返す"""
+    return REPORT_FILES[kind][1].format(name=name)
+
+
+@instrumentation.traced('markdown.requirement_report')
+def format_requirement_report(requirements_dict, relationships_list):
+    """
+    要求と関連から要求分析レポート（Markdown）を組み立てます。
+
+    Args:
+        requirements_dict (dict): IDをキーとする要求の辞書。
+        relationships_list (list): (source, rel_type, target) のタプルのリスト。
+
+    Returns:
+        str: Markdown文字列。
+    """
+    output_lines = []
+    output_lines.append("### 自動販売機システム 要求分析レポート ###\n")
+    # 1. 要求一覧をテーブル形式で追加
+    output_lines.append(f"## 1. 要求一覧 ({len(requirements_dict)}件)\n")
+    output_lines.append("| ID | 要求名 | 要求テキスト |")
+    output_lines.append("|----|----------|----------|")
+    sorted_reqs = sorted(requirements_dict.values(), key=lambda x: (x.get('id') or ''))
+    for req in sorted_reqs:
+        req_id = req.get('id', 'N/A')
+        req_name = req.get('name', '')
+        req_text = req.get('text', '')
+        output_lines.append(f"| {req_id} | {req_name} | {req_text} |")
+    output_lines.append("\n---\n")
+
+    # 2. 関連を種類ごとにグループ化して追加
+    output_lines.append(f"## 2. 要求の関連 ({len(relationships_list)}件)\n")
+
+    grouped_rels = defaultdict(list)
+    for source, rel_type, target in relationships_list:
+        grouped_rels[rel_type].append((source, target))
+
+    for rel_type in sorted(grouped_rels.keys()):
+        output_lines.append(f"### 関連タイプ: `{rel_type}`")
+        for source, target in sorted(grouped_rels[rel_type]):
+            output_lines.append(f"- **{source}** → **{target}**")
+        output_lines.append("") # 改行
+    output_lines.append("---\n")
+    return "\n".join(output_lines)
+
+
+@instrumentation.traced('markdown.use_case_report')
+def format_use_case_report(actors_list, use_cases_list, boundary_name, associations_list):
+    """
+    アクター・ユースケース・システム境界・関連からユースケース分析（Markdown）を組み立てます。
+
+    Args:
+        actors_list (list): アクター名のリスト。
+        use_cases_list (list): ユースケース名のリスト。
+        boundary_name (str): システム境界名。
+        associations_list (list): (actor_name, use_case_name) のタプルのリスト。
+
+    Returns:
+        str: Markdown文字列。
+    """
+    output_lines = []
+    output_lines.append("### 自動販売機システム ユースケース分析 ###\n")
+
+    if boundary_name:
+        output_lines.append(f"## 1. システム境界\n")
+        output_lines.append(f"- **システム名**: {boundary_name}\n")
+        output_lines.append("---\n")
+
+    if actors_list:
+        output_lines.append(f"## 2. アクター ({len(actors_list)}件)\n")
+        for actor in actors_list:
+            output_lines.append(f"- {actor}")
+        output_lines.append("\n---\n")
+
+    if use_cases_list:
+        output_lines.append(f"## 3. ユースケース ({len(use_cases_list)}件)\n")
+        for use_case in use_cases_list:
+            output_lines.append(f"- {use_case}")
+        output_lines.append("\n---\n")
+
+    if associations_list:
+        output_lines.append(f"## 4. アクターとユースケースの関連\n")
+
+        # アクターをキーとしてユースケースをグループ化
+        actor_to_uc_map = defaultdict(list)
+        for actor, use_case in associations_list:
+            actor_to_uc_map[actor].append(use_case)
+
+        # アクターごとに整形して出力
+        for actor in sorted(actor_to_uc_map.keys()):
+            output_lines.append(f"### アクター: {actor}")
+            for use_case in sorted(actor_to_uc_map[actor]):
+                output_lines.append(f"- {use_case}")
+            output_lines.append("") # アクターごとに改行
+        output_lines.append("---\n")
+    return '\n'.join(output_lines)
+
+
+@instrumentation.traced('markdown.activity_report')
+def format_activity_report(elements, partitions, flows):
+    """
+    アクティビティ図の要素・パーティション・フローからレポートを組み立てます。
+
+    Args:
+        elements (dict): 要素IDをキーとする {'name', 'type', ...} の辞書。
+        partitions (dict): パーティションIDをキーとする {'name', 'actions'} の辞書。
+        flows (list): {'source', 'target', 'condition'} の辞書のリスト。
+
+    Returns:
+        str: レポート文字列。
+    """
+    output_lines = []
+    output_lines.append("### 自動販売機システム アクティビティ図 ###")
+    output_lines.append("\n--- 1. パーティションとアクション ---")
+    if partitions:
+        for part_data in sorted(partitions.values(), key=lambda part: part['name']):
+            output_lines.append(f"\n【パーティション】: {part_data['name']}")
+            valid_actions = [action for action in part_data['actions'] if action is not None]
+            if not valid_actions:
+                output_lines.append("  (名前付きのアクションはありません)")
+            else:
+                for action in sorted(valid_actions):
+                    output_lines.append(f"  - {action}")
+    else:
+        output_lines.append("パーティションが見つかりませんでした。")
+
+    output_lines.append("\n--- 2. 分岐 (Decision) ---")
+    decision_lines = [elem_data['name'] for elem_data in elements.values() if elem_data.get('type') == 'Decision' and elem_data.get('name')]
+    if not decision_lines:
+        output_lines.append("分岐が見つかりませんでした。")
+    else:
+        for line in sorted(decision_lines):
+            output_lines.append(f"- {line}")
+
+    output_lines.append("\n--- 3. フロー (矢印) ---")
+    if flows:
+        sorted_flows = sorted(flows, key=lambda x: (str(x['source']), str(x['target'])))
+        for flow in sorted_flows:
+            if flow['source'] is None or flow['target'] is None: continue
+            flow_str = f"- フロー: 「{flow['source']}」→「{flow['target']}」"
+            if flow['condition']:
+                flow_str += f" [条件: {flow['condition']}]"
+            output_lines.append(flow_str)
+    else:
+        output_lines.append("フローが見つかりませんでした。")
+
+    return "\n".join(output_lines)
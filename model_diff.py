@@ -0,0 +1,347 @@
+import argparse
+import json
+import re
+import sys
+import time
+
+import instrumentation
+from check_registry import CHECKS
+from model_snapshot import SNAPSHOT_SUFFIX, load_snapshot
+from qea_repository import QeaRepository
+from xmi_parser import parse_xmi
+
+# 表示・管理用で、モデルの意味に関係しないタグ付き値（エクスポートのたびに変わるものを含む）
+IGNORED_TAGS = frozenset((
+    '$ea_xref_property', 'date_created', 'date_modified', 'ea_localid', 'ea_sourceID', 'ea_targetID',
+    'tpos', 'style', 'seqno', 'gentype', 'mb', 'package', 'package_name', 'virtualInheritance',
+    'lineStyle', 'linecolor', 'linemode', 'linewidth', 'headStyle', 'sourcestyle', 'deststyle',
+    'src_style', 'dst_style',
+))
+
+# XMIエクスポートではメモ型のタグ付き値の先頭に付く（.qeaの読み込みでは付かない）
+_MEMO_PREFIX = re.compile(r'^<memo>#NOTES#')
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+_CHANGE_LABELS = {ADDED: '追加', REMOVED: '削除', MODIFIED: '変更'}
+_CATEGORY_LABELS = {
+    'requirement': '要求', 'use_case': 'ユースケース', 'actor': 'アクター', 'activity_node': 'アクティビティの要素',
+    'element': 'その他の要素', 'dependency': '依存', 'association': '関連', 'transition': '遷移', 'diagram': '図',
+}
+
+# 影響を受けた要素の分類 → その要素が現れる検証対象ファイルのグループ
+_CATEGORY_GROUPS = {
+    'requirement': ('request',),
+    'use_case': ('usecase', 'usecase_description'),
+    'actor': ('usecase',),
+    'activity': ('activiry_usecase',),
+}
+
+
+def element_category(elem):
+    """要素の分類（'requirement', 'use_case', 'actor', 'activity_node', 'element'）"""
+    if elem.kind == 'ClassifierRole' and elem.stereotype == 'requirement':
+        return 'requirement'
+    if elem.kind == 'UseCase':
+        return 'use_case'
+    if elem.kind == 'Actor':
+        return 'actor'
+    if elem.kind in ('ActionState', 'PseudoState'):
+        return 'activity_node'
+    return 'element'
+
+
+def tag_names(model):
+    """モデルに現れるタグ付き値の名前の集合"""
+    return {tag for _, tag, _ in model.iter_tagged_values()}
+
+
+def model_entries(model, ignored_tags=IGNORED_TAGS, compared_tags=None, diagrams=True):
+    """
+    モデルの構成要素を (分類, xmi.id, 属性の辞書) で返すジェネレータ。
+    属性は名前・ステレオタイプ・端点などと、タグ付き値（'tag:タグ名' をキーとする）です。
+    タグ付き値はXMIのメモ型の接頭辞（<memo>#NOTES#）を除いた値で比べます。
+    xmi.idを持たない構成要素は突き合わせられないため返しません。
+
+    Args:
+        model (XmiModel or SnapshotModel): parse_xmi・QeaRepository・load_snapshot が返すモデル。
+        ignored_tags (set): 比較しないタグ付き値。
+        compared_tags (set): 指定した場合は、このタグ付き値だけを比較する。
+        diagrams (bool): 図も構成要素として返すか。
+    """
+    tags = {}
+    for xmi_id, tag, value in model.iter_tagged_values():
+        if tag not in ignored_tags and (compared_tags is None or tag in compared_tags):
+            tags.setdefault(xmi_id, {})['tag:' + tag] = _MEMO_PREFIX.sub('', value) if value else value
+
+    def entry(category, xmi_id, fields):
+        fields.update(tags.get(xmi_id, ()))
+        return category, xmi_id, fields
+
+    for xmi_id, elem in model.elements.items():
+        yield entry(element_category(elem), xmi_id,
+                    {'kind': elem.kind, 'name': elem.name, 'stereotype': elem.stereotype})
+    for dep in model.dependencies:
+        if dep.id:
+            yield entry('dependency', dep.id,
+                        {'stereotype': dep.stereotype, 'client': dep.client, 'supplier': dep.supplier})
+    for assoc in model.associations:
+        if assoc.id:
+            yield entry('association', assoc.id, {'source': assoc.source, 'target': assoc.target})
+    for trans in model.transitions:
+        if trans.id:
+            yield entry('transition', trans.id,
+                        {'source': trans.source, 'target': trans.target, 'condition': trans.condition})
+    for diagram in model.diagrams if diagrams else ():
+        if diagram.id:
+            yield entry('diagram', diagram.id, {'name': diagram.name, 'type': diagram.type})
+
+
+def _change(change, category, xmi_id, fields):
+    return {'change': change, 'category': category, 'id': xmi_id, 'fields': fields}
+
+
+def diff_entries(old_entries, new_entries):
+    """
+    2つの版の構成要素（model_entries の形式）をxmi.idで突き合わせます。
+    旧版を辞書にしてから新版を1回だけ流して照合するため、要素数に対して線形時間で、
+    新版は解析しながら渡すジェネレータでも構いません。
+
+    Returns:
+        list: {'change': 'added' / 'removed' / 'modified', 'category', 'id', 'fields'} の辞書のリスト
+              （新版の順に追加・変更、最後に旧版の順で削除）。fieldsは属性 → (旧, 新) の辞書で、
+              変更では値の異なる属性だけ、追加・削除ではすべての属性を持つ。
+    """
+    before = {xmi_id: (category, fields) for category, xmi_id, fields in old_entries}
+    changes = []
+    for category, xmi_id, fields in new_entries:
+        previous = before.pop(xmi_id, None)
+        if previous is None:
+            changes.append(_change(ADDED, category, xmi_id, {key: (None, value) for key, value in fields.items()}))
+            continue
+        old_fields = previous[1]
+        changed = {key: (old_fields.get(key), fields.get(key)) for key in old_fields.keys() | fields.keys()
+                   if old_fields.get(key) != fields.get(key)}
+        if changed:
+            changes.append(_change(MODIFIED, category, xmi_id, dict(sorted(changed.items()))))
+    for xmi_id, (category, fields) in before.items():
+        changes.append(_change(REMOVED, category, xmi_id, {key: (value, None) for key, value in fields.items()}))
+    instrumentation.count('diff.changes', len(changes))
+    return changes
+
+
+def diff_models(old, new, ignored_tags=IGNORED_TAGS, shared_only=False):
+    """
+    2つの版のモデルの追加・削除・変更を返す（diff_entries を参照）。
+    shared_only=Trueなら、両方の版に現れるタグ付き値と、両方の版にある場合の図だけを比較する
+    （XMIと.qeaのように、読み込み方によって出力される内容が異なる版どうしを比べるとき）。
+    """
+    with instrumentation.span('diff.models'):
+        compared_tags, diagrams = None, True
+        if shared_only:
+            compared_tags = tag_names(old) & tag_names(new)
+            diagrams = bool(old.diagrams) and bool(new.diagrams)
+        return diff_entries(model_entries(old, ignored_tags, compared_tags, diagrams),
+                            model_entries(new, ignored_tags, compared_tags, diagrams))
+
+
+def version_format(source):
+    """版の読み込み方（'qea' または 'xmi'。スナップショットはXMIから作るため 'xmi'）"""
+    return 'qea' if source.endswith('.qea') else 'xmi'
+
+
+def load_version(source, package=None):
+    """
+    比較する版のモデルを読み込みます。
+
+    Args:
+        source (str): XMIファイル、.qea、スナップショット（.easnap）のパス。'-' なら標準入力のXMI。
+        package (str): .qeaから読み込むパッケージ名（省略時はリポジトリ全体）。
+    """
+    if source == '-':
+        return parse_xmi(sys.stdin.buffer)
+    if source.endswith('.qea'):
+        with QeaRepository(source) as repo:
+            return repo.load_package(package) if package else repo.load_repository()
+    if source.endswith(SNAPSHOT_SUFFIX):
+        return load_snapshot(source)
+    return parse_xmi(source)
+
+
+def _element_name(xmi_id, *models):
+    for model in models:
+        elem = model.elements.get(xmi_id)
+        if elem is not None:
+            return elem.name
+    return None
+
+
+def _label(category, xmi_id, models):
+    """指摘の対象要素の表記（要求はID、それ以外は名前）"""
+    for model in models:
+        elem = model.elements.get(xmi_id)
+        if elem is None:
+            continue
+        if category == 'requirement':
+            return model.tagged_value(xmi_id, 'id') or elem.name
+        return elem.name
+    return xmi_id
+
+
+def _activity_names(models):
+    return sorted({d.name for model in models for d in model.diagrams if d.type == 'ActivityDiagram' and d.name})
+
+
+def touched_elements(changes, old, new):
+    """
+    変更の影響を受けた要求・ユースケース・アクター・アクティビティを返します。
+    関連・依存は両端（旧版・新版の両方）の要素を、遷移とアクティビティの要素は
+    それを含むアクティビティ図（図の名前がなければ要素の名前）を影響を受けたものとします。
+
+    Returns:
+        dict: 分類（'requirement', 'use_case', 'actor', 'activity'）→ {xmi.id または図の名前: 表記} の辞書。
+    """
+    models = (new, old)
+    touched = {category: {} for category in _CATEGORY_GROUPS}
+
+    def touch(xmi_id):
+        for model in models:
+            elem = model.elements.get(xmi_id)
+            if elem is None:
+                continue
+            category = element_category(elem)
+            if category in touched:
+                touched[category][xmi_id] = _label(category, xmi_id, models)
+            elif category == 'activity_node':
+                touch_activity(xmi_id)
+            return
+
+    def touch_activity(xmi_id):
+        names = _activity_names(models)
+        for name in names or [_element_name(xmi_id, *models) or xmi_id]:
+            touched['activity'][name] = name
+
+    for change in changes:
+        category = change['category']
+        if category in touched:
+            touched[category][change['id']] = _label(category, change['id'], models)
+        elif category == 'activity_node':
+            touch_activity(change['id'])
+        elif category in ('dependency', 'association', 'transition'):
+            for key in ('client', 'supplier', 'source', 'target'):
+                for value in change['fields'].get(key, ()):
+                    if value:
+                        touch(value)
+    return {category: items for category, items in touched.items() if items}
+
+
+def affected_checks(touched):
+    """影響を受けた要素が現れる検証対象ファイルを含む検証項目（定義順）"""
+    groups = {group for category in touched for group in _CATEGORY_GROUPS[category]}
+    return [check['name'] for check in CHECKS if groups & set(check['groups'])]
+
+
+def focus_labels(touched):
+    """再検証の対象として示す要素の表記（重複なし・分類順）"""
+    return list(dict.fromkeys(label for items in touched.values() for label in items.values()))
+
+
+def _describe(change, old, new):
+    models = (new, old) if change['change'] != REMOVED else (old, new)
+    fields = change['fields']
+    if change['category'] in ('dependency', 'association', 'transition'):
+        ends = [values[1] if values[1] is not None else values[0]
+                for key in ('client', 'source', 'supplier', 'target') for values in [fields.get(key)] if values]
+        return ' → '.join(_element_name(end, *models) or str(end) for end in ends) or change['id']
+    if change['category'] == 'requirement':
+        return f"{_label('requirement', change['id'], models)} {_element_name(change['id'], *models) or ''}".strip()
+    return _element_name(change['id'], *models) or next(
+        (value for values in [fields.get('name')] if values for value in values if value), change['id'])
+
+
+def _short(value, width=60):
+    if value is None:
+        return '（なし）'
+    value = ' '.join(str(value).split())
+    return value if len(value) <= width else value[:width - 1] + '…'
+
+
+def format_diff(changes, old, new):
+    """変更の一覧のMarkdown（分類ごと、変更は属性の旧値と新値を示す）"""
+    if not changes:
+        return "# モデルの差分\n\n変更はありません。"
+    counts = {}
+    for change in changes:
+        counts[change['change']] = counts.get(change['change'], 0) + 1
+    lines = ["# モデルの差分", "",
+             ', '.join(f"{_CHANGE_LABELS[key]}: {counts.get(key, 0)}件" for key in (ADDED, REMOVED, MODIFIED)), ""]
+    for category, label in _CATEGORY_LABELS.items():
+        items = [change for change in changes if change['category'] == category]
+        if not items:
+            continue
+        lines += [f"## {label}", ""]
+        for change in items:
+            lines.append(f"- [{_CHANGE_LABELS[change['change']]}] {_describe(change, old, new)}")
+            if change['change'] == MODIFIED:
+                lines += [f"  - {key}: {_short(before)} → {_short(after)}"
+                          for key, (before, after) in change['fields'].items()]
+        lines.append("")
+    return '\n'.join(lines).rstrip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='2つの版のモデル（XMI・.qea・スナップショット）をxmi.idで比較し、'
+                                                 '追加・削除・変更された要素と、影響を受けた要素だけの再検証を行います')
+    parser.add_argument('old', help="旧版（XMI・.qea・.easnap、'-' なら標準入力のXMI）")
+    parser.add_argument('new', help="新版（XMI・.qea・.easnap、'-' なら標準入力のXMI）")
+    parser.add_argument('--package', help='.qeaから比較するパッケージ名（省略時はリポジトリ全体）')
+    parser.add_argument('--json', metavar='FILE', help='変更と影響を受けた要素をJSONに書き出す')
+    parser.add_argument('--reverify', metavar='ROOT_DIR',
+                        help='影響を受けた要素を含む検証項目だけを、その要素に絞って再検証するモデルのディレクトリ')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+    if args.old == '-' and args.new == '-':
+        parser.error("標準入力を使えるのは一方の版だけです")
+
+    start_time = time.time()
+    with instrumentation.tracing(args.trace):
+        old = load_version(args.old, args.package)
+        new = load_version(args.new, args.package)
+        # EAのXMIエクスポートにしかないタグ付き値（作成者・状態など）や図は、.qeaとの比較では変更として扱わない
+        mixed = version_format(args.old) != version_format(args.new)
+        changes = diff_models(old, new, shared_only=mixed)
+        if mixed:
+            print("※ XMIと.qeaの比較のため、両方の版にあるタグ付き値と図だけを比較します。\n")
+        touched = touched_elements(changes, old, new)
+        checks = affected_checks(touched)
+        print(format_diff(changes, old, new))
+        print()
+        print(f"影響を受けた要素: {', '.join(focus_labels(touched)) or 'なし'}")
+        print(f"再検証の対象: {', '.join(checks) if checks else 'なし'}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'changes': changes, 'touched': touched, 'checks': checks}, f, ensure_ascii=False, indent=2)
+            print(f"Exported: {args.json}")
+        if args.reverify and checks:
+            # 再検証を使わない比較ではAPIクライアントを読み込まない
+            from response_cache import ResponseCache
+            from verification_engine import VerificationEngine
+
+            with VerificationEngine(args.reverify, cache=ResponseCache(), focus=focus_labels(touched)) as engine:
+                outcomes = engine.run(checks)
+            for check, outcome in outcomes.items():
+                if outcome.get('skipped'):
+                    print(f"  {check}: スキップ（{outcome['skipped']}）")
+                elif outcome['error']:
+                    print(f"  {check}: エラー {outcome['error']}")
+                else:
+                    print(f"  {check}: 完了（指摘: {len(outcome['findings'])}件、"
+                          f"うち前回から引き継ぎ: {outcome.get('carried', 0)}件） {outcome['result_file']}")
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
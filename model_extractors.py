@@ -0,0 +1,183 @@
+import re
+
+import instrumentation
+
+# 抽出処理・レポート形式のバージョン。出力が変わる修正をしたら上げる（抽出キャッシュのキーに含まれる）
+EXTRACTOR_VERSION = 1
+
+# アクティビティ図の要素収集の対象とするXMI要素
+ACTIVITY_ELEMENT_KINDS = ('ActionState', 'PseudoState', 'ClassifierRole')
+
+
+@instrumentation.traced('requirements.extract')
+def extract_requirements(model):
+    """
+    解析済みモデルから要求と関連を抽出します。
+
+    Args:
+        model (XmiModel): parse_xmi または QeaRepository が返すモデル。
+
+    Returns:
+        tuple: (requirements, relationships) のタプル。
+               requirementsはIDをキーとする辞書、relationshipsは関連のリスト。
+    """
+    requirements = {}
+    relationships = []
+    span = instrumentation.span
+
+    # Step 1: 要求要素（ClassifierRole）をすべて抽出
+    with span('requirements.collect'):
+        for xmi_id, elem in model.elements.items():
+            if elem.kind == 'ClassifierRole' and elem.stereotype == 'requirement':
+                name = elem.name
+                if name:
+                    requirements[xmi_id] = {'name': name, 'id': None, 'text': ''}
+
+    # Step 2: 要求のIDとテキスト（メモ）をタグ付き値の索引から結合
+    with span('requirements.join_tagged_values'):
+        for xmi_id, req in requirements.items():
+            req['id'] = model.tagged_value(xmi_id, 'id')
+            value = model.tagged_value(xmi_id, 'text')
+            if value:
+                req['text'] = re.sub(r'^<memo>#NOTES#', '', value).strip()
+
+    # Step 3: 要求間の関連（DependencyとAssociation）を抽出
+    # Dependency (deriveReqt, refineなど)
+    with span('requirements.dependencies'):
+        for dep in model.dependencies:
+            rel_type = dep.stereotype
+            if rel_type is not None:
+                source_name = model.tagged_value(dep.id, 'ea_sourceName')
+                target_name = model.tagged_value(dep.id, 'ea_targetName')
+                if source_name and target_name:
+                    relationships.append((source_name, rel_type, target_name))
+
+    # Association (Nestingなど)
+    with span('requirements.associations'):
+        for assoc in model.associations:
+            rel_type = model.tagged_value(assoc.id, 'ea_type')
+            source_name = model.tagged_value(assoc.id, 'ea_sourceName')
+            target_name = model.tagged_value(assoc.id, 'ea_targetName')
+            if rel_type and source_name and target_name:
+                relationships.append((source_name, rel_type, target_name))
+
+    instrumentation.count('requirements.extracted', len(requirements))
+    instrumentation.count('requirements.relationships', len(relationships))
+    return requirements, relationships
+
+
+@instrumentation.traced('use_cases.extract')
+def extract_use_cases(model):
+    """
+    解析済みモデルからアクター、ユースケース、システム境界、
+    およびアクターとユースケースの関連を抽出します。
+
+    Args:
+        model (XmiModel): parse_xmi または QeaRepository が返すモデル。
+
+    Returns:
+        tuple: (actors, use_cases, system_boundary, associations) のタプル。
+               actorsとuse_casesは名前のリスト、system_boundaryは名前の文字列、
+               associationsは(actor_name, use_case_name)のタプルのリスト。
+    """
+    actors = []
+    use_cases = []
+    system_boundary = None
+    associations = []
+
+    # --- アクターとユースケースの抽出 ---
+    for elem in model.elements.values():
+        if elem.kind == 'Actor' and elem.name is not None:
+            actors.append(elem.name)
+        elif elem.kind == 'UseCase' and elem.name is not None:
+            use_cases.append(elem.name)
+
+    # --- システム境界の抽出 ---
+    for xmi_id, elem in model.elements.items():
+        if elem.kind == 'ClassifierRole' and elem.name is not None:
+            if model.tagged_value(xmi_id, 'ea_stype') == 'Boundary':
+                system_boundary = elem.name
+                break
+
+    # --- アクターとユースケースの関連を抽出 ---
+    for assoc in model.associations:
+        source_type = model.tagged_value(assoc.id, 'ea_sourceType')
+        target_type = model.tagged_value(assoc.id, 'ea_targetType')
+        source_name = model.tagged_value(assoc.id, 'ea_sourceName')
+        target_name = model.tagged_value(assoc.id, 'ea_targetName')
+
+        # アクターとユースケース間の関連のみを抽出
+        if source_type == 'Actor' and target_type == 'UseCase':
+            associations.append((source_name, target_name))
+        # 逆方向の関連も考慮
+        elif source_type == 'UseCase' and target_type == 'Actor':
+            associations.append((target_name, source_name))
+
+    # 重複を排除してソート
+    actors = sorted(list(set(actors)))
+    use_cases = sorted(list(set(use_cases)))
+    associations = sorted(list(set(associations)))
+
+    return actors, use_cases, system_boundary, associations
+
+
+@instrumentation.traced('activity.extract')
+def extract_activity(model):
+    """
+    解析済みモデルからアクティビティ図の要素・パーティション・フローを抽出します。
+    ActionPin, ObjectNode, Activityなど、すべての要素タイプに対応。
+
+    Args:
+        model (XmiModel): parse_xmi または QeaRepository が返すモデル。
+
+    Returns:
+        tuple: (elements, partitions, flows) のタプル。
+               elementsは要素IDをキーとする {'name', 'type', ...} の辞書、
+               partitionsはパーティションIDをキーとする {'name', 'actions'} の辞書、
+               flowsは {'source', 'target', 'condition'} の辞書のリスト。
+    """
+    elements = {}
+    partitions = {}
+
+    # --- ステップ1: 要素収集 ---
+    for elem_id, elem in model.elements.items():
+        if elem.kind not in ACTIVITY_ELEMENT_KINDS:
+            continue
+
+        elem_type = model.tagged_value(elem_id, 'ea_stype')
+        name = elem.name
+
+        # タイプに基づいた処理
+        if elem_type == 'ActivityPartition':
+            part_name = model.tagged_value(elem_id, 'classname')
+            elements[elem_id] = {'name': part_name, 'type': 'Partition'}
+            partitions[elem_id] = {'name': part_name, 'actions': []}
+        elif elem_type in ['Action', 'Activity']: # Activityもアクションとして扱う
+            owner_id = model.tagged_value(elem_id, 'owner')
+            elements[elem_id] = {'name': name, 'type': 'Action', 'owner': owner_id}
+        elif elem_type == 'Decision':
+            elements[elem_id] = {'name': name, 'type': 'Decision'}
+        # ActionPinとObjectNodeを新たに追加
+        elif elem_type in ['ActionPin', 'ObjectNode']:
+            elements[elem_id] = {'name': name, 'type': elem_type}
+        elif elem_type in ['StateNode', 'MergeNode']:
+            elements[elem_id] = {'name': name or elem_type, 'type': elem_type} # 名前がなければタイプ名を入れる
+
+    # --- ステップ2: アクションの割り当て ---
+    for elem_id, elem_data in elements.items():
+        if elem_data.get('type') == 'Action' and elem_data.get('owner'):
+            owner_id = elem_data.get('owner')
+            if owner_id in partitions:
+                partitions[owner_id]['actions'].append(elem_data['name'])
+
+    # --- ステップ3: フロー抽出 ---
+    flows = []
+    for trans in model.transitions:
+        source_id = trans.source
+        target_id = trans.target
+        source_name = elements.get(source_id, {}).get('name', f"ID不明({source_id})")
+        target_name = elements.get(target_id, {}).get('name', f"ID不明({target_id})")
+        condition = trans.condition
+        flows.append({'source': source_name, 'target': target_name, 'condition': condition})
+
+    return elements, partitions, flows
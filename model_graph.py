@@ -0,0 +1,277 @@
+import argparse
+import time
+from collections import deque
+
+from xmi_parser import parse_xmi
+
+# 関連の種別（依存はステレオタイプ、関連はea_typeをそのまま使う）
+DERIVE_REQT = 'deriveReqt'
+REFINE = 'refine'
+SATISFY = 'satisfy'
+ASSOCIATION = 'Association'
+NESTING = 'Nesting'
+TRANSITION = 'transition'
+DEPENDENCY = 'dependency'   # ステレオタイプのない依存
+
+
+class ModelGraph:
+    """
+    複数の図（XMI/.qea）をxmi.idで統合したモデルグラフ。
+
+    ノードとエッジは整数の番号で管理し、属性は番号で引く並列リストに持ちます。
+    関連の種別ごとに順方向・逆方向の隣接索引（ノード番号 → エッジ番号のリスト）を持つため、
+    隣接ノードの取得は次数に比例する時間で済みます。
+    別の図で定義された要素を端点に持つ関連は、端点を仮のノードとして登録し、
+    その要素を含む図を読み込んだ時点で属性を埋めます。
+    """
+
+    def __init__(self):
+        # ノード（番号で引く）
+        self.ids = []
+        self.kinds = []
+        self.names = []
+        self.stereotypes = []
+        self.stypes = []
+        self._node_models = []  # 要素を定義したモデル（タグ付き値の参照用）
+        self.index = {}         # xmi.id → ノード番号
+        # エッジ（番号で引く）
+        self.edge_ids = []
+        self.edge_types = []
+        self.sources = []
+        self.targets = []
+        self.labels = []        # 遷移のガード条件など
+        self.edge_index = {}    # 関連のxmi.id → エッジ番号
+        # 関連の種別 → {ノード番号: [エッジ番号, ...]}
+        self.forward = {}
+        self.reverse = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _node(self, xmi_id):
+        node = self.index.get(xmi_id)
+        if node is None:
+            node = len(self.ids)
+            self.index[xmi_id] = node
+            self.ids.append(xmi_id)
+            self.kinds.append(None)
+            self.names.append(None)
+            self.stereotypes.append(None)
+            self.stypes.append(None)
+            self._node_models.append(None)
+        return node
+
+    def add_node(self, xmi_id, kind, name, stereotype=None, stype=None, model=None):
+        """要素を登録する（登録済みの要素は最初に定義した図の属性を保つ）"""
+        node = self._node(xmi_id)
+        if self.kinds[node] is None:
+            self.kinds[node] = kind
+            self.names[node] = name
+            self.stereotypes[node] = stereotype
+            self.stypes[node] = stype
+            self._node_models[node] = model
+        return node
+
+    def add_edge(self, rel_type, source_id, target_id, edge_id=None, label=None):
+        """関連を登録する（同じxmi.idの関連は複数の図に現れても1本として扱う）"""
+        if edge_id is not None and edge_id in self.edge_index:
+            return self.edge_index[edge_id]
+        if source_id is None or target_id is None:
+            return None
+        edge = len(self.edge_types)
+        source = self._node(source_id)
+        target = self._node(target_id)
+        self.edge_ids.append(edge_id)
+        self.edge_types.append(rel_type)
+        self.sources.append(source)
+        self.targets.append(target)
+        self.labels.append(label)
+        if edge_id is not None:
+            self.edge_index[edge_id] = edge
+        self.forward.setdefault(rel_type, {}).setdefault(source, []).append(edge)
+        self.reverse.setdefault(rel_type, {}).setdefault(target, []).append(edge)
+        return edge
+
+    def add_model(self, model):
+        """parse_xmi または QeaRepository が返すモデルを取り込む"""
+        for xmi_id, elem in model.elements.items():
+            self.add_node(xmi_id, elem.kind, elem.name, elem.stereotype,
+                          model.tagged_value(xmi_id, 'ea_stype'), model)
+        for dep in model.dependencies:
+            self.add_edge(dep.stereotype or DEPENDENCY, dep.client, dep.supplier, dep.id)
+        for assoc in model.associations:
+            rel_type = model.tagged_value(assoc.id, 'ea_type') or ASSOCIATION
+            self.add_edge(rel_type, assoc.source, assoc.target, assoc.id)
+        for trans in model.transitions:
+            self.add_edge(TRANSITION, trans.source, trans.target, trans.id, trans.condition)
+
+    # --- ノードの参照 ---
+
+    def node(self, xmi_id):
+        """xmi.idの要素を {'id', 'kind', 'name', 'stereotype', 'stype'} で返す（なければNone）"""
+        node = self.index.get(xmi_id)
+        if node is None:
+            return None
+        return {'id': xmi_id, 'kind': self.kinds[node], 'name': self.names[node],
+                'stereotype': self.stereotypes[node], 'stype': self.stypes[node]}
+
+    def name(self, xmi_id):
+        node = self.index.get(xmi_id)
+        return self.names[node] if node is not None else None
+
+    def tagged_value(self, xmi_id, tag, default=None):
+        """要素を定義した図のタグ付き値を返す"""
+        node = self.index.get(xmi_id)
+        if node is None or self._node_models[node] is None:
+            return default
+        return self._node_models[node].tagged_value(xmi_id, tag, default)
+
+    def nodes(self, kind=None, stereotype=None, stype=None):
+        """条件に合う要素のxmi.idを登録順に返す（仮のノードは含まない）"""
+        return [self.ids[node] for node in range(len(self.ids))
+                if self.kinds[node] is not None
+                and (kind is None or self.kinds[node] == kind)
+                and (stereotype is None or self.stereotypes[node] == stereotype)
+                and (stype is None or self.stypes[node] == stype)]
+
+    def find(self, name, kind=None):
+        """名前から要素のxmi.idを返す（同名の要素がすべて返る）"""
+        return [self.ids[node] for node in range(len(self.ids))
+                if self.names[node] == name and (kind is None or self.kinds[node] == kind)]
+
+    # --- 隣接・到達可能性・追跡 ---
+
+    def _rel_types(self, rel_types):
+        if rel_types is None:
+            return list(self.forward)
+        if isinstance(rel_types, str):
+            return [rel_types]
+        return rel_types
+
+    def _adjacent(self, node, rel_types, reverse):
+        adjacency = self.reverse if reverse else self.forward
+        ends = self.sources if reverse else self.targets
+        for rel_type in rel_types:
+            for edge in adjacency.get(rel_type, {}).get(node, ()):
+                yield edge, ends[edge]
+
+    def edges(self, xmi_id, rel_types=None, reverse=False):
+        """
+        要素から出る（reverse=Trueなら要素に入る）関連を返します。
+
+        Returns:
+            list: {'id', 'type', 'source', 'target', 'label'} の辞書のリスト。
+        """
+        node = self.index.get(xmi_id)
+        if node is None:
+            return []
+        return [{'id': self.edge_ids[edge], 'type': self.edge_types[edge],
+                 'source': self.ids[self.sources[edge]], 'target': self.ids[self.targets[edge]],
+                 'label': self.labels[edge]}
+                for edge, _ in self._adjacent(node, self._rel_types(rel_types), reverse)]
+
+    def neighbors(self, xmi_id, rel_types=None, reverse=False):
+        """隣接する要素のxmi.idを返す（関連の種別で絞り込み可）"""
+        node = self.index.get(xmi_id)
+        if node is None:
+            return []
+        return [self.ids[other] for _, other in self._adjacent(node, self._rel_types(rel_types), reverse)]
+
+    def reachable(self, start_ids, rel_types=None, reverse=False):
+        """開始要素から関連をたどって到達できる要素のxmi.idの集合（開始要素を含む）"""
+        rel_types = self._rel_types(rel_types)
+        seen = {self.index[xmi_id] for xmi_id in start_ids if xmi_id in self.index}
+        queue = deque(seen)
+        while queue:
+            for _, other in self._adjacent(queue.popleft(), rel_types, reverse):
+                if other not in seen:
+                    seen.add(other)
+                    queue.append(other)
+        return {self.ids[node] for node in seen}
+
+    def shortest_path(self, source_id, target_id, rel_types=None, reverse=False):
+        """2つの要素を結ぶ最短の経路をxmi.idのリストで返す（なければNone）"""
+        if source_id not in self.index or target_id not in self.index:
+            return None
+        rel_types = self._rel_types(rel_types)
+        start, goal = self.index[source_id], self.index[target_id]
+        previous = {start: None}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            if node == goal:
+                path = []
+                while node is not None:
+                    path.append(self.ids[node])
+                    node = previous[node]
+                return path[::-1]
+            for _, other in self._adjacent(node, rel_types, reverse):
+                if other not in previous:
+                    previous[other] = node
+                    queue.append(other)
+        return None
+
+    def trace_paths(self, source_id, rel_types=None, reverse=False, max_depth=10):
+        """
+        要素から関連をたどった追跡経路をすべて返します（閉路はたどりません）。
+        例: ユースケースから refine → deriveReqt → Nesting をたどると、詳細化した要求から最上位要求までの経路が得られます。
+
+        Returns:
+            list: 末端まで（またはmax_depthまで）たどった経路（xmi.idのリスト）のリスト。
+        """
+        if source_id not in self.index:
+            return []
+        rel_types = self._rel_types(rel_types)
+        paths = []
+        stack = [[self.index[source_id]]]
+        while stack:
+            path = stack.pop()
+            extended = False
+            if len(path) <= max_depth:
+                for _, other in self._adjacent(path[-1], rel_types, reverse):
+                    if other not in path:
+                        stack.append(path + [other])
+                        extended = True
+            if not extended and len(path) > 1:
+                paths.append([self.ids[node] for node in path])
+        return sorted(paths)
+
+
+def build_model_graph(models):
+    """複数のモデルを1つのモデルグラフに統合する"""
+    graph = ModelGraph()
+    for model in models:
+        graph.add_model(model)
+    return graph
+
+
+def load_model_graph(xmi_files):
+    """XMIファイルを解析してモデルグラフを作る"""
+    return build_model_graph(parse_xmi(path) for path in xmi_files)
+
+
+def main():
+    from batch_extract import discover_xmi_files
+
+    parser = argparse.ArgumentParser(description='XMIファイルを統合したモデルグラフを作り、追跡経路を表示します')
+    parser.add_argument('root_dir', nargs='?', default='.', help='XMIファイルを探すディレクトリ')
+    parser.add_argument('--from', dest='source', help='追跡を始める要素の名前（省略時はすべてのユースケース）')
+    parser.add_argument('--rel', action='append', help='たどる関連の種別（省略時は refine/satisfy/deriveReqt/Nesting）')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    graph = load_model_graph(discover_xmi_files(args.root_dir))
+    print(f"ノード: {len(graph)}件, エッジ: {len(graph.edge_types)}件")
+    for rel_type in sorted(graph.forward):
+        print(f"  {rel_type}: {sum(len(edges) for edges in graph.forward[rel_type].values())}件")
+
+    sources = graph.find(args.source) if args.source else graph.nodes(kind='UseCase')
+    for source_id in sources:
+        for path in graph.trace_paths(source_id, args.rel or [REFINE, SATISFY, DERIVE_REQT, NESTING]):
+            print(' → '.join(graph.name(xmi_id) or xmi_id for xmi_id in path))
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,504 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+from xmi_parser import (AssociationRecord, DependencyRecord, DiagramRecord, ElementRecord, TransitionRecord,
+                        parse_xmi)
+
+# スナップショットの形式のバージョン（レイアウトや XmiModel の項目を変えたら上げる）
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = '.model_snapshots'
+SNAPSHOT_SUFFIX = '.easnap'
+
+_MAGIC = b'EASNAP\x00\x00'
+# 先頭: マジック, 形式バージョン, バイト順, 入力のサイズ, 入力の更新時刻, 入力のSHA-256
+_HEADER = struct.Struct('<8sII QqQ 32s')
+# 表の並び（それぞれ先頭からの位置と行数を持つ）
+_SECTIONS = ('strings', 'nodes', 'elements', 'dependencies', 'associations', 'transitions', 'diagrams',
+             'tags', 'tag_rows')
+_SECTION = struct.Struct('<QQ')
+_BYTE_ORDERS = {'little': 1, 'big': 2}
+
+# 文字列・ノードが無いことを表す番号
+NONE = 0xFFFFFFFF
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _u32(values):
+    return array('I', values)
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.digest()
+
+
+def snapshot_path(xmi_path, snapshot_dir=SNAPSHOT_DIR):
+    """XMIファイルのスナップショットの保存先（同名のXMIが別のディレクトリにあっても衝突しない）"""
+    stem = os.path.splitext(os.path.basename(xmi_path))[0]
+    suffix = hashlib.sha256(os.path.abspath(xmi_path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(snapshot_dir, f"{stem}-{suffix}{SNAPSHOT_SUFFIX}")
+
+
+class _StringTable:
+    """書き出し用の文字列表（同じ文字列は1回だけ格納する）"""
+
+    def __init__(self):
+        self.index = {}
+        self.blob = bytearray()
+        self.offsets = [0]
+
+    def add(self, value):
+        if value is None:
+            return NONE
+        number = self.index.get(value)
+        if number is None:
+            number = self.index[value] = len(self.offsets) - 1
+            self.blob += value.encode('utf-8', 'surrogatepass')
+            self.offsets.append(len(self.blob))
+        return number
+
+
+def write_snapshot(model, path, source_path=None):
+    """
+    解析済みのモデル（XmiModel）をバイナリのスナップショットに書き出します。
+
+    文字列表・ノード表・要素表・関連の表・タグ付き値の表をそれぞれ4バイト整数の列で持ち、
+    読み込み時はファイルをメモリマップしてそのまま参照します。
+    source_pathを指定すると入力のサイズ・更新時刻・ハッシュを記録し、is_freshで鮮度を判定できます。
+
+    Args:
+        model (XmiModel): parse_xmi または QeaRepository が返すモデル。
+        path (str): 書き出すファイルのパス。
+        source_path (str): 生成元のXMIファイルのパス。
+
+    Returns:
+        int: 書き出したバイト数。
+    """
+    strings = _StringTable()
+    node_ids = []
+    node_index = {}
+
+    def node(xmi_id):
+        if xmi_id is None:
+            return NONE
+        number = node_index.get(xmi_id)
+        if number is None:
+            number = node_index[xmi_id] = len(node_ids)
+            node_ids.append(strings.add(xmi_id))
+        return number
+
+    element_columns = ([], [], [], [])      # ノード, 種別, 名前, ステレオタイプ
+    for xmi_id, elem in model.elements.items():
+        for column, value in zip(element_columns, (node(xmi_id), strings.add(elem.kind),
+                                                   strings.add(elem.name), strings.add(elem.stereotype))):
+            column.append(value)
+    # 依存・関連・遷移は (id, 始点, 終点, ラベル) の列で持つ（ラベルはステレオタイプ・ガード条件）
+    edge_tables = []
+    for records, label in ((model.dependencies, 'stereotype'), (model.associations, None),
+                           (model.transitions, 'condition')):
+        columns = ([], [], [], [])
+        for record in records:
+            if isinstance(record, DependencyRecord):
+                ends = (record.client, record.supplier)
+            else:
+                ends = (record.source, record.target)
+            values = (node(record.id), node(ends[0]), node(ends[1]),
+                      strings.add(getattr(record, label)) if label else NONE)
+            for column, value in zip(columns, values):
+                column.append(value)
+        edge_tables.append(columns)
+    diagram_columns = ([], [], [])
+    for diagram in model.diagrams:
+        for column, value in zip(diagram_columns, (strings.add(diagram.id), strings.add(diagram.name),
+                                                   strings.add(diagram.type))):
+            column.append(value)
+    # タグ付き値はタグごとにノード番号順に並べ、読み込み時は二分探索で引く
+    tag_columns = ([], [], [])               # タグ名, 行の開始位置, 行数
+    row_nodes, row_values = [], []
+    for tag, column in model.tagged_values.items():
+        rows = sorted((node(model.ids[source]), value) for source, value in column.items())
+        tag_columns[0].append(strings.add(tag))
+        tag_columns[1].append(len(row_nodes))
+        tag_columns[2].append(len(rows))
+        for number, value in rows:
+            row_nodes.append(number)
+            row_values.append(strings.add(value))
+    # 要素のidからノードを二分探索で引くため、idの並び順（UTF-8のバイト順）を持つ
+    id_bytes = [bytes(strings.blob[strings.offsets[s]:strings.offsets[s + 1]]) for s in node_ids]
+    id_order = sorted(range(len(node_ids)), key=id_bytes.__getitem__)
+    element_rows = [NONE] * len(node_ids)
+    for row, number in enumerate(element_columns[0]):
+        element_rows[number] = row
+
+    sections = {
+        'strings': (len(strings.offsets) - 1, [_u32(strings.offsets), bytes(strings.blob)]),
+        'nodes': (len(node_ids), [_u32(node_ids), _u32(element_rows), _u32(id_order)]),
+        'elements': (len(element_columns[0]), [_u32(c) for c in element_columns]),
+        'dependencies': (len(edge_tables[0][0]), [_u32(c) for c in edge_tables[0]]),
+        'associations': (len(edge_tables[1][0]), [_u32(c) for c in edge_tables[1]]),
+        'transitions': (len(edge_tables[2][0]), [_u32(c) for c in edge_tables[2]]),
+        'diagrams': (len(diagram_columns[0]), [_u32(c) for c in diagram_columns]),
+        'tags': (len(tag_columns[0]), [_u32(c) for c in tag_columns]),
+        'tag_rows': (len(row_nodes), [_u32(row_nodes), _u32(row_values)]),
+    }
+
+    size, mtime_ns, digest = 0, 0, bytes(32)
+    if source_path:
+        st = os.stat(source_path)
+        size, mtime_ns, digest = st.st_size, st.st_mtime_ns, file_digest(source_path)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, SNAPSHOT_VERSION, _BYTE_ORDERS[sys.byteorder], size, mtime_ns, 0, digest))
+        table_offset = f.tell()
+        f.write(bytes(_SECTION.size * len(_SECTIONS)))
+        entries = []
+        for name in _SECTIONS:
+            count, parts = sections[name]
+            # 列は8バイト境界から始め、memoryviewで整数の列としてそのまま参照できるようにする
+            f.write(bytes(-f.tell() % 8))
+            entries.append((f.tell(), count))
+            for part in parts:
+                f.write(bytes(-f.tell() % 8))
+                f.write(part)
+        written = f.tell()
+        f.seek(table_offset)
+        for offset, count in entries:
+            f.write(_SECTION.pack(offset, count))
+    os.replace(tmp_path, path)
+    return written
+
+
+def read_header(path):
+    """
+    スナップショットの先頭を読み、形式を確認します。
+
+    Returns:
+        dict: 'version', 'source_size', 'source_mtime_ns', 'source_sha256' の辞書。
+
+    Raises:
+        ValueError: スナップショットではない、または形式のバージョン・バイト順が異なる場合。
+    """
+    with open(path, 'rb') as f:
+        head = f.read(_HEADER.size)
+    return _parse_header(head, path)
+
+
+def _parse_header(head, path):
+    if len(head) < _HEADER.size:
+        raise ValueError(f"{path} はモデルのスナップショットではありません")
+    magic, version, byte_order, size, mtime_ns, _, digest = _HEADER.unpack_from(head)
+    if magic != _MAGIC:
+        raise ValueError(f"{path} はモデルのスナップショットではありません")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} はスナップショットの形式が異なります（version={version}）")
+    if byte_order != _BYTE_ORDERS[sys.byteorder]:
+        raise ValueError(f"{path} はバイト順の異なる環境で作られたスナップショットです")
+    return {'version': version, 'source_size': size, 'source_mtime_ns': mtime_ns, 'source_sha256': digest.hex()}
+
+
+def is_fresh(path, source_path):
+    """スナップショットが存在し、生成元のXMIが作成時から変わっていなければTrue"""
+    try:
+        header = read_header(path)
+        st = os.stat(source_path)
+    except (FileNotFoundError, ValueError):
+        return False
+    if header['source_size'] != st.st_size:
+        return False
+    if header['source_mtime_ns'] == st.st_mtime_ns:
+        return True
+    # 更新時刻だけが変わった（チェックアウトし直したなど）場合は内容で判定する
+    return file_digest(source_path).hex() == header['source_sha256']
+
+
+class _Records(Sequence):
+    """表の行を参照したときにレコードを作る読み取り専用のリスト"""
+
+    def __init__(self, count, make):
+        self._count = count
+        self._make = make
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self._make(i) for i in range(*row.indices(self._count))]
+        if row < 0:
+            row += self._count
+        if not 0 <= row < self._count:
+            raise IndexError(row)
+        return self._make(row)
+
+
+class _Elements(Mapping):
+    """xmi.id → ElementRecord を文書順に返す読み取り専用の辞書"""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return self._snapshot._counts['elements']
+
+    def __iter__(self):
+        snapshot = self._snapshot
+        nodes = snapshot._columns['elements'][0]
+        for row in range(len(self)):
+            yield snapshot._node_id(nodes[row])
+
+    def items(self):
+        snapshot = self._snapshot
+        nodes = snapshot._columns['elements'][0]
+        return ((snapshot._node_id(nodes[row]), snapshot._element(row)) for row in range(len(self)))
+
+    def values(self):
+        return (self._snapshot._element(row) for row in range(len(self)))
+
+    def __getitem__(self, xmi_id):
+        snapshot = self._snapshot
+        node = snapshot._node(xmi_id)
+        row = snapshot._columns['nodes'][1][node] if node is not None else NONE
+        if row == NONE:
+            raise KeyError(xmi_id)
+        return snapshot._element(row)
+
+
+class SnapshotModel:
+    """
+    メモリマップしたスナップショットを XmiModel と同じ形で参照するモデル。
+
+    ファイル全体は読み込まず、参照された行・文字列だけを取り出します（参照した文字列はキャッシュする）。
+    読み取り専用でマップするため、同じスナップショットを開いた複数のプロセスでページを共有します。
+
+    Attributes:
+        elements (Mapping): xmi.idをキーとする ElementRecord（文書順）。
+        dependencies (Sequence): DependencyRecord。
+        associations (Sequence): AssociationRecord。
+        transitions (Sequence): TransitionRecord。
+        diagrams (Sequence): DiagramRecord。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        try:
+            header = _parse_header(self._view[:_HEADER.size], path)
+        except ValueError:
+            self.close()
+            raise
+        self.header = header
+        self._counts = {}
+        self._columns = {}
+        offset = _HEADER.size
+        for name in _SECTIONS:
+            start, count = _SECTION.unpack_from(self._view, offset)
+            offset += _SECTION.size
+            self._counts[name] = count
+            self._columns[name] = self._section(name, start, count)
+        self._strings = {}      # 文字列番号 → 取り出した文字列
+        self._index = {}        # 引いたxmi.id → ノード番号
+        self._tags = None       # タグ名 → (行の開始位置, 行数)
+
+        self.elements = _Elements(self)
+        self.dependencies = _Records(self._counts['dependencies'], self._dependency)
+        self.associations = _Records(self._counts['associations'], self._association)
+        self.transitions = _Records(self._counts['transitions'], self._transition)
+        self.diagrams = _Records(self._counts['diagrams'], self._diagram)
+
+    def _section(self, name, start, count):
+        """表の各列を整数の列（memoryview）として返す"""
+        widths = {'strings': (count + 1,), 'nodes': (count,) * 3, 'elements': (count,) * 4,
+                  'dependencies': (count,) * 4, 'associations': (count,) * 4, 'transitions': (count,) * 4,
+                  'diagrams': (count,) * 3, 'tags': (count,) * 3, 'tag_rows': (count,) * 2}[name]
+        columns = []
+        offset = start
+        for length in widths:
+            offset += -offset % 8
+            columns.append(self._view[offset:offset + 4 * length].cast('I'))
+            offset += 4 * length
+        if name == 'strings':
+            offset += -offset % 8
+            self._blob_offset = offset
+        return columns
+
+    def close(self):
+        """マップを閉じる（以後このモデルは参照できない）"""
+        for columns in getattr(self, '_columns', {}).values():
+            for column in columns:
+                column.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # --- 表の参照 ---
+
+    def _string(self, number):
+        if number == NONE:
+            return None
+        value = self._strings.get(number)
+        if value is None:
+            offsets = self._columns['strings'][0]
+            start = self._blob_offset + offsets[number]
+            value = str(self._view[start:self._blob_offset + offsets[number + 1]], 'utf-8', 'surrogatepass')
+            self._strings[number] = value
+        return value
+
+    def _string_bytes(self, number):
+        offsets = self._columns['strings'][0]
+        return self._view[self._blob_offset + offsets[number]:self._blob_offset + offsets[number + 1]].tobytes()
+
+    def _node_id(self, node):
+        if node == NONE:
+            return None
+        xmi_id = self._string(self._columns['nodes'][0][node])
+        # 取り出したidは続くタグ付き値の参照で二分探索せずに引けるようにしておく
+        self._index[xmi_id] = node
+        return xmi_id
+
+    def _node(self, xmi_id):
+        """xmi.idのノード番号（スナップショットになければNone）"""
+        node = self._index.get(xmi_id)
+        if node is None and xmi_id is not None:
+            node_ids, _, order = self._columns['nodes']
+            key = xmi_id.encode('utf-8', 'surrogatepass')
+            position = bisect_left(order, key, key=lambda n: self._string_bytes(node_ids[n]))
+            if position < len(order) and self._string_bytes(node_ids[order[position]]) == key:
+                node = self._index[xmi_id] = order[position]
+        return node
+
+    def _element(self, row):
+        _, kinds, names, stereotypes = self._columns['elements']
+        return ElementRecord(self._string(kinds[row]), self._string(names[row]), self._string(stereotypes[row]))
+
+    def _edge(self, table, row):
+        ids, sources, targets, labels = self._columns[table]
+        return (self._node_id(ids[row]), self._node_id(sources[row]), self._node_id(targets[row]),
+                self._string(labels[row]))
+
+    def _dependency(self, row):
+        xmi_id, client, supplier, stereotype = self._edge('dependencies', row)
+        return DependencyRecord(xmi_id, stereotype, client, supplier)
+
+    def _association(self, row):
+        xmi_id, source, target, _ = self._edge('associations', row)
+        return AssociationRecord(xmi_id, source, target)
+
+    def _transition(self, row):
+        return TransitionRecord(*self._edge('transitions', row))
+
+    def _diagram(self, row):
+        ids, names, types = self._columns['diagrams']
+        return DiagramRecord(self._string(ids[row]), self._string(names[row]), self._string(types[row]))
+
+    # --- XmiModel と同じ参照 ---
+
+    def tagged_value(self, xmi_id, tag, default=None):
+        """要素のタグ付き値を取得する"""
+        if self._tags is None:
+            names, starts, counts = self._columns['tags']
+            self._tags = {self._string(names[i]): (starts[i], counts[i]) for i in range(len(names))}
+        rows = self._tags.get(tag)
+        node = self._node(xmi_id)
+        if rows is None or node is None:
+            return default
+        start, count = rows
+        nodes, values = self._columns['tag_rows']
+        position = bisect_left(nodes, node, start, start + count)
+        if position < start + count and nodes[position] == node:
+            return self._string(values[position])
+        return default
+
+    def tagged_value_count(self):
+        return self._counts['tag_rows']
+
+    def iter_tagged_values(self):
+        """すべてのタグ付き値を (xmi.id, タグ名, 値) で返すジェネレータ（タグ名ごとの順）"""
+        names, starts, counts = self._columns['tags']
+        nodes, values = self._columns['tag_rows']
+        for i in range(len(names)):
+            tag = self._string(names[i])
+            for row in range(starts[i], starts[i] + counts[i]):
+                yield self._node_id(nodes[row]), tag, self._string(values[row])
+
+
+def load_snapshot(path):
+    """
+    スナップショットをメモリマップして開きます。
+
+    Raises:
+        FileNotFoundError: ファイルが存在しない場合。
+        ValueError: スナップショットではない、または形式が異なる場合。
+    """
+    return SnapshotModel(path)
+
+
+def load_model(xmi_path, snapshot_dir=SNAPSHOT_DIR, write=False):
+    """
+    XMIファイルのモデルを返します。最新のスナップショットがあればそれを開き、
+    なければXMIを解析します（write=Trueなら解析した結果をスナップショットに書き出す）。
+
+    Returns:
+        XmiModel or SnapshotModel: モデル。
+    """
+    path = snapshot_path(xmi_path, snapshot_dir) if snapshot_dir else None
+    if path and is_fresh(path, xmi_path):
+        try:
+            return load_snapshot(path)
+        except (FileNotFoundError, ValueError):
+            pass
+    model = parse_xmi(xmi_path)
+    if path and write:
+        write_snapshot(model, path, xmi_path)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XMIから抽出したモデルをメモリマップで読めるバイナリのスナップショットに保存します')
+    parser.add_argument('root_dir', nargs='?', default='.', help='XMIファイルを探すディレクトリ')
+    parser.add_argument('-d', '--snapshot-dir', help=f'スナップショットの保存先（省略時は root_dir/{SNAPSHOT_DIR}）')
+    parser.add_argument('--force', action='store_true', help='最新のスナップショットも作り直す')
+    args = parser.parse_args()
+
+    from batch_extract import discover_xmi_files
+
+    start_time = time.time()
+    snapshot_dir = args.snapshot_dir or os.path.join(args.root_dir, SNAPSHOT_DIR)
+    skipped = 0
+    for xmi_path in discover_xmi_files(args.root_dir):
+        path = snapshot_path(xmi_path, snapshot_dir)
+        if not args.force and is_fresh(path, xmi_path):
+            skipped += 1
+            continue
+        size = write_snapshot(parse_xmi(xmi_path), path, xmi_path)
+        print(f"Exported: {xmi_path} -> {path} ({size:,} バイト)")
+    print(f"変更なしで省略: {skipped}件")
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+from urllib.parse import quote
+
+import instrumentation
+from xmi_parser import AssociationRecord, DependencyRecord, ElementRecord, TransitionRecord, XmiModel
+from model_extractors import EXTRACTOR_VERSION, extract_requirements, extract_use_cases, extract_activity
+from extraction_cache import DEFAULT_CACHE_FILE, ExtractionCache, write_text_atomic
+from markdown_report import REPORT_FILES, report_file_name, format_requirement_report, format_use_case_report, format_activity_report
+
+# t_object.Object_Type → XMIエクスポート時の要素種別
+_OBJECT_KINDS = {
+    'Requirement': 'ClassifierRole',
+    'Boundary': 'ClassifierRole',
+    'ActionPin': 'ClassifierRole',
+    'ObjectNode': 'ClassifierRole',
+    'Actor': 'Actor',
+    'UseCase': 'UseCase',
+    'Action': 'ActionState',
+    'Activity': 'ActionState',
+    'ActivityPartition': 'ActionState',
+    'Decision': 'PseudoState',
+    'MergeNode': 'PseudoState',
+    'StateNode': 'PseudoState',
+}
+
+# t_connector.Connector_Type → XMIエクスポート時の関連種別
+_DEPENDENCY_TYPES = ('Dependency',)
+_ASSOCIATION_TYPES = ('Association', 'Aggregation', 'Nesting')
+_TRANSITION_TYPES = ('ControlFlow', 'ObjectFlow', 'StateFlow')
+
+# 抽出範囲（パッケージまたはダイアグラム）に含まれるObject_IDを返す副問い合わせ
+_PACKAGE_SCOPE = 'SELECT Object_ID FROM t_object WHERE Package_ID = ?'
+_DIAGRAM_SCOPE = 'SELECT Object_ID FROM t_diagramobjects WHERE Diagram_ID = ?'
+# リポジトリ全体（パラメータにNoneを渡して全行を選ぶ）
+_REPOSITORY_SCOPE = 'SELECT Object_ID FROM t_object WHERE ? IS NULL'
+
+
+def ea_guid_to_xmi_id(ea_guid):
+    """ea_guid（{XXXXXXXX-...}）をXMIエクスポートのxmi.id（EAID_XXXXXXXX_...）に変換する"""
+    if not ea_guid:
+        return None
+    return 'EAID_' + ea_guid.strip('{}').replace('-', '_')
+
+
+class QeaRepository:
+    """
+    Enterprise Architectの.qea（SQLite 3）リポジトリを読み取り専用で参照します。
+    XMIエクスポートを経由せずに、parse_xmi と同じ XmiModel を組み立てます。
+    """
+
+    def __init__(self, qea_path):
+        if not os.path.exists(qea_path):
+            raise FileNotFoundError(qea_path)
+        uri = 'file:' + quote(os.path.abspath(qea_path)) + '?mode=ro'
+        self.conn = sqlite3.connect(uri, uri=True)
+        self.conn.execute('PRAGMA query_only = ON')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def find_package(self, package_name):
+        """パッケージ名からPackage_IDを返す（見つからなければNone）"""
+        row = self.conn.execute(
+            'SELECT Package_ID FROM t_package WHERE Name = ? ORDER BY Package_ID LIMIT 1',
+            (package_name,)).fetchone()
+        return row[0] if row else None
+
+    def diagrams(self):
+        """
+        リポジトリ内のダイアグラム一覧を返します。
+
+        Returns:
+            list: {'id', 'name', 'type', 'package_id', 'guid', 'modified'} の辞書のリスト。
+        """
+        rows = self.conn.execute(
+            'SELECT Diagram_ID, Name, Diagram_Type, Package_ID, ea_guid, ModifiedDate '
+            'FROM t_diagram ORDER BY Diagram_ID')
+        return [{'id': r[0], 'name': r[1], 'type': r[2], 'package_id': r[3],
+                 'guid': r[4], 'modified': r[5]} for r in rows]
+
+    def diagram_object_types(self, diagram_id):
+        """ダイアグラムに配置された要素のObject_Typeの集合を返す"""
+        rows = self.conn.execute(
+            'SELECT DISTINCT o.Object_Type FROM t_diagramobjects d '
+            'JOIN t_object o ON o.Object_ID = d.Object_ID WHERE d.Diagram_ID = ?',
+            (diagram_id,))
+        return {r[0] for r in rows}
+
+    def load_package(self, package_name):
+        """
+        パッケージ直下の要素と、それらに接続する関連からモデルを組み立てます。
+        EAのパッケージ単位のXMIエクスポートに相当します。
+
+        Raises:
+            KeyError: パッケージが見つからない場合。
+        """
+        package_id = self.find_package(package_name)
+        if package_id is None:
+            raise KeyError(f"パッケージが見つかりません: {package_name}")
+        return self.load_package_id(package_id)
+
+    def load_package_id(self, package_id):
+        """Package_IDを指定してパッケージ単位のモデルを組み立てます。"""
+        return self._load(_PACKAGE_SCOPE, package_id)
+
+    def load_diagram(self, diagram_id):
+        """ダイアグラムに配置された要素と、それらに接続する関連からモデルを組み立てます。"""
+        return self._load(_DIAGRAM_SCOPE, diagram_id)
+
+    def load_repository(self):
+        """リポジトリ内のすべての要素と関連からモデルを組み立てます。"""
+        return self._load(_REPOSITORY_SCOPE, None)
+
+    def package_version(self, package_id):
+        """
+        パッケージ範囲の行バージョンを返します。
+        抽出結果に影響する列（要素・タグ付き値・関連と、その接続先の名前と種別）の
+        SHA-256で、いずれかの行が変わると値が変わります。
+        """
+        sha = hashlib.sha256()
+        queries = (
+            ('SELECT o.Object_ID, o.Object_Type, o.Name, o.Stereotype, o.ParentID, k.Name, o.ModifiedDate '
+             'FROM t_object o LEFT JOIN t_object k ON k.Object_ID = o.Classifier '
+             f'WHERE o.Object_ID IN ({_PACKAGE_SCOPE}) ORDER BY o.Object_ID', (package_id,)),
+            ('SELECT Object_ID, Property, Value, Notes FROM t_objectproperties '
+             f'WHERE Object_ID IN ({_PACKAGE_SCOPE}) ORDER BY PropertyID', (package_id,)),
+            ('SELECT c.Connector_ID, c.Connector_Type, c.Stereotype, c.PDATA2, '
+             's.Name, s.Object_Type, e.Name, e.Object_Type '
+             'FROM t_connector c '
+             'JOIN t_object s ON s.Object_ID = c.Start_Object_ID '
+             'JOIN t_object e ON e.Object_ID = c.End_Object_ID '
+             f'WHERE c.Start_Object_ID IN ({_PACKAGE_SCOPE}) OR c.End_Object_ID IN ({_PACKAGE_SCOPE}) '
+             'ORDER BY c.Connector_ID', (package_id, package_id)),
+        )
+        for sql, params in queries:
+            for row in self.conn.execute(sql, params):
+                sha.update(repr(row).encode('utf-8'))
+        return sha.hexdigest()
+
+    def diagram_layout(self, diagram_id):
+        """
+        ダイアグラムの配置（要素の矩形と、両端が配置されている関連の経路）を返します。
+        座標はEAの図の座標系のまま（xは右、yは上が正で、図の上端が0）。
+
+        Returns:
+            dict: 'diagram'（diagrams() の1件と 'cx', 'cy', 'package'）, 'objects', 'links' をキーとする辞書。
+                  objectsは {'id', 'type', 'ntype', 'name', 'stereotype', 'classifier', 'left', 'top', 'right',
+                  'bottom', 'sequence', 'style'} のリスト、linksは {'id', 'type', 'stereotype', 'name', 'guard',
+                  'source', 'target', 'path'} のリスト。
+        """
+        row = self.conn.execute(
+            'SELECT d.Diagram_ID, d.Name, d.Diagram_Type, d.Package_ID, d.ea_guid, d.ModifiedDate, d.cx, d.cy, p.Name '
+            'FROM t_diagram d LEFT JOIN t_package p ON p.Package_ID = d.Package_ID WHERE d.Diagram_ID = ?',
+            (diagram_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"ダイアグラムが見つかりません: {diagram_id}")
+        diagram = {'id': row[0], 'name': row[1], 'type': row[2], 'package_id': row[3], 'guid': row[4],
+                   'modified': row[5], 'cx': row[6], 'cy': row[7], 'package': row[8]}
+        objects = [{'id': r[0], 'type': r[1], 'ntype': r[2] or 0, 'name': r[3], 'stereotype': r[4],
+                    'classifier': r[5], 'left': r[6], 'top': r[7], 'right': r[8], 'bottom': r[9],
+                    'sequence': r[10], 'style': r[11]}
+                   for r in self.conn.execute(
+                       'SELECT o.Object_ID, o.Object_Type, o.NType, o.Name, o.Stereotype, k.Name, '
+                       'd.RectLeft, d.RectTop, d.RectRight, d.RectBottom, d.Sequence, d.ObjectStyle '
+                       'FROM t_diagramobjects d JOIN t_object o ON o.Object_ID = d.Object_ID '
+                       'LEFT JOIN t_object k ON k.Object_ID = o.Classifier '
+                       'WHERE d.Diagram_ID = ? ORDER BY d.Sequence DESC, o.Object_ID', (diagram_id,))]
+        # EAは両端が配置された関連をすべて描く（t_diagramlinksは経路・非表示の設定のみを持つ）
+        links = [{'id': r[0], 'type': r[1], 'stereotype': r[2], 'name': r[3], 'guard': r[4],
+                  'source': r[5], 'target': r[6], 'path': r[7]}
+                 for r in self.conn.execute(
+                     'SELECT c.Connector_ID, c.Connector_Type, c.Stereotype, c.Name, c.PDATA2, '
+                     'c.Start_Object_ID, c.End_Object_ID, l.Path '
+                     'FROM t_connector c '
+                     'LEFT JOIN t_diagramlinks l ON l.ConnectorID = c.Connector_ID AND l.DiagramID = ? '
+                     f'WHERE c.Start_Object_ID IN ({_DIAGRAM_SCOPE}) AND c.End_Object_ID IN ({_DIAGRAM_SCOPE}) '
+                     'AND COALESCE(l.Hidden, 0) = 0 ORDER BY c.Connector_ID',
+                     (diagram_id, diagram_id, diagram_id))]
+        return {'diagram': diagram, 'objects': objects, 'links': links}
+
+    def layout_version(self, diagram_id, layout=None):
+        """
+        ダイアグラムの配置の行バージョン（描画結果に影響する列のSHA-256）。
+        要素の移動・名前の変更・関連の追加や経路の変更で値が変わります。
+        layoutに diagram_layout の結果を渡すと、読み直さずに計算します。
+        """
+        if layout is None:
+            layout = self.diagram_layout(diagram_id)
+        # 更新日時は配置を変えずに保存しただけでも変わるため含めない
+        diagram = {key: value for key, value in layout['diagram'].items() if key != 'modified'}
+        sha = hashlib.sha256()
+        sha.update(repr((sorted(diagram.items()), layout['objects'], layout['links'])).encode('utf-8'))
+        return sha.hexdigest()
+
+    @instrumentation.traced('qea.load')
+    def _load(self, scope_sql, scope_id):
+        model = XmiModel()
+        set_tagged_value = model.set_tagged_value
+        object_ids = {}
+
+        # 要素（t_object）
+        rows = self.conn.execute(
+            'SELECT o.Object_ID, o.Object_Type, o.NType, o.Name, o.Stereotype, o.ea_guid, p.ea_guid, k.Name '
+            'FROM t_object o '
+            'LEFT JOIN t_object p ON p.Object_ID = o.ParentID '
+            'LEFT JOIN t_object k ON k.Object_ID = o.Classifier '
+            f'WHERE o.Object_ID IN ({scope_sql}) ORDER BY o.Object_ID',
+            (scope_id,))
+        for object_id, object_type, ntype, name, stereotype, guid, parent_guid, classname in rows:
+            kind = _OBJECT_KINDS.get(object_type)
+            xmi_id = ea_guid_to_xmi_id(guid)
+            if kind is None or xmi_id is None:
+                continue
+            xmi_id = object_ids[object_id] = model.shared_id(xmi_id)
+            model.elements[xmi_id] = ElementRecord(kind, name, stereotype)
+            set_tagged_value(xmi_id, 'ea_stype', object_type)
+            set_tagged_value(xmi_id, 'ea_ntype', str(ntype or 0))
+            if parent_guid:
+                set_tagged_value(xmi_id, 'owner', model.shared_id(ea_guid_to_xmi_id(parent_guid)))
+            if classname:
+                set_tagged_value(xmi_id, 'classname', classname)
+
+        # 要素のタグ付き値（t_objectproperties）。メモ型の値はNotesに本文が入る
+        rows = self.conn.execute(
+            'SELECT Object_ID, Property, Value, Notes FROM t_objectproperties '
+            f'WHERE Object_ID IN ({scope_sql})',
+            (scope_id,))
+        for object_id, prop, value, notes in rows:
+            if object_id in object_ids:
+                set_tagged_value(object_ids[object_id], prop, notes if value == '<memo>' else value)
+
+        # 関連（t_connector）。範囲内の要素を一端に持つものを対象とする
+        rows = self.conn.execute(
+            'SELECT c.Connector_Type, c.Stereotype, c.PDATA2, c.ea_guid, '
+            's.Name, s.Object_Type, s.ea_guid, e.Name, e.Object_Type, e.ea_guid '
+            'FROM t_connector c '
+            'JOIN t_object s ON s.Object_ID = c.Start_Object_ID '
+            'JOIN t_object e ON e.Object_ID = c.End_Object_ID '
+            f'WHERE c.Start_Object_ID IN ({scope_sql}) OR c.End_Object_ID IN ({scope_sql}) '
+            'ORDER BY c.Connector_ID',
+            (scope_id, scope_id))
+        for (conn_type, stereotype, guard, guid,
+             source_name, source_type, source_guid,
+             target_name, target_type, target_guid) in rows:
+            conn_id = model.shared_id(ea_guid_to_xmi_id(guid))
+            source_id = model.shared_id(ea_guid_to_xmi_id(source_guid))
+            target_id = model.shared_id(ea_guid_to_xmi_id(target_guid))
+            if conn_type in _TRANSITION_TYPES:
+                model.transitions.append(TransitionRecord(conn_id, source_id, target_id, guard or None))
+                continue
+            if conn_type in _DEPENDENCY_TYPES:
+                model.dependencies.append(DependencyRecord(conn_id, stereotype, source_id, target_id))
+            elif conn_type in _ASSOCIATION_TYPES:
+                model.associations.append(AssociationRecord(conn_id, source_id, target_id))
+            else:
+                continue
+            set_tagged_value(conn_id, 'ea_type', conn_type)
+            set_tagged_value(conn_id, 'ea_sourceName', source_name)
+            set_tagged_value(conn_id, 'ea_targetName', target_name)
+            set_tagged_value(conn_id, 'ea_sourceType', source_type)
+            set_tagged_value(conn_id, 'ea_targetType', target_type)
+
+        instrumentation.count('qea.elements', len(model.elements))
+        instrumentation.count('qea.tagged_values_indexed', model.tagged_value_count())
+        return model
+
+
+def diagram_kind(repo, diagram):
+    """ダイアグラムを抽出対象の種別（'requirement' / 'use_case' / 'activity'）に分類する"""
+    if diagram['type'] == 'Use Case':
+        return 'use_case'
+    if diagram['type'] == 'Activity':
+        return 'activity'
+    if 'Requirement' in repo.diagram_object_types(diagram['id']):
+        return 'requirement'
+    return None
+
+
+def diagram_output_path(diagram, kind):
+    """ダイアグラムのMarkdown出力先（相対パス）。検証項目が参照するファイル名に合わせる"""
+    return os.path.join(REPORT_FILES[kind][0], report_file_name(kind, diagram['name']))
+
+
+def diagram_report(repo, diagram, kind):
+    """
+    ダイアグラムから抽出したMarkdownを返します。
+    抽出範囲はXMIエクスポートと同じくダイアグラムを所有するパッケージとします。
+    """
+    model = repo.load_package_id(diagram['package_id'])
+    if kind == 'requirement':
+        return format_requirement_report(*extract_requirements(model))
+    if kind == 'use_case':
+        return format_use_case_report(*extract_use_cases(model))
+    return format_activity_report(*extract_activity(model))
+
+
+def extract_requirement_info_from_qea(qea_path, package_name='要求図'):
+    """.qeaのパッケージから要求と関連を抽出します（extract_requirement_info_from_xmiと同じ形式）"""
+    with QeaRepository(qea_path) as repo:
+        return extract_requirements(repo.load_package(package_name))
+
+
+def extract_use_case_info_from_qea(qea_path, package_name='ユースケース図'):
+    """.qeaのパッケージからユースケース情報を抽出します（extract_use_case_info_from_xmiと同じ形式）"""
+    with QeaRepository(qea_path) as repo:
+        return extract_use_cases(repo.load_package(package_name))
+
+
+def extract_activity_info_from_qea(qea_path, package_name='アクティビティ図_ユースケース'):
+    """.qeaのパッケージからアクティビティ図の要素・パーティション・フローを抽出します"""
+    with QeaRepository(qea_path) as repo:
+        return extract_activity(repo.load_package(package_name))
+
+
+def export_diagrams(qea_path, output_dir='.', cache=None, force=False):
+    """
+    .qeaのダイアグラムごとにMarkdownを出力します。
+    .qeaファイル自体、またはダイアグラムのパッケージの行バージョンが前回と同じなら出力を省略します。
+
+    Args:
+        qea_path (str): .qeaファイルのパス。
+        output_dir (str): Markdownの出力先ディレクトリ。
+        cache (ExtractionCache): 抽出キャッシュ（呼び出し側で保存する）。
+        force (bool): Trueならキャッシュを無視してすべて再生成する。
+
+    Returns:
+        tuple: (written, skipped) のタプル。writtenは書き出したMarkdownのパスのリスト、skippedは省略した件数。
+    """
+    if cache is None:
+        cache = ExtractionCache()
+    # .qeaファイル自体が前回から変わっていなければ、行バージョンを計算せずに省略できる
+    file_key = cache.file_key(qea_path)
+    written = []
+    skipped = 0
+    with QeaRepository(qea_path) as repo:
+        for diagram in repo.diagrams():
+            kind = diagram_kind(repo, diagram)
+            if kind is None:
+                continue
+            output_path = os.path.join(output_dir, diagram_output_path(diagram, kind))
+            if not force and cache.is_fresh(output_path, file_key):
+                skipped += 1
+                continue
+            row_key = f"{EXTRACTOR_VERSION}:{repo.package_version(diagram['package_id'])}"
+            if not force and cache.is_fresh(output_path, row_key):
+                cache.record(output_path, file_key, row_key)
+                skipped += 1
+                continue
+            write_text_atomic(output_path, diagram_report(repo, diagram, kind))
+            cache.record(output_path, file_key, row_key)
+            written.append(output_path)
+            print(f"Exported: {diagram['name']} -> {output_path}")
+    return written, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='.qeaリポジトリから図の構成要素を抽出してMarkdownを出力します')
+    parser.add_argument('qea_file', nargs='?', default='自動販売機.qea', help='.qeaファイルのパス')
+    parser.add_argument('-o', '--output-dir', default='.', help='Markdownの出力先ディレクトリ')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE, help='抽出キャッシュのファイル')
+    parser.add_argument('--force', action='store_true', help='キャッシュを無視してすべて再生成する')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+
+    with instrumentation.tracing(args.trace):
+        cache = ExtractionCache(args.cache_file)
+        _, skipped = export_diagrams(args.qea_file, args.output_dir, cache, args.force)
+        cache.save()
+    print(f"変更なしで省略: {skipped}件")
+
+
+if __name__ == '__main__':
+    main()
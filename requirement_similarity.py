@@ -0,0 +1,350 @@
+import argparse
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+import instrumentation
+
+# 文字n-gramの長さ（日本語は単語の区切りがないため、形態素解析なしで使える文字の2-gramを既定にする）
+DEFAULT_NGRAM = 2
+# MinHashの署名の長さ（ハッシュ関数の数）と、LSHの帯の数（1つの帯は署名の PERMUTATIONS / BANDS 個）。
+# 3個ずつ32帯では、類似度0.4の組が候補になる確率は約0.88、0.5では約0.99、0.2では約0.23になる
+DEFAULT_PERMUTATIONS = 96
+DEFAULT_BANDS = 32
+# 候補として報告する類似度（文字n-gramの集合のJaccard係数）の下限
+DEFAULT_THRESHOLD = 0.4
+# 1つのバケットに入る要求がこれより多い帯は、定型文による一致とみなして候補にしない（組の数が2乗で増えるため）
+DEFAULT_MAX_BUCKET = 50
+
+# 署名を保存するファイル（モデルのディレクトリに作る）
+INDEX_FILE = '.requirement_similarity.npz'
+INDEX_VERSION = 1
+
+# ハッシュ関数 h(x) = ((a*x + b) mod 2^64) >> 32（乗算シフト法。aは奇数。剰余を使わないため速い）
+_SHIFT = np.uint64(32)
+# 文字n-gramの符号（1文字21ビットを並べた整数）を32ビットにする乗算ハッシュの係数
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+# 帯の値を1つの整数にまとめる係数（FNV）
+_FNV_PRIME = np.uint64(0x100000001B3)
+# 文字n-gramのない要求の署名（ハッシュ値は2^32未満なので、どの要求とも一致しない）
+_EMPTY = np.uint64(1 << 32)
+# MinHashの計算で一度に作る配列の要素数の上限（メモリ使用量を抑える）
+_CHUNK_ELEMENTS = 1 << 23
+
+# 署名の一致率（Jaccard係数の推定値。署名96個での標準偏差は約0.05）がこれ以上下限を下回る組は確かめずに除く
+_ESTIMATE_MARGIN = 0.15
+
+# 空白・記号（日本語の文字は\wに含まれる）
+_IGNORED = re.compile(r'[\W_]+')
+
+
+def _unique(values):
+    """整数の配列を並べて重複を除く（np.unique より速い並べ替えだけの版）"""
+    values = np.sort(values)
+    return values[np.concatenate([[True], values[1:] != values[:-1]])] if len(values) else values
+
+
+def normalize(text):
+    """全角・半角と大文字・小文字をそろえ、空白と記号を除く"""
+    return _IGNORED.sub('', unicodedata.normalize('NFKC', text or '').lower())
+
+
+def shingle_hashes(texts, ngram=DEFAULT_NGRAM):
+    """
+    正規化済みの文字列それぞれの文字n-gramを32ビットのハッシュ値にします。
+    すべての文字列をつないだ符号位置の配列から一括で計算します（ngramより短い文字列は全体を1つのn-gramにする）。
+
+    Returns:
+        tuple: (doc_ids, hashes) のタプル。文字列の番号とハッシュ値の配列で、文字列ごとに重複を除いて番号順に並ぶ。
+    """
+    if not 1 <= ngram <= 3:
+        raise ValueError("ngramは1〜3で指定してください")
+    pad = '\0' * (ngram - 1)
+    lengths = np.array([len(text) for text in texts], dtype=np.int64)
+    codes = np.frombuffer((pad.join(texts) + pad).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    spans = lengths + len(pad)
+    starts = np.cumsum(spans) - spans
+    doc_of = np.repeat(np.arange(len(texts)), spans)
+    offsets = np.arange(len(codes)) - starts[doc_of]
+    # n-gramの開始位置（文字列の最後のn-gramまで。空の文字列はn-gramを持たない）
+    valid = (offsets <= np.maximum(lengths - ngram, 0)[doc_of]) & (lengths > 0)[doc_of]
+    positions = np.flatnonzero(valid)
+    keys = codes[positions]
+    for k in range(1, ngram):
+        keys = keys | (codes[positions + k] << np.uint64(21 * k))
+    hashes = (keys * _GOLDEN) >> _SHIFT
+    combined = _unique((doc_of[positions].astype(np.uint64) << np.uint64(32)) | hashes)
+    return (combined >> np.uint64(32)).astype(np.int64), combined & np.uint64(0xFFFFFFFF)
+
+
+def minhash(doc_ids, hashes, count, a, b):
+    """
+    文字列ごとのMinHashの署名（count × len(a) の配列）を計算します。
+    ハッシュ関数ごとに全n-gramの値を求め、文字列の区切りごとの最小値を np.minimum.reduceat でとります。
+    """
+    signatures = np.full((count, len(a)), _EMPTY, dtype=np.uint64)
+    if not len(hashes):
+        return signatures
+    # doc_ids は番号順に並んでいるので、値が変わる位置が文字列の区切りになる
+    starts = np.flatnonzero(np.concatenate([[True], doc_ids[1:] != doc_ids[:-1]]))
+    present = doc_ids[starts]
+    chunk = max(1, _CHUNK_ELEMENTS // len(hashes))
+    for lo in range(0, len(a), chunk):
+        values = (a[lo:lo + chunk, None] * hashes[None, :] + b[lo:lo + chunk, None]) >> _SHIFT
+        signatures[present, lo:lo + chunk] = np.minimum.reduceat(values, starts, axis=1).T
+    return signatures
+
+
+def lsh_pairs(signatures, bands, max_bucket=DEFAULT_MAX_BUCKET):
+    """
+    署名を帯に分け、いずれかの帯が一致する行の組（i < j）を返します。
+    帯ごとに値をまとめた整数で並べ替え、同じ値が続く区間（バケット）の中だけで組を作るため、
+    計算量は行数 × 帯の数（とバケット内の組の数）に比例します。
+
+    Returns:
+        ndarray: (組の数, 2) の整数配列。重複は除く。
+    """
+    count, permutations = signatures.shape
+    rows = permutations // bands
+    indexes = np.flatnonzero(signatures[:, 0] != _EMPTY)
+    keys = []
+    for band in range(bands):
+        block = signatures[indexes, band * rows:(band + 1) * rows]
+        values = np.zeros(len(indexes), dtype=np.uint64)
+        for column in block.T:
+            values = (values * _FNV_PRIME) ^ column
+        order = np.argsort(values, kind='stable')
+        sorted_values = values[order]
+        run_starts = np.flatnonzero(np.concatenate([[True], sorted_values[1:] != sorted_values[:-1]]))
+        run_lengths = np.diff(np.concatenate([run_starts, [len(order)]]))
+        instrumentation.count('similarity.skipped_buckets', int((run_lengths > max_bucket).sum()))
+        # 同じ大きさのバケットをまとめて (バケット数 × 大きさ) の配列にし、組を一度に作る
+        for length in np.unique(run_lengths[(run_lengths > 1) & (run_lengths <= max_bucket)]).tolist():
+            members = np.sort(indexes[order[run_starts[run_lengths == length][:, None] + np.arange(length)]], axis=1)
+            first, second = np.triu_indices(length, 1)
+            keys.append((members[:, first] * count + members[:, second]).ravel())
+    if not keys:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.stack(np.divmod(_unique(np.concatenate(keys)), count), axis=1)
+
+
+def shingles(text, ngram=DEFAULT_NGRAM):
+    """正規化済みの文字列の文字n-gramの集合（shingle_hashes と同じく、短い文字列は全体を1つにする）"""
+    return {text[i:i + ngram] for i in range(max(len(text) - ngram, 0) + 1)} if text else set()
+
+
+def jaccard(first, second):
+    """2つの集合のJaccard係数"""
+    return len(first & second) / len(first | second) if first or second else 0.0
+
+
+def estimate_similarity(signatures, pairs):
+    """行の組ごとの署名の一致率（Jaccard係数の推定値）"""
+    estimates = np.empty(len(pairs))
+    chunk = max(1, _CHUNK_ELEMENTS // signatures.shape[1])
+    for lo in range(0, len(pairs), chunk):
+        block = pairs[lo:lo + chunk]
+        estimates[lo:lo + chunk] = (signatures[block[:, 0]] == signatures[block[:, 1]]).mean(axis=1)
+    return estimates
+
+
+class SimilarityIndex:
+    """
+    要求の文字n-gramのMinHash署名を保持し、LSHで類似した要求の組の候補を求める索引。
+    update で要求の集合を渡すと、追加・変更された要求の署名だけを計算し直します。
+
+    Attributes:
+        keys (list): 要求のキー（xmi.idなど）。signatures の行の順。
+        texts (list): 正規化済みの文字列。
+        signatures (ndarray): 要求ごとのMinHash署名（len(keys) × permutations）。
+    """
+
+    def __init__(self, ngram=DEFAULT_NGRAM, permutations=DEFAULT_PERMUTATIONS, bands=DEFAULT_BANDS, seed=0):
+        if permutations % bands:
+            raise ValueError("署名の長さは帯の数で割り切れる値にしてください")
+        self.ngram = ngram
+        self.permutations = permutations
+        self.bands = bands
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 1 << 64, size=permutations, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 64, size=permutations, dtype=np.uint64, endpoint=False)
+        self.keys = []
+        self.texts = []
+        self.signatures = np.empty((0, permutations), dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def params(self):
+        return {'ngram': self.ngram, 'permutations': self.permutations, 'bands': self.bands, 'seed': self.seed}
+
+    def update(self, texts):
+        """
+        索引を要求の集合に合わせます。
+
+        Args:
+            texts (dict): 要求のキー → 文字列（正規化前）。
+
+        Returns:
+            tuple: (added, changed, removed) のタプル。それぞれ要求のキーのリスト。
+        """
+        normalized = {key: normalize(text) for key, text in texts.items()}
+        rows = {key: i for i, key in enumerate(self.keys)}
+        removed = [key for key in self.keys if key not in normalized]
+        changed = [key for key, text in normalized.items() if key in rows and self.texts[rows[key]] != text]
+        added = [key for key in normalized if key not in rows]
+        if not (removed or changed or added):
+            return added, changed, removed
+        stale = set(removed) | set(changed)
+        kept = [i for i, key in enumerate(self.keys) if key not in stale]
+        fresh = changed + added
+        with instrumentation.span('similarity.minhash', count=len(fresh)):
+            fresh_texts = [normalized[key] for key in fresh]
+            doc_ids, hashes = shingle_hashes(fresh_texts, self.ngram)
+            fresh_signatures = minhash(doc_ids, hashes, len(fresh), self._a, self._b)
+        self.keys = [self.keys[i] for i in kept] + fresh
+        self.texts = [self.texts[i] for i in kept] + fresh_texts
+        self.signatures = np.concatenate([self.signatures[kept], fresh_signatures])
+        return added, changed, removed
+
+    def candidates(self, threshold=DEFAULT_THRESHOLD, keys=None, max_bucket=DEFAULT_MAX_BUCKET):
+        """
+        類似した要求の組を求めます。LSHで候補の組を選び、文字n-gramのJaccard係数で確かめます。
+
+        Args:
+            threshold (float): 報告する類似度の下限。
+            keys (iterable): 指定したらこれらの要求を含む組だけを返す（変更された要求の再確認など）。
+            max_bucket (int): これより多くの要求が入るバケットは候補にしない。
+
+        Returns:
+            list: (キー1, キー2, 類似度) のリスト。類似度の高い順。
+        """
+        with instrumentation.span('similarity.lsh', count=len(self.keys)):
+            pairs = lsh_pairs(self.signatures, self.bands, max_bucket)
+        if keys is not None:
+            rows = {key: i for i, key in enumerate(self.keys)}
+            selected = np.zeros(len(self.keys), dtype=bool)
+            selected[[rows[key] for key in keys if key in rows]] = True
+            pairs = pairs[selected[pairs[:, 0]] | selected[pairs[:, 1]]]
+        instrumentation.count('similarity.candidates', len(pairs))
+        pairs = pairs[estimate_similarity(self.signatures, pairs) >= threshold - _ESTIMATE_MARGIN]
+        sets = {}
+        results = []
+        for i, j in pairs.tolist():
+            for row in (i, j):
+                if row not in sets:
+                    sets[row] = shingles(self.texts[row], self.ngram)
+            similarity = jaccard(sets[i], sets[j])
+            if similarity >= threshold:
+                results.append((self.keys[i], self.keys[j], similarity))
+        results.sort(key=lambda item: (-item[2], item[0], item[1]))
+        return results
+
+    def save(self, path):
+        """索引をファイルに保存する"""
+        with open(path, 'wb') as f:
+            np.savez(f, version=INDEX_VERSION, params=np.array(list(self.params().values()), dtype=np.int64),
+                     keys=np.array(self.keys, dtype=str), texts=np.array(self.texts, dtype=str),
+                     signatures=self.signatures)
+
+    @classmethod
+    def load(cls, path, **params):
+        """
+        保存した索引を読み込みます。
+        ファイルがない・形式が古い・パラメータが異なる場合は空の索引を返します（署名はupdateで計算し直す）。
+        """
+        index = cls(**params)
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != INDEX_VERSION or \
+                        data['params'].tolist() != list(index.params().values()):
+                    return index
+                index.keys = data['keys'].tolist()
+                index.texts = data['texts'].tolist()
+                index.signatures = data['signatures']
+        except (OSError, KeyError, ValueError) as e:
+            if os.path.exists(path):
+                print(f"類似度の索引を読み込めませんでした（作り直します）: {e}")
+        return index
+
+
+def requirement_texts(facts):
+    """要求のxmi.id → 類似度の判定に使う文字列（要求名と要求テキスト）"""
+    return {xmi_id: f"{req['name']} {req['text'] or ''}" for xmi_id, req in facts['requirements'].items()}
+
+
+# ルールから使う索引（プロセス内で共有し、要求が変わったときは変更分だけ計算し直す）
+_index = None
+_lock = threading.Lock()
+
+
+def similar_requirements(facts, threshold=DEFAULT_THRESHOLD):
+    """
+    rule_checks.load_model_facts の結果から、類似した要求の組を求めます。
+
+    Returns:
+        list: (xmi.id 1, xmi.id 2, 類似度) のリスト。類似度の高い順。
+    """
+    global _index
+    with _lock:
+        if _index is None:
+            _index = SimilarityIndex()
+        _index.update(requirement_texts(facts))
+        return _index.candidates(threshold)
+
+
+def format_pairs(pairs, requirements):
+    """類似した要求の組をMarkdownの表にする"""
+    lines = ["| 類似度 | 要求1 | 要求2 |", "|---|---|---|"]
+    for first, second, similarity in pairs:
+        cells = [f"{requirements[key]['id'] or '（IDなし）'} {requirements[key]['name']}（{requirements[key]['text'] or ''}）"
+                 .replace('|', '\\|') for key in (first, second)]
+        lines.append(f"| {similarity:.2f} | {cells[0]} | {cells[1]} |")
+    return '\n'.join(lines)
+
+
+def main():
+    import rule_checks
+
+    parser = argparse.ArgumentParser(description='要求名と要求テキストの文字n-gramのMinHash/LSHで、'
+                                                 '重複・矛盾の候補となる類似した要求の組を求めます')
+    parser.add_argument('root_dir', nargs='?', default='.', help='モデルのディレクトリ')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='報告する類似度（Jaccard係数）の下限')
+    parser.add_argument('--ngram', type=int, default=DEFAULT_NGRAM, choices=[1, 2, 3], help='文字n-gramの長さ')
+    parser.add_argument('--permutations', type=int, default=DEFAULT_PERMUTATIONS, help='MinHashの署名の長さ')
+    parser.add_argument('--bands', type=int, default=DEFAULT_BANDS, help='LSHの帯の数')
+    parser.add_argument('--changed', action='store_true', help='前回の索引から追加・変更された要求を含む組だけを表示する')
+    parser.add_argument('--no-index', action='store_true', help=f'索引（{INDEX_FILE}）を読み書きしない')
+    parser.add_argument('-o', '--output', help='結果のMarkdownの出力先（省略時は標準出力）')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    index_path = os.path.join(args.root_dir, INDEX_FILE)
+    params = {'ngram': args.ngram, 'permutations': args.permutations, 'bands': args.bands}
+    with instrumentation.tracing(args.trace):
+        facts = rule_checks.load_model_facts(args.root_dir)
+        index = SimilarityIndex(**params) if args.no_index else SimilarityIndex.load(index_path, **params)
+        added, changed, removed = index.update(requirement_texts(facts))
+        print(f"要求: {len(index)}件（追加 {len(added)}件, 変更 {len(changed)}件, 削除 {len(removed)}件）")
+        pairs = index.candidates(args.threshold, added + changed if args.changed else None)
+        if not args.no_index:
+            index.save(index_path)
+    report = f"# 類似した要求の組（{len(pairs)}件）\n\n{format_pairs(pairs, facts['requirements'])}\n"
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Exported: {args.output}")
+    else:
+        print(report)
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
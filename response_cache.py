@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import time
+
+from extraction_cache import write_text_atomic
+
+DEFAULT_CACHE_DIR = '.llm_cache'
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+def file_sha256(path):
+    """ファイル内容のSHA-256（ファイルがなければNone）"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def cache_key(model, temperature, max_tokens, system_prompt, prompt_text, files, root_dir='.', **options):
+    """
+    応答キャッシュのキーを返します。
+
+    Args:
+        model (str): モデル名。
+        temperature (float): 温度。
+        max_tokens (int): 最大出力トークン数。
+        system_prompt (str): システムメッセージ。
+        prompt_text (str): ./プロンプト/ から読み出したプロンプト本文。
+        files (list): コンテキストに含めるファイルのパス。各ファイルの内容ハッシュをキーに含めます。
+        root_dir (str): filesの基準ディレクトリ（キーには相対パスと内容ハッシュだけを含めます）。
+        **options: 結果に影響するその他の設定（コンテキストの上限トークン数など）。
+
+    Returns:
+        str: SHA-256の16進文字列。
+    """
+    material = {
+        'model': model,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+        'system': system_prompt,
+        'prompt': prompt_text,
+        'files': [[path, file_sha256(os.path.join(root_dir, path))] for path in files],
+        'options': options,
+    }
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    LLMの検証結果を保存する永続キャッシュ。
+
+    キー1件につき <cache_dir>/<key>.json を1ファイル作ります。
+    保存から max_age_days を過ぎたエントリは無効とし、合計サイズが max_bytes を超えたら
+    最後に使われた時刻（ファイルの更新時刻）が古い順に削除します。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 60 * 60
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        """キャッシュ済みの結果を返す（なければ、または期限切れならNone）"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - entry.get('created', 0) > self.max_age:
+            self._remove(path)
+            return None
+        # 使われたエントリを削除対象の後ろに回す
+        os.utime(path)
+        return entry['result']
+
+    def put(self, key, result, **meta):
+        """結果を保存し、必要なら古いエントリを削除する"""
+        entry = dict(meta, created=time.time(), result=result)
+        write_text_atomic(self._path(key), json.dumps(entry, ensure_ascii=False))
+        self.evict()
+
+    def evict(self):
+        """期限切れのエントリと、合計サイズの上限を超えた分の古いエントリを削除する"""
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+        except FileNotFoundError:
+            return
+        now = time.time()
+        entries = []
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            # 作成時刻はファイルに記録しているが、読まずに済むよう更新時刻で期限を判定する
+            if now - st.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """すべてのエントリを削除する"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith('.json'):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,522 @@
+import argparse
+import os
+import re
+import time
+
+import file_cache
+import instrumentation
+import state_machine_sim
+from check_registry import FILE_GROUPS
+from model_snapshot import SNAPSHOT_DIR, load_model
+from model_extractors import extract_requirements, extract_use_cases, extract_activity
+from batch_extract import discover_xmi_files, diagram_kinds, is_xmi_file
+from model_graph import ASSOCIATION, build_model_graph
+from markdown_report import REPORT_FILES
+
+USE_CASE_DESCRIPTION_DIR = './ユースケース記述'
+
+# EAのノード種別（ea_ntype）：開始ノード、終了ノード、フロー終了
+_INITIAL_NTYPE = '100'
+_FINAL_NTYPES = ('101', '102')
+
+# 要求を詳細化・充足する関連（ユースケース → 要求）
+_TRACE_TYPES = ('refine', 'satisfy', 'trace', 'verify')
+# 要求同士の派生・包含（下位 → 上位）
+_DERIVE_TYPES = ('deriveReqt', 'Nesting')
+
+_USE_CASE_ID = re.compile(r'^UC\d+\s+')
+
+# 事前チェック結果をプロンプトに含めるときの見出し
+FACTS_HEADER = ("## ルールベースの事前チェック結果（確定済みの事実）\n"
+                "以下はモデルから機械的に判定した結果です。これらは再検証せず事実として扱い、"
+                "ここで判定できない意味的な観点（命名・記述内容の妥当性、ドキュメント間の意味の整合など）の検証に集中してください。")
+
+
+def use_case_title(name):
+    """ユースケース名から先頭のID（UC1 など）を除く"""
+    return _USE_CASE_ID.sub('', name)
+
+
+def finding(rule, severity, message, elements=()):
+    """事前チェックの指摘1件"""
+    return {'rule': rule, 'severity': severity, 'elements': list(elements), 'message': message}
+
+
+def load_model_facts(root_dir='.'):
+    """
+    ディレクトリ配下のXMIファイルを解析し、ルールの判定に使う抽出結果をまとめます。
+    root_dir/.model_snapshots に最新のスナップショットがあるXMIは解析せずに開きます。
+
+    Returns:
+        dict: 'requirements', 'relationships', 'actors', 'use_cases', 'associations',
+              'activities'（図の名前 → {'model', 'elements'}）, 'descriptions',
+              'graph'（すべての図を統合したModelGraph）,
+              'state_machines'（状態遷移図から組み立てた state_machine_sim.StateMachine のリスト）,
+              'fmea'（load_fmea の項目のリスト）をキーとする辞書。
+              追跡行列は要求カバレッジとリスク対応カバレッジのルールが最初に使ったときに 'traceability' に作る。
+              XMI・ユースケース記述・状態遷移図・FMEAが前回から変わっていなければ前回の辞書を共有して返す（変更しないこと）。
+    """
+    xmi_files = discover_xmi_files(root_dir)
+    description_dir = os.path.join(root_dir, USE_CASE_DESCRIPTION_DIR)
+    state_machine_files = [os.path.join(root_dir, path) for path in FILE_GROUPS['statemachine'] + FILE_GROUPS['fmea']]
+    # ユースケース記述はファイル名だけを使うため、ディレクトリの更新時刻（追加・削除で変わる）で判定する
+    return file_cache.cached(('model_facts', os.path.abspath(root_dir)),
+                             xmi_files + [description_dir] + state_machine_files,
+                             lambda: _load_model_facts(root_dir, xmi_files, description_dir))
+
+
+def _load_model_facts(root_dir, xmi_files, description_dir):
+    facts = {'requirements': {}, 'relationships': [], 'actors': [], 'use_cases': [],
+             'associations': [], 'activities': {}, 'descriptions': set()}
+    models = []
+    for xmi_path in xmi_files:
+        model = load_model(xmi_path, os.path.join(root_dir, SNAPSHOT_DIR))
+        models.append(model)
+        kinds = diagram_kinds(model)
+        if 'requirement' in kinds:
+            requirements, relationships = extract_requirements(model)
+            facts['requirements'].update(requirements)
+            facts['relationships'].extend(relationships)
+        if 'use_case' in kinds:
+            actors, use_cases, _, associations = extract_use_cases(model)
+            facts['actors'] = sorted(set(facts['actors']) | set(actors))
+            facts['use_cases'] = sorted(set(facts['use_cases']) | set(use_cases))
+            facts['associations'] = sorted(set(facts['associations']) | set(associations))
+        if 'activity' in kinds:
+            elements, _, _ = extract_activity(model)
+            names = [d.name for d in model.diagrams if d.type == 'ActivityDiagram']
+            name = names[0] if names else os.path.splitext(os.path.basename(xmi_path))[0]
+            facts['activities'][name] = {'model': model, 'elements': elements}
+    facts['graph'] = build_model_graph(models)
+    facts['state_machines'] = state_machine_sim.load_state_machines(root_dir)
+    facts['fmea'] = load_fmea(root_dir)
+
+    if os.path.isdir(description_dir):
+        facts['descriptions'] = {os.path.splitext(name)[0] for name in os.listdir(description_dir)
+                                 if name.endswith('.md') and not name.endswith('_アクティビティ図.md')}
+    return facts
+
+
+def parse_fmea(text):
+    """
+    FMEA（Markdownの表）から項目を取り出します。
+
+    Returns:
+        list: (項目ID, 行の全セルを連結した文字列) のリスト。項目IDは行の最初のセル。
+    """
+    items = []
+    header_seen = False
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith('|'):
+            header_seen = False
+            continue
+        cells = [cell.strip() for cell in line.strip('|').split('|')]
+        if all(set(cell) <= set('-: ') for cell in cells):
+            header_seen = True
+            continue
+        if header_seen and cells and cells[0]:
+            items.append((cells[0], ' '.join(cells)))
+    return items
+
+
+def load_fmea(root_dir='.'):
+    """検証対象ファイルの定義（fmea）のFMEAを読み込み、項目のリストを返す（ファイルがなければ空）"""
+    items = []
+    for path in FILE_GROUPS['fmea']:
+        try:
+            items.extend(parse_fmea(file_cache.read_text(os.path.join(root_dir, path))))
+        except FileNotFoundError:
+            continue
+    return items
+
+
+def _traceability(facts):
+    """
+    追跡行列（traceability_matrix.TraceabilityMatrix）。要求カバレッジとリスク対応カバレッジのルールで共有するため、
+    最初に使ったときに1回だけ作ってfactsに入れる（NumPyの読み込みもそのときまで遅らせる）。
+    """
+    if 'traceability' not in facts:
+        import traceability_matrix
+        facts['traceability'] = traceability_matrix.build_traceability(facts)
+    return facts['traceability']
+
+
+# --- 要求図・ユースケース図のルール ---
+
+def _requirement_names(facts):
+    return {req['name'] for req in facts['requirements'].values()}
+
+
+def rule_requirement_without_use_case(facts):
+    """末端の要求（下位要求を持たない要求）のうち、どのユースケースからも詳細化されていないもの"""
+    graph = facts['graph']
+    findings = []
+    for xmi_id, req in sorted(facts['requirements'].items(), key=lambda item: item[1]['id'] or ''):
+        if graph.neighbors(xmi_id, _DERIVE_TYPES, reverse=True):
+            continue
+        sources = graph.neighbors(xmi_id, _TRACE_TYPES, reverse=True)
+        if not any(graph.node(source)['kind'] == 'UseCase' for source in sources):
+            findings.append(finding('要求カバレッジ', 'warning',
+                                    f"要求 {req['id']} 「{req['name']}」を詳細化するユースケースがありません", [xmi_id]))
+    return findings
+
+
+def rule_requirement_coverage(facts):
+    """下位要求を持つ要求のうち、末端の要求の一部またはすべてがユースケースで詳細化されていないもの（カバレッジ率）"""
+    matrix = _traceability(facts)
+    coverage = matrix.coverage()
+    findings = []
+    for i in (~matrix.leaves & (matrix.leaf_covered < matrix.leaf_total)).nonzero()[0]:
+        findings.append(finding('要求カバレッジ', 'warning',
+                                f"上位要求 {matrix.requirement_label(i)} のカバレッジが{coverage[i]:.0f}%です"
+                                f"（末端の要求 {matrix.leaf_total[i]}件のうち詳細化済み {matrix.leaf_covered[i]}件）",
+                                [matrix.requirements[i]]))
+    return findings
+
+
+def rule_requirement_attributes(facts):
+    """IDまたは要求テキストが未設定の要求"""
+    findings = []
+    for xmi_id, req in facts['requirements'].items():
+        if not req['id']:
+            findings.append(finding('要求属性', 'error', f"要求「{req['name']}」にIDがありません", [xmi_id]))
+        if not req['text']:
+            findings.append(finding('要求属性', 'warning',
+                                    f"要求 {req['id']} 「{req['name']}」に要求テキストがありません", [xmi_id]))
+    return findings
+
+
+def rule_unknown_use_case_in_requirements(facts):
+    """要求図で要求を詳細化しているが、ユースケース図に存在しない要素"""
+    use_cases = set(facts['use_cases'])
+    requirement_names = _requirement_names(facts)
+    findings = []
+    for source, rel_type, target in facts['relationships']:
+        if rel_type in _TRACE_TYPES and source not in requirement_names and source not in use_cases:
+            findings.append(finding('要求図とユースケース図の対応', 'error',
+                                    f"要求図の「{source}」（{rel_type} → 「{target}」）がユースケース図にありません"))
+    return findings
+
+
+def rule_use_case_without_requirement(facts):
+    """どの要求も詳細化していないユースケース"""
+    graph = facts['graph']
+    return [finding('要求図とユースケース図の対応', 'warning',
+                    f"ユースケース「{graph.name(xmi_id)}」が詳細化する要求がありません", [xmi_id])
+            for xmi_id in _sorted_by_name(graph, graph.nodes(kind='UseCase'))
+            if not graph.neighbors(xmi_id, _TRACE_TYPES)]
+
+
+def rule_similar_requirements(facts):
+    """要求名と要求テキストの文字n-gramが似ている要求の組（MinHash/LSHで選んだ重複・矛盾の候補）"""
+    # NumPyを使うため、このルールを実行するときに読み込む
+    import requirement_similarity
+    requirements = facts['requirements']
+    findings = []
+    for first, second, similarity in requirement_similarity.similar_requirements(facts):
+        a, b = requirements[first], requirements[second]
+        findings.append(finding('要求の類似', 'info',
+                                f"要求 {a['id']} 「{a['name']}」（{a['text'] or '要求テキストなし'}）と"
+                                f"要求 {b['id']} 「{b['name']}」（{b['text'] or '要求テキストなし'}）の記述が"
+                                f"類似しています（類似度 {similarity:.2f}）", [first, second]))
+    return findings
+
+
+def _sorted_by_name(graph, xmi_ids):
+    return sorted(xmi_ids, key=lambda xmi_id: graph.name(xmi_id) or '')
+
+
+def _associated_kinds(graph, xmi_id):
+    """関連（Association）で結ばれた要素の種別の集合（向きは問わない）"""
+    others = graph.neighbors(xmi_id, ASSOCIATION) + graph.neighbors(xmi_id, ASSOCIATION, reverse=True)
+    return {graph.node(other)['kind'] for other in others}
+
+
+def rule_actor_without_association(facts):
+    """どのユースケースとも関連を持たないアクター"""
+    graph = facts['graph']
+    return [finding('ユースケース図の関連', 'warning',
+                    f"アクター「{graph.name(xmi_id)}」がどのユースケースとも関連していません", [xmi_id])
+            for xmi_id in _sorted_by_name(graph, graph.nodes(kind='Actor'))
+            if 'UseCase' not in _associated_kinds(graph, xmi_id)]
+
+
+def rule_use_case_without_actor(facts):
+    """どのアクターとも関連を持たないユースケース"""
+    graph = facts['graph']
+    return [finding('ユースケース図の関連', 'warning',
+                    f"ユースケース「{graph.name(xmi_id)}」にアクターが関連していません", [xmi_id])
+            for xmi_id in _sorted_by_name(graph, graph.nodes(kind='UseCase'))
+            if 'Actor' not in _associated_kinds(graph, xmi_id)]
+
+
+def rule_use_case_without_description(facts):
+    """ユースケース記述（./ユースケース記述/<ユースケース名>.md）がないユースケース"""
+    findings = []
+    for name in facts['use_cases']:
+        if use_case_title(name) not in facts['descriptions']:
+            findings.append(finding('ユースケース記述の対応', 'error',
+                                    f"ユースケース「{name}」に対応するユースケース記述 "
+                                    f"{USE_CASE_DESCRIPTION_DIR}/{use_case_title(name)}.md がありません"))
+    use_case_titles = {use_case_title(name) for name in facts['use_cases']}
+    for title in sorted(facts['descriptions'] - use_case_titles):
+        findings.append(finding('ユースケース記述の対応', 'warning',
+                                f"ユースケース記述「{title}」に対応するユースケースがユースケース図にありません"))
+    return findings
+
+
+# --- アクティビティ図（遷移グラフ）のルール ---
+
+def _activity_graph(activity):
+    """
+    フローを要素IDの隣接リストにします。
+    ピン（ActionPin）は所有するアクションと同じノードとして扱います。
+    """
+    model = activity['model']
+    elements = activity['elements']
+
+    def node(elem_id):
+        if elements.get(elem_id, {}).get('type') == 'ActionPin':
+            owner = model.tagged_value(elem_id, 'owner')
+            if owner in elements:
+                return owner
+        return elem_id
+
+    nodes = {elem_id for elem_id, elem in elements.items() if elem['type'] not in ('Partition', 'ActionPin')}
+    successors = {elem_id: [] for elem_id in nodes}
+    for trans in model.transitions:
+        source, target = node(trans.source), node(trans.target)
+        if source in successors and source != target:
+            successors[source].append((target, trans.condition))
+    return nodes, successors
+
+
+def _node_label(elements, elem_id):
+    elem = elements.get(elem_id)
+    return f"{elem['name']}（{elem['type']}）" if elem else f"ID不明({elem_id})"
+
+
+def rule_activity_reachability(facts):
+    """開始ノードから到達できないノードと、終了ノード以外で出ていくフローのないノード"""
+    findings = []
+    for name, activity in sorted(facts['activities'].items()):
+        model = activity['model']
+        elements = activity['elements']
+        nodes, successors = _activity_graph(activity)
+        initials = [n for n in nodes if model.tagged_value(n, 'ea_ntype') == _INITIAL_NTYPE]
+        finals = {n for n in nodes if model.tagged_value(n, 'ea_ntype') in _FINAL_NTYPES}
+        if not initials:
+            findings.append(finding('フローカバレッジ', 'error', f"アクティビティ図「{name}」に開始ノードがありません"))
+            continue
+
+        reached = set(initials)
+        stack = list(initials)
+        while stack:
+            for target, _ in successors[stack.pop()]:
+                if target in successors and target not in reached:
+                    reached.add(target)
+                    stack.append(target)
+        for elem_id in sorted(nodes - reached):
+            findings.append(finding('フローカバレッジ', 'error',
+                                    f"アクティビティ図「{name}」: {_node_label(elements, elem_id)} に開始ノードから到達できません",
+                                    [elem_id]))
+        for elem_id in sorted(nodes - finals):
+            if not successors[elem_id]:
+                findings.append(finding('フローカバレッジ', 'error',
+                                        f"アクティビティ図「{name}」: {_node_label(elements, elem_id)} から出ていくフローがありません",
+                                        [elem_id]))
+        if not finals & reached:
+            findings.append(finding('フローカバレッジ', 'error', f"アクティビティ図「{name}」: 終了ノードに到達できません"))
+    return findings
+
+
+def rule_activity_flow_targets(facts):
+    """図に存在しない要素を端点に持つフロー"""
+    findings = []
+    for name, activity in sorted(facts['activities'].items()):
+        elements = activity['elements']
+        for trans in activity['model'].transitions:
+            for end, end_id in (('source', trans.source), ('target', trans.target)):
+                if end_id not in elements:
+                    findings.append(finding('フローの整合性', 'error',
+                                            f"アクティビティ図「{name}」: フローの{'遷移元' if end == 'source' else '遷移先'}"
+                                            f" {end_id} が図にありません", [trans.id]))
+    return findings
+
+
+def rule_decision_guards(facts):
+    """ガード条件のない分岐、および分岐先が1つしかない分岐"""
+    findings = []
+    for name, activity in sorted(facts['activities'].items()):
+        elements = activity['elements']
+        _, successors = _activity_graph(activity)
+        for elem_id, elem in sorted(elements.items()):
+            if elem['type'] != 'Decision':
+                continue
+            outgoing = successors.get(elem_id, [])
+            if len(outgoing) < 2:
+                findings.append(finding('分岐の網羅性', 'warning',
+                                        f"アクティビティ図「{name}」: 分岐「{elem['name']}」の分岐先が{len(outgoing)}つです",
+                                        [elem_id]))
+            for target, condition in outgoing:
+                if not condition:
+                    findings.append(finding('分岐の網羅性', 'warning',
+                                            f"アクティビティ図「{name}」: 分岐「{elem['name']}」→ "
+                                            f"{_node_label(elements, target)} にガード条件がありません", [elem_id]))
+    return findings
+
+
+# --- 状態遷移図のルール ---
+
+def rule_risk_coverage(facts):
+    """FMEAの項目が扱っていない状態と、どの状態も扱っていないFMEAの項目（FMEAがある場合のみ）"""
+    matrix = _traceability(facts)
+    orphans = matrix.orphans()
+    findings = [finding('リスク対応カバレッジ', 'warning', f"FMEAの項目「{matrix.fmea_items[i]}」が扱う状態がありません")
+                for i in orphans['fmea_without_state']]
+    findings += [finding('リスク対応カバレッジ', 'warning',
+                         f"状態機械「{matrix.states[j][0]}」の状態「{matrix.states[j][1]}」がFMEAで扱われていません")
+                 for j in orphans['states_without_fmea']]
+    return findings
+
+
+def rule_state_machine_simulation(facts):
+    """状態遷移図をシミュレーションし、到達できない状態・デッドロック・発火しない遷移・処理されないイベントを検出する"""
+    findings = []
+    for machine in facts['state_machines']:
+        findings.extend(finding(f['rule'], f['severity'], f['message'], f['elements'])
+                        for f in state_machine_sim.findings(state_machine_sim.explore(machine)))
+    return findings
+
+
+_ACTIVITY_RULES = [rule_activity_reachability, rule_activity_flow_targets, rule_decision_guards]
+
+# 検証項目 → 事前に実行するルール
+CHECK_RULES = {
+    "図妥当性チェック ユースケース図": [rule_actor_without_association, rule_use_case_without_actor],
+    "図妥当性チェック 要求の重複_矛盾": [rule_similar_requirements],
+    "図間整合性チェック 要求図とユースケース図": [rule_unknown_use_case_in_requirements, rule_use_case_without_requirement],
+    "図面間整合チェック ユースケース図とユースケース記述": [rule_use_case_without_description],
+    "図間整合性チェック ユースケース記述内のフローとアクティビティ図（ユースケース）": _ACTIVITY_RULES,
+    "網羅性チェック 要求カバレッジ": [rule_requirement_without_use_case, rule_requirement_coverage,
+                         rule_requirement_attributes, rule_use_case_without_requirement],
+    "網羅性チェック フローカバレッジ": _ACTIVITY_RULES,
+    "網羅性チェック 状態_遷移カバレッジ": _ACTIVITY_RULES + [rule_state_machine_simulation],
+    "網羅性チェック リスク対応カバレッジ": [rule_risk_coverage],
+}
+
+# ルール → 判定に使う入力（XMIに含まれる図の種別 'requirement' / 'use_case' / 'activity'、
+# またはcheck_registryのファイルグループ）。入力が変わったルールの検証項目だけを再実行するために使う
+RULE_INPUTS = {
+    rule_requirement_without_use_case: ('requirement', 'use_case'),
+    rule_requirement_coverage: ('requirement', 'use_case'),
+    rule_requirement_attributes: ('requirement',),
+    rule_unknown_use_case_in_requirements: ('requirement', 'use_case'),
+    rule_use_case_without_requirement: ('requirement', 'use_case'),
+    rule_similar_requirements: ('requirement',),
+    rule_actor_without_association: ('use_case',),
+    rule_use_case_without_actor: ('use_case',),
+    rule_use_case_without_description: ('use_case', 'usecase_description'),
+    rule_activity_reachability: ('activity',),
+    rule_activity_flow_targets: ('activity',),
+    rule_decision_guards: ('activity',),
+    rule_risk_coverage: ('statemachine', 'fmea'),
+    rule_state_machine_simulation: ('statemachine',),
+}
+
+
+def changed_inputs(paths, root_dir='.'):
+    """
+    変更されたファイルから、ルールの入力（図の種別・ファイルグループ）のうち変わったものを求めます。
+    削除されたXMIは含んでいた図が分からないため、すべての図の種別を変更とみなします。
+
+    Args:
+        paths (iterable): 変更されたファイルのパス（root_dirを含むパス）。
+        root_dir (str): モデルのディレクトリ。
+
+    Returns:
+        set: 変わった入力の集合。
+    """
+    group_of = {os.path.normpath(os.path.join(root_dir, path)): group
+                for group, files in FILE_GROUPS.items() for path in files}
+    description_dir = os.path.normpath(os.path.join(root_dir, USE_CASE_DESCRIPTION_DIR))
+    inputs = set()
+    for path in map(os.path.normpath, paths):
+        if path.endswith('.xml'):
+            if not os.path.exists(path):
+                inputs.update(REPORT_FILES)
+            elif is_xmi_file(path):
+                inputs |= diagram_kinds(load_model(path, os.path.join(root_dir, SNAPSHOT_DIR)))
+        elif path in group_of:
+            inputs.add(group_of[path])
+        # ユースケース記述はディレクトリにある.mdの名前で判定するため、一覧にないファイルの追加・削除も対象とする
+        elif (os.path.dirname(path) == description_dir and path.endswith('.md')
+              and not path.endswith('_アクティビティ図.md')):
+            inputs.add('usecase_description')
+    return inputs
+
+
+def checks_for_inputs(inputs):
+    """入力が変わったルールを1つでも持つ検証項目（CHECK_RULESの順）"""
+    return [choice for choice, rules in CHECK_RULES.items()
+            if any(set(RULE_INPUTS[rule]) & set(inputs) for rule in rules)]
+
+
+def run_rules(choice, facts):
+    """
+    検証項目に対応するルールを実行します。
+
+    Returns:
+        tuple: (findings, rule_names) のタプル。rule_namesは実行したルールの説明のリスト。
+    """
+    findings = []
+    rule_names = []
+    for rule in CHECK_RULES.get(choice, []):
+        findings.extend(rule(facts))
+        rule_names.append(rule.__doc__.strip())
+    return findings, rule_names
+
+
+def format_findings(findings, rule_names):
+    """事前チェックの結果をプロンプトに含めるMarkdownにする"""
+    lines = [FACTS_HEADER, "", "### 判定したルール"]
+    lines += [f"- {name}" for name in rule_names]
+    lines += ["", "### 指摘"]
+    if findings:
+        lines += [f"- [{f['severity']}] {f['rule']}: {f['message']}" for f in findings]
+    else:
+        lines.append("- 該当なし（上記のルールに違反する要素はありません）")
+    return '\n'.join(lines)
+
+
+def augment_prompt(prompt_text, findings, rule_names):
+    """ルールを実行した検証項目のプロンプトに事前チェックの結果を追記する"""
+    if not rule_names:
+        return prompt_text
+    return f"{prompt_text}\n\n{format_findings(findings, rule_names)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XMIから抽出した構成要素に対してルールベースの事前チェックを実行します')
+    parser.add_argument('root_dir', nargs='?', default='.', help='XMIファイルを探すディレクトリ')
+    parser.add_argument('--check', action='append', help='実行する検証項目（省略時はすべて）')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    with instrumentation.tracing(args.trace):
+        with instrumentation.span('rules.load_facts'):
+            facts = load_model_facts(args.root_dir)
+        for choice in args.check or list(CHECK_RULES):
+            with instrumentation.span('rules.run', check=choice):
+                findings, _ = run_rules(choice, facts)
+            print(f"## {choice}: {len(findings)}件")
+            for f in findings:
+                print(f"  [{f['severity']}] {f['rule']}: {f['message']}")
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,667 @@
+import argparse
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import file_cache
+import instrumentation
+from check_registry import FILE_GROUPS
+
+# 最上位の終了状態に達した構成
+TERMINATED = '(終了)'
+# イベントもガード条件もない遷移（完了遷移）の表示名
+COMPLETION = '（完了）'
+
+DEFAULT_MAX_DEPTH = 8
+DEFAULT_SEQUENCE_LIMIT = 200000
+# 到達経路（イベント列）の例として報告する件数
+SAMPLE_SEQUENCES = 20
+
+# 到達した時点でイベントを受け付けず、出ていく遷移をすぐにたどる疑似状態
+_TRANSIENT_KINDS = ('choice', 'junction', 'fork', 'join')
+
+_COMMENT = re.compile(r"^\s*(?:'.*|@startuml.*|@enduml|skinparam\b.*|hide\b.*|title\b.*|left to right direction"
+                      r"|top to bottom direction|!.*|scale\b.*|--+|\|\|)\s*$")
+_STATE_DECL = re.compile(r'^state\s+(?:"(?P<label>[^"]+)"\s+as\s+(?P<alias>\S+?)|(?P<name>"[^"]+"|[^\s{<:]+))'
+                         r'\s*(?:<<(?P<kind>\w+)>>)?\s*(?P<brace>\{)?\s*(?::\s*.*)?$')
+_ARROW = re.compile(r'^(?P<left>\[\*\]|\[H\*?\]|"[^"]+"|[^\s"]+?)\s*'
+                    r'(?P<arrow><?-+(?:\[[^\]]*\])?(?:[a-z]+)?(?:\[[^\]]*\])?-*>?)\s*'
+                    r'(?P<right>\[\*\]|\[H\*?\]|"[^"]+"|[^\s":]+)\s*(?::\s*(?P<label>.*))?$')
+_DESCRIPTION = re.compile(r'^(?P<name>"[^"]+"|[^\s:"]+)\s*:\s*.*$')
+_GUARD = re.compile(r'[\[［](.*?)[\]］]')
+
+
+class Transition:
+    """
+    状態遷移1本。sourceがNoneなら開始疑似状態から、targetがNoneなら終了状態への遷移。
+    scopeは遷移を定義した複合状態（最上位はNone）で、終了状態はそのscopeの完了を表す。
+    """
+    __slots__ = ('number', 'source', 'target', 'event', 'guard', 'action', 'scope')
+
+    def __init__(self, number, source, target, event=None, guard=None, action=None, scope=None):
+        self.number = number
+        self.source = source
+        self.target = target
+        self.event = event
+        self.guard = guard
+        self.action = action
+        self.scope = scope
+
+    def label(self):
+        """
+        イベント列に表示する名前（イベント名＋ガード条件）。
+        イベントもガード条件もない完了遷移は自動的に発火するため、イベント列には含めない（None）。
+        """
+        if self.guard:
+            return f"{self.event or ''}[{self.guard}]"
+        return self.event
+
+    def describe(self):
+        return f"{self.source or '[*]'} → {self.target or '[*]'} : {self.label() or COMPLETION}"
+
+
+class StateMachine:
+    """
+    状態機械。状態は名前で管理し、複合状態・サブマシン状態の親子関係は parents に持ちます。
+
+    Attributes:
+        name (str): 状態機械の名前（ファイル名から付ける）。
+        states (dict): 状態名 → 種別（'state', 'choice' など）。定義順。
+        parents (dict): 状態名 → 親の状態名（最上位はNone）。
+        transitions (list): Transition のリスト。
+        initials (dict): 複合状態（最上位はNone）→ 開始疑似状態からの遷移のリスト。
+    """
+
+    def __init__(self, name, path=None):
+        self.name = name
+        self.path = path
+        self.states = {}
+        self.parents = {}
+        self.transitions = []
+        self.initials = {}
+
+    def add_state(self, state, scope=None, kind='state'):
+        if state not in self.states:
+            self.states[state] = kind
+            self.parents[state] = scope
+        elif kind != 'state':
+            self.states[state] = kind
+        return state
+
+    def add_transition(self, source, target, event=None, guard=None, action=None, scope=None):
+        transition = Transition(len(self.transitions), source, target, event, guard, action, scope)
+        self.transitions.append(transition)
+        if source is None:
+            self.initials.setdefault(scope, []).append(transition)
+        return transition
+
+    def events(self):
+        """遷移のトリガーとなるイベント（定義順）"""
+        return list(dict.fromkeys(t.event for t in self.transitions if t.event))
+
+
+def _unquote(token):
+    return token[1:-1] if token.startswith('"') and token.endswith('"') else token
+
+
+def parse_label(label):
+    """遷移のラベル「イベント [ガード条件] / アクション」を (event, guard, action) にする"""
+    if not label:
+        return None, None, None
+    label = label.replace('\\n', ' ').strip()
+    action = None
+    if '/' in label:
+        label, action = label.split('/', 1)
+        action = action.strip() or None
+    guard = None
+    match = _GUARD.search(label)
+    if match:
+        guard = match.group(1).strip() or None
+        label = label[:match.start()] + label[match.end():]
+    return label.strip() or None, guard, action
+
+
+def parse_plantuml_state_machine(text, name, path=None):
+    """
+    PlantUMLの状態遷移図を StateMachine にします。
+    複合状態（state X { ... }）、別名（state "表示名" as X）、<<choice>> などの疑似状態、
+    遷移のラベル「イベント [ガード条件] / アクション」に対応します。
+    並行領域（-- / ||）は区切りを無視して1つの領域として扱います。
+    """
+    machine = StateMachine(name, path)
+    scopes = [None]
+    aliases = {}
+    in_note = False
+
+    def state(token):
+        token = _unquote(token)
+        return machine.add_state(aliases.get(token, token), scopes[-1])
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if in_note:
+            in_note = not re.match(r'^end\s*note\b', line)
+            continue
+        if not line or _COMMENT.match(line):
+            continue
+        if line.startswith('note '):
+            # 1行の注記（note left of X : ...）以外は end note まで読み飛ばす
+            in_note = ':' not in line
+            continue
+        if line == '}':
+            if len(scopes) > 1:
+                scopes.pop()
+            continue
+        match = _STATE_DECL.match(line)
+        if match:
+            if match.group('alias'):
+                aliases[match.group('alias')] = match.group('label')
+                current = machine.add_state(match.group('label'), scopes[-1], (match.group('kind') or 'state').lower())
+            else:
+                current = machine.add_state(_unquote(match.group('name')), scopes[-1],
+                                            (match.group('kind') or 'state').lower())
+            if match.group('brace'):
+                scopes.append(current)
+            continue
+        match = _ARROW.match(line)
+        if match and '-' in match.group('arrow'):
+            left, right = match.group('left'), match.group('right')
+            if match.group('arrow').startswith('<'):
+                left, right = right, left
+            scope = scopes[-1]
+            event, guard, action = parse_label(match.group('label'))
+            source = None if left in ('[*]', '[H]', '[H*]') else state(left)
+            if right == '[*]':
+                target = None
+            elif right in ('[H]', '[H*]'):
+                # 履歴は記憶を持たないため、複合状態に入り直す（開始状態から）ものとして扱う
+                target = scope
+            else:
+                target = state(right)
+            if source is None and target is None:
+                continue
+            machine.add_transition(source, target, event, guard, action, scope)
+            continue
+        match = _DESCRIPTION.match(line)
+        if match:
+            state(match.group('name'))
+    return machine
+
+
+def machine_name(path):
+    """ファイル名から状態機械の名前を付ける（自動販売機_メンテナンスモード.wsd → メンテナンスモード）"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem.rsplit('_', 1)[-1]
+
+
+def compose_state_machines(machines):
+    """
+    別の状態機械と同じ名前の状態を、その状態機械を内部に持つサブマシン状態として統合します。
+    サブマシンの状態は「状態::サブマシンの状態」の名前で親の状態の子として取り込み、
+    サブマシンの開始・終了は親の状態への入場・完了として扱います。
+
+    Returns:
+        list: 他の状態機械から参照されない（最上位の）状態機械のリスト。
+    """
+    by_name = {machine.name: machine for machine in machines}
+    referenced = set()
+
+    def inline(host, submachine, state, stack):
+        prefix = f"{state}::"
+
+        def rename(name):
+            return None if name is None else prefix + name
+
+        for name, kind in submachine.states.items():
+            parent = submachine.parents[name]
+            host.add_state(rename(name), rename(parent) if parent is not None else state, kind)
+        for t in submachine.transitions:
+            scope = rename(t.scope) if t.scope is not None else state
+            host.add_transition(rename(t.source), rename(t.target), t.event, t.guard, t.action, scope)
+        expand(host, [rename(name) for name in submachine.states], stack + [submachine.name])
+
+    def expand(host, states, stack):
+        for state in states:
+            submachine = by_name.get(state.rsplit('::', 1)[-1])
+            if submachine is None or submachine.name in stack or host.initials.get(state):
+                continue
+            referenced.add(submachine.name)
+            inline(host, submachine, state, stack)
+
+    composed = []
+    for machine in machines:
+        copy = StateMachine(machine.name, machine.path)
+        for name, kind in machine.states.items():
+            copy.add_state(name, machine.parents[name], kind)
+        for t in machine.transitions:
+            copy.add_transition(t.source, t.target, t.event, t.guard, t.action, t.scope)
+        expand(copy, list(machine.states), [machine.name])
+        composed.append(copy)
+    return [machine for machine in composed if machine.name not in referenced]
+
+
+def load_state_machines(root_dir='.', paths=None):
+    """
+    状態遷移図（PlantUML）を読み込み、サブマシン状態を統合した状態機械のリストを返します。
+    pathsを省略した場合は検証対象ファイルの定義（statemachine）を使います。
+    存在しないファイルは読み飛ばします。
+    """
+    machines = []
+    for path in paths if paths is not None else FILE_GROUPS['statemachine']:
+        full_path = os.path.join(root_dir, path)
+        try:
+            text = file_cache.read_text(full_path)
+        except FileNotFoundError:
+            continue
+        machines.append(parse_plantuml_state_machine(text, machine_name(path), path))
+    return compose_state_machines(machines)
+
+
+def machine_from_activity(name, activity):
+    """
+    アクティビティ図（rule_checks の facts['activities'] の要素）を状態機械にします。
+    フローはイベントを持たない遷移、ガード条件はその遷移のガードとして扱います。
+    開始ノードは開始疑似状態、終了ノード（フロー終了を含む）への遷移は終了状態への遷移にします。
+    """
+    model = activity['model']
+    elements = activity['elements']
+    machine = StateMachine(name)
+    labels = {}
+    initials, finals = set(), set()
+    for elem_id, elem in elements.items():
+        if elem['type'] in ('Partition', 'ActionPin'):
+            continue
+        ntype = model.tagged_value(elem_id, 'ea_ntype')
+        if ntype == '100':
+            initials.add(elem_id)
+            continue
+        if ntype in ('101', '102'):
+            finals.add(elem_id)
+            continue
+        label = elem['name'] or elem['type']
+        if label in labels.values():
+            label = f"{label} ({elem_id})"
+        labels[elem_id] = label
+        machine.add_state(label, None, 'choice' if elem['type'] in ('Decision', 'MergeNode') else 'state')
+
+    def node(elem_id):
+        # ピンは所有するアクションとして扱う
+        if elements.get(elem_id, {}).get('type') == 'ActionPin':
+            return model.tagged_value(elem_id, 'owner')
+        return elem_id
+
+    for trans in model.transitions:
+        source, target = node(trans.source), node(trans.target)
+        if source == target:
+            continue
+        if source in initials and target in labels:
+            machine.add_transition(None, labels[target], guard=trans.condition)
+        elif source in labels and target in finals:
+            machine.add_transition(labels[source], None, guard=trans.condition)
+        elif source in labels and target in labels:
+            machine.add_transition(labels[source], labels[target], guard=trans.condition)
+    return machine
+
+
+class _Semantics:
+    """状態機械の1ステップの意味（入場・遷移の発火・イベントの処理）"""
+
+    def __init__(self, machine):
+        self.machine = machine
+        self.events = machine.events()
+        self.outgoing = {}
+        for t in machine.transitions:
+            if t.source is not None:
+                self.outgoing.setdefault(t.source, {}).setdefault(t.event, []).append(t)
+
+    def enter(self, state, fired=()):
+        """状態に入る。複合状態なら開始疑似状態からたどった末端の状態の (構成, 発火した遷移) を返す"""
+        initials = self.machine.initials.get(state)
+        if not initials:
+            return [(state, fired)]
+        results = []
+        for t in initials:
+            results.extend(self.fire(t, fired))
+        return results
+
+    def fire(self, t, fired=()):
+        fired = fired + (t.number,)
+        if t.target is not None:
+            return self.enter(t.target, fired)
+        if t.scope is None:
+            return [(TERMINATED, fired)]
+        # 複合状態の中の終了状態：複合状態の完了として、複合状態そのものを構成とする
+        return [(t.scope, fired)]
+
+    def initial(self):
+        results = []
+        for t in self.machine.initials.get(None, []):
+            results.extend(self.fire(t))
+        return results
+
+    def step(self, config):
+        """
+        構成から1ステップで移れる構成を返します。
+
+        Returns:
+            tuple: (steps, unhandled, guard_gaps)。stepsは (ラベル, 次の構成, 発火した遷移番号のタプル) のリスト、
+                   unhandledは処理されないイベント、guard_gapsはガード条件付きの遷移しかないイベント。
+        """
+        if config == TERMINATED:
+            return [], [], []
+        steps = []
+        outgoing = self.outgoing.get(config, {})
+        completions = outgoing.get(None, [])
+        for t in completions:
+            for target, fired in self.fire(t):
+                steps.append((t.label(), target, fired))
+        # ガード条件のない完了遷移がある状態と疑似状態は、イベントを待たずに出ていく
+        if self.machine.states.get(config) in _TRANSIENT_KINDS or any(t.guard is None for t in completions):
+            return steps, [], []
+        unhandled, guard_gaps = [], []
+        for event in self.events:
+            state = config
+            candidates = None
+            # 内側の状態から順に、イベントを処理する遷移を探す（外側の複合状態の遷移も有効）
+            while state is not None and not candidates:
+                candidates = self.outgoing.get(state, {}).get(event)
+                state = self.machine.parents.get(state)
+            if not candidates:
+                unhandled.append(event)
+                continue
+            for t in candidates:
+                for target, fired in self.fire(t):
+                    steps.append((t.label(), target, fired))
+            if all(t.guard for t in candidates):
+                guard_gaps.append(event)
+        return steps, unhandled, guard_gaps
+
+
+def explore(machine, max_states=None):
+    """
+    状態空間を幅優先で探索します（同じ構成は1度だけ展開する）。
+    ガード条件は評価せず、真・偽のどちらにもなり得るものとして各遷移をたどります。
+
+    Returns:
+        dict: 'machine', 'reachable'（到達した構成 → 最短のイベント列）, 'unreachable'（到達しない状態）,
+              'deadlocks'（終了していないのに出ていけない構成）, 'unhandled'（構成 → 処理されないイベント）,
+              'guard_gaps'（構成 → ガード条件付きの遷移しかないイベント）, 'unfired'（発火しない遷移）,
+              'transition_sequences'（遷移番号 → 最初に発火させたイベント列）, 'terminates' の辞書。
+    """
+    semantics = _Semantics(machine)
+    parents = {}            # 構成 → (前の構成, ラベル)
+    transition_sequences = {}
+    deadlocks, unhandled, guard_gaps = [], {}, {}
+    queue = deque()
+
+    def path(config):
+        labels = []
+        while config is not None:
+            config, label = parents[config]
+            if label is not None:
+                labels.append(label)
+        return tuple(reversed(labels))
+
+    for config, fired in semantics.initial():
+        if config not in parents:
+            parents[config] = (None, None)
+            queue.append(config)
+        for number in fired:
+            transition_sequences.setdefault(number, ())
+    while queue:
+        if max_states is not None and len(parents) > max_states:
+            break
+        config = queue.popleft()
+        steps, events, gaps = semantics.step(config)
+        if not steps and config != TERMINATED:
+            deadlocks.append(config)
+        if events:
+            unhandled[config] = events
+        if gaps:
+            guard_gaps[config] = gaps
+        prefix = None
+        for label, target, fired in steps:
+            if any(number not in transition_sequences for number in fired):
+                prefix = prefix if prefix is not None else path(config)
+                for number in fired:
+                    transition_sequences.setdefault(number, prefix + ((label,) if label else ()))
+            if target not in parents:
+                parents[target] = (config, label)
+                queue.append(target)
+
+    active = set()
+    for config in parents:
+        state = config
+        while state is not None and state != TERMINATED:
+            active.add(state)
+            state = machine.parents.get(state)
+    return {
+        'machine': machine,
+        'reachable': {config: path(config) for config in parents},
+        'unreachable': [state for state in machine.states if state not in active],
+        'deadlocks': deadlocks,
+        'unhandled': unhandled,
+        'guard_gaps': guard_gaps,
+        'unfired': [t for t in machine.transitions if t.number not in transition_sequences],
+        'transition_sequences': transition_sequences,
+        'terminates': TERMINATED in parents,
+    }
+
+
+# --- イベント列の生成（深さ制限付きの列挙。プロセスプールで分担する） ---
+
+def _expand_sequences(machine, roots, max_depth, limit):
+    """
+    (構成, 深さ) の各起点から深さ max_depth までのイベント列を列挙し、件数と発火した遷移を返します。
+    終了した列（終了状態・行き止まり）と深さの上限に達した列を1件と数えます。
+    """
+    semantics = _Semantics(machine)
+    steps_cache = {}
+    count = completed = 0
+    fired_numbers = set()
+    stack = list(roots)
+    while stack and count < limit:
+        config, depth = stack.pop()
+        steps = steps_cache.get(config)
+        if steps is None:
+            steps = steps_cache[config] = semantics.step(config)[0]
+        if not steps or depth >= max_depth:
+            count += 1
+            if not steps:
+                completed += 1
+            continue
+        for _, target, fired in steps:
+            fired_numbers.update(fired)
+            stack.append((target, depth + 1))
+    return {'sequences': count, 'completed': completed, 'fired': fired_numbers, 'truncated': bool(stack)}
+
+
+def generate_sequences(machine, max_depth=DEFAULT_MAX_DEPTH, limit=DEFAULT_SEQUENCE_LIMIT, jobs=1):
+    """
+    開始状態からのイベント列を深さ max_depth まで列挙します。
+    jobsが2以上なら、浅い階層まで展開した起点をプロセスプールのワーカーに分けて列挙します。
+
+    Returns:
+        dict: 'sequences'（列挙したイベント列の数）, 'completed'（終了まで到達した列の数）,
+              'fired'（発火した遷移番号の集合）, 'truncated'（上限で打ち切ったか）, 'seconds' の辞書。
+    """
+    start = time.perf_counter()
+    semantics = _Semantics(machine)
+    roots = [(config, 0) for config, _ in semantics.initial()]
+    fired_numbers = {number for _, fired in semantics.initial() for number in fired}
+    # 起点がワーカー数の数倍になるまで親で展開する
+    while jobs > 1 and roots and len(roots) < jobs * 4 and all(depth < max_depth for _, depth in roots):
+        expanded = []
+        for config, depth in roots:
+            steps = semantics.step(config)[0]
+            if not steps:
+                expanded.append((config, max_depth))
+                continue
+            for _, target, fired in steps:
+                fired_numbers.update(fired)
+                expanded.append((target, depth + 1))
+        if len(expanded) == len(roots):
+            roots = expanded
+            break
+        roots = expanded
+    if jobs > 1 and len(roots) > 1:
+        chunks = [roots[i::jobs] for i in range(jobs)]
+        per_chunk = max(1, limit // len(chunks))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parts = list(pool.map(_expand_sequences, [machine] * len(chunks), chunks,
+                                  [max_depth] * len(chunks), [per_chunk] * len(chunks)))
+    else:
+        parts = [_expand_sequences(machine, roots, max_depth, limit)]
+    result = {'sequences': 0, 'completed': 0, 'fired': fired_numbers, 'truncated': False}
+    for part in parts:
+        result['sequences'] += part['sequences']
+        result['completed'] += part['completed']
+        result['fired'] |= part['fired']
+        result['truncated'] |= part['truncated']
+    result['seconds'] = time.perf_counter() - start
+    instrumentation.count('simulation.sequences', result['sequences'])
+    return result
+
+
+# --- 結果の報告 ---
+
+def _format_sequence(sequence):
+    return ' → '.join(sequence) if sequence else '（イベントなしで到達）'
+
+
+def simulate(machine, max_depth=DEFAULT_MAX_DEPTH, limit=DEFAULT_SEQUENCE_LIMIT, jobs=1):
+    """状態空間の探索とイベント列の列挙を行う"""
+    with instrumentation.span('simulation.explore', machine=machine.name):
+        result = explore(machine)
+    with instrumentation.span('simulation.sequences', machine=machine.name):
+        result['generated'] = generate_sequences(machine, max_depth, limit, jobs)
+    return result
+
+
+def findings(result, kind='状態遷移図'):
+    """
+    シミュレーション結果を指摘のリストにします（rule_checks.finding と同じ形式）。
+    処理されないイベントは、どの到達可能な状態でも処理されないものだけを指摘します。
+    """
+    machine = result['machine']
+    items = []
+
+    def add(rule, severity, message, elements=()):
+        items.append({'rule': rule, 'severity': severity, 'elements': list(elements), 'message': message})
+
+    if not machine.initials.get(None):
+        add('状態遷移の到達性', 'error', f"{kind}「{machine.name}」に開始状態がありません")
+    for state in result['unreachable']:
+        add('状態遷移の到達性', 'error', f"{kind}「{machine.name}」: 状態「{state}」に到達できません", [state])
+    for config in result['deadlocks']:
+        add('デッドロック', 'error',
+            f"{kind}「{machine.name}」: 状態「{config}」から出ていく遷移がありません"
+            f"（イベント列: {_format_sequence(result['reachable'][config])}）", [config])
+    for t in result['unfired']:
+        # 到達できない状態からの遷移は、状態の指摘に含まれるため除く
+        if t.source not in result['unreachable']:
+            add('状態遷移の到達性', 'warning', f"{kind}「{machine.name}」: 遷移「{t.describe()}」は発火しません",
+                [name for name in (t.source, t.target) if name])
+    handled = {event for t in result['transition_sequences'] for event in [machine.transitions[t].event] if event}
+    for event in machine.events():
+        if event not in handled:
+            add('未処理のイベント', 'warning', f"{kind}「{machine.name}」: イベント「{event}」はどの到達可能な状態でも処理されません",
+                [event])
+    for config, events in sorted(result['guard_gaps'].items()):
+        add('ガード条件の網羅性', 'info',
+            f"{kind}「{machine.name}」: 状態「{config}」でイベント「{'」「'.join(events)}」を処理する遷移はすべてガード条件付きです"
+            f"（すべて偽のときは処理されません）", [config])
+    return items
+
+
+def format_report(results, max_depth=DEFAULT_MAX_DEPTH):
+    """シミュレーション結果のMarkdown（最後に構造化された指摘のJSONを付ける）"""
+    lines = ["# ステートマシン図の動的検証（シミュレーション）", "",
+             "状態遷移図とアクティビティ図から状態機械を組み立て、イベント列を幅優先で生成して実行した結果です。",
+             "ガード条件は評価せず、真・偽のどちらにもなり得るものとして両方の遷移をたどります。", ""]
+    all_findings = []
+    for kind, result in results:
+        machine = result['machine']
+        generated = result['generated']
+        items = findings(result, kind)
+        all_findings.extend(items)
+        reachable_states = len(machine.states) - len(result['unreachable'])
+        lines += [f"## {kind}: {machine.name}", "",
+                  f"- 状態: {len(machine.states)}（到達可能: {reachable_states}）, 遷移: {len(machine.transitions)}"
+                  f"（発火: {len(machine.transitions) - len(result['unfired'])}）, イベント: {len(machine.events())}",
+                  f"- 深さ{max_depth}までのイベント列: {generated['sequences']:,}通り"
+                  f"（終了まで到達: {generated['completed']:,}通り{', 上限で打ち切り' if generated['truncated'] else ''}, "
+                  f"{generated['seconds']:.2f} 秒）",
+                  f"- 終了状態への到達: {'あり' if result['terminates'] else 'なし'}", ""]
+        if items:
+            lines.append("### 指摘")
+            lines += [f"- [{f['severity']}] {f['rule']}: {f['message']}" for f in items]
+            lines.append("")
+        unhandled = [(config, events) for config, events in result['unhandled'].items()]
+        if unhandled:
+            lines += ["### 状態ごとに処理されないイベント", "", "| 状態 | 処理されないイベント |", "|---|---|"]
+            lines += [f"| {config} | {', '.join(events)} |" for config, events in unhandled]
+            lines.append("")
+        sequences = sorted(result['transition_sequences'].items())
+        if sequences:
+            heading = "### 遷移を発火させるイベント列（生成したシナリオ）"
+            if len(sequences) > SAMPLE_SEQUENCES:
+                heading += f"（{len(sequences)}件中、先頭の{SAMPLE_SEQUENCES}件）"
+                sequences = sequences[:SAMPLE_SEQUENCES]
+            lines += [heading, "", "| 遷移 | イベント列 |", "|---|---|"]
+            lines += [f"| {machine.transitions[number].describe()} | {_format_sequence(sequence)} |"
+                      for number, sequence in sequences]
+            lines.append("")
+    if not results:
+        lines += ["検証対象の状態遷移図・アクティビティ図が見つかりませんでした。", ""]
+    payload = {'findings': [{'severity': f['severity'], 'elements': f['elements'], 'message': f['message']}
+                            for f in all_findings]}
+    lines += ["```json", json.dumps(payload, ensure_ascii=False), "```"]
+    return '\n'.join(lines)
+
+
+def simulate_model(facts, max_depth=DEFAULT_MAX_DEPTH, limit=DEFAULT_SEQUENCE_LIMIT, jobs=1):
+    """
+    rule_checks.load_model_facts の結果に含まれる状態遷移図とアクティビティ図をすべてシミュレーションします。
+
+    Returns:
+        list: (種別, シミュレーション結果) のリスト。
+    """
+    machines = [('状態遷移図', machine) for machine in facts.get('state_machines', [])]
+    machines += [('アクティビティ図', machine_from_activity(name, activity))
+                 for name, activity in sorted(facts['activities'].items())]
+    return [(kind, simulate(machine, max_depth, limit, jobs)) for kind, machine in machines]
+
+
+def main():
+    import rule_checks
+
+    parser = argparse.ArgumentParser(description='状態遷移図とアクティビティ図を状態機械としてシミュレーションし、'
+                                                 '到達できない状態・デッドロック・処理されないイベントを検出します')
+    parser.add_argument('root_dir', nargs='?', default='.', help='モデルのディレクトリ')
+    parser.add_argument('--depth', type=int, default=DEFAULT_MAX_DEPTH, help='生成するイベント列の最大の長さ')
+    parser.add_argument('--limit', type=int, default=DEFAULT_SEQUENCE_LIMIT, help='1つの状態機械で生成するイベント列の上限')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='イベント列の生成に使うプロセス数')
+    parser.add_argument('-o', '--output', help='結果のMarkdownの出力先（省略時は標準出力）')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    with instrumentation.tracing(args.trace):
+        facts = rule_checks.load_model_facts(args.root_dir)
+        report = format_report(simulate_model(facts, args.depth, args.limit, args.jobs), args.depth)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Exported: {args.output}")
+    else:
+        print(report)
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# OpenAI互換の /v1/chat/completions を返す検証用のスタブサーバ。
+# OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 を指定すると、AI検証ツールを実APIなしで動かせます。
+
+
+class StubState:
+    """スタブサーバの設定と受信件数（ハンドラ間で共有）"""
+
+    def __init__(self, delay=0.5, fail_rate=0.0, retry_after=None, stream_lines=20, fail_first=0,
+                 drop_streams=0, drop_after=0):
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.stream_lines = stream_lines
+        # 最初のfail_first件の要求には必ず429を返す（再試行の確認を再現できるようにする）
+        self.fail_first = fail_first
+        # 最初のdrop_streams件のストリーミング応答は、drop_after行を送ったところで接続を切る
+        self.drop_streams = drop_streams
+        self.drop_after = drop_after
+        self.requests = 0
+        self.disconnects = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, request, lines):
+        """
+        応答をServer-Sent Eventsで1行ずつ返す（stream=Trueの要求）。
+        最初の行はすぐに返し、残りの行の間に遅延を分けて入れる。
+        """
+        with self.state.lock:
+            drop = self.state.drop_streams > 0
+            self.state.drop_streams -= drop
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        if drop:
+            # 本文の長さを実際より大きく伝えて途中で切り、クライアントに受信途中の接続断として見せる
+            self.send_header('Content-Length', str(1 << 20))
+        self.end_headers()
+        created = int(time.time())
+
+        def event(delta, finish_reason=None):
+            body = {'id': f'chatcmpl-stub-{self.state.requests}', 'object': 'chat.completion.chunk',
+                    'created': created, 'model': request.get('model'),
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+            self.wfile.write(f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            event({'role': 'assistant', 'content': ''})
+            for i, line in enumerate(lines):
+                if drop and i == self.state.drop_after:
+                    self.close_connection = True
+                    return
+                if i:
+                    time.sleep(self.state.delay / max(1, len(lines) - 1))
+                event({'content': line})
+            event({}, 'stop')
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアントが中断した（以降の生成を止める）
+            with self.state.lock:
+                self.state.disconnects += 1
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'not found: {self.path}'}})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        state = self.state
+        with state.lock:
+            state.requests += 1
+            state.active += 1
+            state.max_active = max(state.max_active, state.active)
+        try:
+            if not request.get('stream'):
+                time.sleep(state.delay)
+            # 指定した割合で429/503を返し、クライアントの再試行を確認できるようにする
+            with state.lock:
+                fail_first = state.requests <= state.fail_first
+            if fail_first or random.random() < state.fail_rate:
+                status = 429 if fail_first else random.choice((429, 503))
+                headers = {'Retry-After': str(state.retry_after)} if state.retry_after is not None else None
+                self._send_json(status, {'error': {'message': 'stub error', 'type': 'stub', 'code': status}}, headers)
+                return
+
+            prompt = request.get('messages', [{}])[-1].get('content', '')
+            content = f"# スタブ検証結果\n\n- model: {request.get('model')}\n- prompt: {len(prompt)} 文字\n"
+            # 構造化された指摘を求められたら、末尾にJSONコードブロックを付ける
+            findings_block = ''
+            if '```json' in prompt:
+                findings = [{'severity': 'warning', 'elements': ['R1'], 'message': 'スタブの指摘です'}]
+                findings_block = f"\n```json\n{json.dumps({'findings': findings}, ensure_ascii=False)}\n```\n"
+            if request.get('stream'):
+                lines = [content] + [f"- 指摘 {i}: スタブの指摘です\n" for i in range(1, state.stream_lines + 1)]
+                if findings_block:
+                    lines.append(findings_block)
+                self._send_stream(request, lines)
+                return
+            self._send_json(200, {
+                'id': f'chatcmpl-stub-{state.requests}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content + findings_block},
+                    'finish_reason': 'stop',
+                }],
+                'usage': {'prompt_tokens': len(prompt), 'completion_tokens': len(content),
+                          'total_tokens': len(prompt) + len(content)},
+            })
+        finally:
+            with state.lock:
+                state.active -= 1
+
+
+def start_server(port=0, delay=0.5, fail_rate=0.0, retry_after=None, stream_lines=20, fail_first=0,
+                 drop_streams=0, drop_after=0):
+    """
+    スタブサーバを別スレッドで起動します。引数はStubStateの設定です。
+
+    Returns:
+        tuple: (server, state) のタプル。server.server_address[1] で実際のポートを取得できます。
+    """
+    state = StubState(delay, fail_rate, retry_after, stream_lines, fail_first, drop_streams, drop_after)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler.state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI互換のチャットAPIを返す検証用スタブサーバ')
+    parser.add_argument('--port', type=int, default=8765, help='待ち受けるポート')
+    parser.add_argument('--delay', type=float, default=0.5, help='1リクエストあたりの応答遅延（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='429/503を返す割合（0〜1）')
+    parser.add_argument('--retry-after', type=float, help='エラー時に返すRetry-Afterヘッダーの秒数')
+    parser.add_argument('--stream-lines', type=int, default=20, help='ストリーミング時に返す指摘の行数')
+    parser.add_argument('--fail-first', type=int, default=0, help='最初のN件の要求に429を返す')
+    parser.add_argument('--drop-streams', type=int, default=0, help='最初のN件のストリーミング応答を途中で切断する')
+    parser.add_argument('--drop-after', type=int, default=0, help='切断するストリーミング応答で、切断までに送る行数')
+    args = parser.parse_args()
+
+    server, state = start_server(args.port, args.delay, args.fail_rate, args.retry_after, args.stream_lines,
+                                 args.fail_first, args.drop_streams, args.drop_after)
+    print(f"スタブサーバを起動しました: OPENAI_BASE_URL=http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"受信: {state.requests}件, 最大同時実行数: {state.max_active}, 中断: {state.disconnects}件")
+
+
+if __name__ == '__main__':
+    main()
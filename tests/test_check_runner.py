@@ -0,0 +1,177 @@
+import asyncio
+import os
+import time
+
+import openai
+import pytest
+
+import check_runner
+from stub_llm_server import start_server
+
+
+@pytest.fixture
+def stub():
+    """OpenAI互換のスタブサーバを起動し、設定を変えられるよう状態を返す"""
+    server, state = start_server(delay=0.05, stream_lines=5)
+    state.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def root_dir(tmp_path):
+    (tmp_path / "doc.md").write_text("# 検証対象\n\n- 要求 R1\n", encoding="utf-8")
+    return tmp_path
+
+
+def run(stub, root_dir, jobs, **options):
+    """run_checksをスタブサーバに対して実行し、(outcomes, progress) を返す"""
+    progress = []
+    client = openai.AsyncOpenAI(api_key="stub", base_url=stub.base_url, max_retries=0)
+
+    async def main():
+        try:
+            return await check_runner.run_checks(
+                client, jobs, root_dir=str(root_dir), base_delay=0.05,
+                on_progress=lambda check, status, detail=None: progress.append((check, status)), **options)
+        finally:
+            await client.close()
+
+    return asyncio.run(main()), progress
+
+
+def read_result(root_dir, check):
+    with open(check_runner.result_path(check, str(root_dir)), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_concurrency_is_capped(stub, root_dir):
+    stub.delay = 0.2
+    jobs = [(f"検証{i}", "プロンプト", ["doc.md"]) for i in range(6)]
+    outcomes, _ = run(stub, root_dir, jobs, concurrency=2, stream=False)
+
+    assert stub.requests == 6
+    assert stub.max_active == 2
+    for check, outcome in outcomes.items():
+        assert outcome['error'] is None
+        assert read_result(root_dir, check) == outcome['result']
+
+
+def test_rate_limited_request_is_retried_with_backoff(stub, root_dir):
+    stub.fail_first = 2
+    start = time.monotonic()
+    outcomes, progress = run(stub, root_dir, [("検証", "プロンプト", ["doc.md"])], stream=False)
+
+    assert outcomes["検証"]['error'] is None
+    assert stub.requests == 3
+    assert ("検証", "実行中 再試行中 (1/5)") in progress
+    assert ("検証", "実行中 再試行中 (2/5)") in progress
+    # base_delay=0.05 の指数バックオフ（0.05秒 + 0.1秒）を待ってから再試行する
+    assert time.monotonic() - start >= 0.15
+
+
+def test_retry_after_header_is_honoured(stub, root_dir):
+    stub.fail_first = 1
+    stub.retry_after = 0.5
+    start = time.monotonic()
+    outcomes, _ = run(stub, root_dir, [("検証", "プロンプト", ["doc.md"])], stream=False)
+
+    assert outcomes["検証"]['error'] is None
+    assert time.monotonic() - start >= 0.5
+
+
+def test_exhausted_retries_keep_previous_result_file(stub, root_dir):
+    check_runner.save_result("検証", "前回の結果", str(root_dir))
+    stub.fail_first = 10
+    outcomes, _ = run(stub, root_dir, [("検証", "プロンプト", ["doc.md"])], max_retries=2)
+
+    assert stub.requests == 3
+    assert outcomes["検証"]['error']
+    assert outcomes["検証"]['result_file'] is None
+    assert read_result(root_dir, "検証") == "前回の結果"
+
+
+def test_streamed_result_is_written_to_result_file(stub, root_dir):
+    deltas = []
+    outcomes, _ = run(stub, root_dir, [("検証", "プロンプト", ["doc.md"])],
+                      on_delta=lambda check, text: deltas.append(text))
+
+    outcome = outcomes["検証"]
+    assert outcome['error'] is None
+    assert outcome['result'].startswith("# スタブ検証結果")
+    assert ''.join(deltas) == outcome['result']
+    assert outcome['result_file'] == check_runner.result_path("検証", str(root_dir))
+    assert read_result(root_dir, "検証") == outcome['result']
+
+
+def test_stream_dropped_before_first_delta_is_retried(stub, root_dir):
+    stub.drop_streams = 1
+    stub.drop_after = 0
+    outcomes, _ = run(stub, root_dir, [("検証", "プロンプト", ["doc.md"])])
+
+    assert stub.requests == 2
+    assert outcomes["検証"]['error'] is None
+    assert read_result(root_dir, "検証") == outcomes["検証"]['result']
+
+
+def test_stream_dropped_after_delta_is_not_retried(stub, root_dir):
+    stub.drop_streams = 1
+    stub.drop_after = 2
+    deltas = []
+    outcomes, _ = run(stub, root_dir, [("検証", "プロンプト", ["doc.md"])],
+                      on_delta=lambda check, text: deltas.append(text))
+
+    outcome = outcomes["検証"]
+    assert stub.requests == 1
+    assert outcome['error']
+    # 途中までの結果は中断の注記を付けて残り、通知した差分と重複しない
+    assert read_result(root_dir, "検証") == ''.join(deltas) + check_runner.CANCELLED_NOTE
+    assert os.path.samefile(outcome['result_file'], check_runner.result_path("検証", str(root_dir)))
+
+
+class RecordingLimiter(check_runner.TokenRateLimiter):
+    """予約したトークン数を記録するTPM制限"""
+
+    def __init__(self, tokens_per_minute):
+        super().__init__(tokens_per_minute)
+        self.reservations = []
+
+    async def acquire(self, tokens):
+        self.reservations.append(tokens)
+        await super().acquire(tokens)
+
+
+def test_each_retry_reserves_tokens(stub, root_dir):
+    stub.fail_first = 2
+    limiter = RecordingLimiter(10 ** 8)
+    outcomes, _ = run(stub, root_dir, [("検証", "プロンプト", ["doc.md"])], stream=False, limiter=limiter)
+
+    assert outcomes["検証"]['error'] is None
+    assert len(limiter.reservations) == 3
+    assert len(set(limiter.reservations)) == 1
+
+
+def test_retry_backoff_releases_concurrency_slot(stub, root_dir):
+    stub.fail_first = 1
+    stub.retry_after = 0.5
+    jobs = [("検証A", "プロンプト", ["doc.md"]), ("検証B", "プロンプト", ["doc.md"])]
+    _, progress = run(stub, root_dir, jobs, concurrency=1, stream=False)
+
+    retried = next(check for check, status in progress if '再試行中' in status)
+    other = "検証B" if retried == "検証A" else "検証A"
+    # 再試行を待つ間に、もう一方の検証が同時実行の枠を使って先に完了する
+    assert progress.index((other, "完了")) < progress.index((retried, "実行中 再試行中 (1/5)"))
+
+
+def test_rate_limiter_refunds_unused_reservation():
+    async def main():
+        limiter = check_runner.TokenRateLimiter(6000)
+        await limiter.acquire(4000)
+        limiter.settle(2000, 500)
+        start = time.monotonic()
+        # 予約の余り（1500トークン）が戻っているので待たずに通る
+        await limiter.acquire(3500)
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) < 0.1
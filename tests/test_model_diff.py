@@ -0,0 +1,31 @@
+import io
+import os
+
+from model_diff import diff_models, load_version
+from xmi_parser import parse_xmi
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REQUIREMENT_XMI = os.path.join(REPO_DIR, '要求図', '要求図.xml')
+QEA_FILE = os.path.join(REPO_DIR, '自動販売機.qea')
+
+
+def test_same_model_from_xmi_and_qea_has_no_changes():
+    old = load_version(REQUIREMENT_XMI)
+    new = load_version(QEA_FILE, '要求図')
+
+    assert diff_models(old, new, shared_only=True) == []
+
+
+def test_requirement_text_change_is_found_across_formats():
+    with open(REQUIREMENT_XMI, 'rb') as f:
+        text = f.read().decode('cp932')
+    notes = text.index('#NOTES#') + len('#NOTES#')
+    old = parse_xmi(io.BytesIO((text[:notes] + '変更後：' + text[notes:]).encode('cp932')))
+    new = load_version(QEA_FILE, '要求図')
+
+    changes = diff_models(old, new, shared_only=True)
+
+    assert [(change['change'], change['category'], list(change['fields'])) for change in changes] == \
+        [('modified', 'requirement', ['tag:text'])]
+    before, after = changes[0]['fields']['tag:text']
+    assert before == '変更後：' + after
@@ -0,0 +1,212 @@
+import http.client
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+import check_runner
+import stub_llm_server
+import verification_server as vs
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_DIRS = ["要求図", "ユースケース図", "プロンプト"]
+COVERAGE = "網羅性チェック 要求カバレッジ"
+USECASE = "図妥当性チェック ユースケース図"
+LINKS = "図間整合性チェック 要求図とユースケース図"
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """OpenAI互換のスタブサーバを起動し、ジョブサーバのAPIクライアントの接続先にする"""
+    server, state = stub_llm_server.start_server(0, delay=0.05, stream_lines=5)
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def models_root(tmp_path):
+    """要求図・ユースケース図とプロンプトだけを持つモデルを2つ用意する"""
+    root = tmp_path / "models"
+    for model in ("m1", "m2"):
+        for name in MODEL_DIRS:
+            shutil.copytree(os.path.join(REPO_DIR, name), root / model / name,
+                            ignore=shutil.ignore_patterns("__pycache__", "*.PNG"))
+    return root
+
+
+@pytest.fixture
+def start(stub, models_root, tmp_path):
+    """ジョブサーバを起動する関数を返し、終了時に止める"""
+    servers = []
+
+    def start(workers=1):
+        server, queue, runner = vs.start_server(0, str(tmp_path / "jobs.sqlite3"), str(models_root), workers=workers,
+                                                concurrency=4, tokens_per_minute=10 ** 8,
+                                                cache_dir=str(tmp_path / "cache"))
+        servers.append((server, queue))
+        return f"http://127.0.0.1:{server.server_address[1]}", queue
+
+    yield start
+    for server, queue in servers:
+        server.shutdown()
+        server.server_close()
+        queue.close()
+
+
+def wait_status(url, job_id, status, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = vs.get_job(url, job_id)
+        if job['status'] == status:
+            return job
+        assert time.monotonic() < deadline, f"ジョブ {job_id} が {status} になりません: {job['status']}"
+        time.sleep(0.02)
+
+
+def wait_all(url, job_ids):
+    return {job_id: vs.wait_job(url, job_id, interval=0.05) for job_id in job_ids}
+
+
+def post_raw(url, body, headers):
+    """ジョブの投入を任意の本文・ヘッダで送り、(ステータス, 応答) を返す"""
+    connection = http.client.HTTPConnection(url.split("//")[1], timeout=10)
+    try:
+        connection.putrequest("POST", "/jobs")
+        for name, value in {"Content-Length": str(len(body)), **headers}.items():
+            connection.putheader(name, value)
+        connection.endheaders(body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_identical_submission_is_deduplicated(stub, start):
+    stub.delay = 0.5
+    url, _ = start()
+    first = vs.submit_job(url, "m1", [COVERAGE], "alice")
+    second = vs.submit_job(url, "m1", [COVERAGE], "bob")
+    forced = vs.submit_job(url, "m1", [COVERAGE], "alice", force=True)
+
+    assert first['deduplicated'] is False
+    assert second == {'id': first['id'], 'deduplicated': True, 'status': second['status']}
+    assert forced['id'] != first['id']
+    wait_all(url, [first['id'], forced['id']])
+    # 終了したジョブとは重複させず、新しいジョブにする
+    again = vs.submit_job(url, "m1", [COVERAGE], "alice")
+    assert again['deduplicated'] is False
+    assert again['id'] not in (first['id'], forced['id'])
+    wait_all(url, [again['id']])
+
+
+def test_users_are_served_round_robin(stub, start):
+    stub.delay = 0.3
+    url, queue = start(workers=1)
+    busy = vs.submit_job(url, "m2", [COVERAGE], "carol")['id']
+    wait_status(url, busy, vs.RUNNING)
+    alice = [vs.submit_job(url, "m1", [check], "alice")['id'] for check in (COVERAGE, USECASE, LINKS)]
+    bob = [vs.submit_job(url, "m2", [check], "bob")['id'] for check in (USECASE, LINKS)]
+    wait_all(url, [busy] + alice + bob)
+
+    started = [job['id'] for job in sorted(queue.list(), key=lambda job: job['started'])]
+    # 先に3件投入したaliceの後ろにbobが並ぶのではなく、利用者ごとに交互に実行する
+    assert started == [busy, alice[0], bob[0], alice[1], bob[1], alice[2]]
+
+
+def test_queued_job_is_cancelled_without_running(stub, start):
+    stub.delay = 0.5
+    url, _ = start(workers=1)
+    running = vs.submit_job(url, "m1", [COVERAGE], "alice")['id']
+    wait_status(url, running, vs.RUNNING)
+    queued = vs.submit_job(url, "m2", [COVERAGE], "bob")['id']
+
+    assert vs.cancel_job(url, queued) == {'id': queued, 'cancelled': True}
+    assert vs.cancel_job(url, queued) == {'id': queued, 'cancelled': False}
+    jobs = wait_all(url, [running, queued])
+    assert jobs[running]['status'] == vs.DONE
+    assert jobs[queued]['status'] == vs.CANCELLED
+    assert jobs[queued]['started'] is None
+    assert jobs[queued]['outcomes'] == {}
+
+
+def test_running_job_is_cancelled(stub, start, models_root):
+    stub.delay = 5.0
+    stub.stream_lines = 50
+    url, _ = start()
+    job_id = vs.submit_job(url, "m1", [COVERAGE], "alice")['id']
+    deadline = time.monotonic() + 30
+    while vs.get_job(url, job_id)['progress'].get(COVERAGE) != "実行中":
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+    assert vs.cancel_job(url, job_id) == {'id': job_id, 'cancelled': True}
+    start_time = time.monotonic()
+    job = vs.wait_job(url, job_id, interval=0.05)
+    assert time.monotonic() - start_time < 3.0
+    assert job['status'] == vs.CANCELLED
+    assert job['outcomes'][COVERAGE]['cancelled'] is True
+    # 受信途中の結果は中断の注記を付けて保存する
+    with open(check_runner.result_path(COVERAGE, str(models_root / "m1")), encoding="utf-8") as f:
+        assert f.read().endswith(check_runner.CANCELLED_NOTE)
+
+
+def test_unfinished_jobs_are_requeued_after_restart(stub, start, models_root, tmp_path):
+    queue = vs.JobQueue(str(tmp_path / "jobs.sqlite3"))
+    interrupted, _ = queue.submit("alice", str(models_root / "m1"), [COVERAGE])
+    waiting, _ = queue.submit("bob", str(models_root / "m2"), [USECASE])
+    # 実行中のまま終了したサーバを再現する
+    assert queue.next()['id'] == interrupted
+    queue.close()
+
+    url, _ = start()
+    jobs = wait_all(url, [interrupted, waiting])
+    assert {job['status'] for job in jobs.values()} == {vs.DONE}
+    assert stub.requests == 2
+
+
+def test_result_contains_outcomes_and_findings(stub, start, models_root):
+    url, _ = start()
+    job_id = vs.submit_job(url, "m1", [COVERAGE], "alice")['id']
+    job = vs.wait_job(url, job_id, interval=0.05)
+
+    assert job['status'] == vs.DONE
+    assert list(job['outcomes']) == [COVERAGE]
+    outcome = job['outcomes'][COVERAGE]
+    assert outcome['error'] is None
+    assert outcome['result'].startswith("# スタブ検証結果")
+    assert outcome['findings_count'] == len(outcome['findings'])
+    with open(outcome['result_file'], encoding="utf-8") as f:
+        assert f.read() == outcome['result']
+    assert outcome['result_file'] == check_runner.result_path(COVERAGE, str(models_root / "m1"))
+    # 状態の問い合わせには本文と指摘を含めない
+    summary = vs.get_job(url, job_id)['outcomes'][COVERAGE]
+    assert 'result' not in summary and 'findings' not in summary
+    assert summary['findings_count'] == outcome['findings_count']
+
+
+@pytest.mark.parametrize("checks", [[["網羅性チェック 要求カバレッジ"]], [{"name": COVERAGE}], [COVERAGE, 1],
+                                    ["存在しない検証"], COVERAGE])
+def test_malformed_checks_are_rejected(start, checks):
+    url, queue = start()
+    status, body = post_raw(url, json.dumps({'model': "m1", 'checks': checks}).encode("utf-8"),
+                            {"Content-Type": "application/json"})
+
+    assert status == 400
+    assert "checks" in body['error']
+    assert queue.stats()['queued'] == 0
+
+
+@pytest.mark.parametrize("length", ["abc", "-1", "1.5"])
+def test_bad_content_length_is_rejected(start, length):
+    url, _ = start()
+    status, body = post_raw(url, b'{"model": "m1"}', {"Content-Type": "application/json", "Content-Length": length})
+
+    assert status == 400
+    assert body['error']
+    # 不正な要求の後もサーバは応答を続ける
+    assert vs.request_json(url + "/health")['queued'] == 0
@@ -0,0 +1,102 @@
+import os
+import shutil
+
+import pytest
+
+from watch_models import ModelWatcher, changed_paths, snapshot
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_DIRS = ('要求図', 'ユースケース図', 'ユースケース記述', 'プロンプト')
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """サンプルモデル（XMI・抽出結果・ユースケース記述・プロンプト）の作業用コピー"""
+    for directory in MODEL_DIRS:
+        shutil.copytree(os.path.join(REPO_DIR, directory), tmp_path / directory,
+                        ignore=shutil.ignore_patterns('__pycache__', '*.py', '*.PNG', '*.png'))
+    return tmp_path
+
+
+def make_watcher(model_dir):
+    return ModelWatcher(str(model_dir), qea_file=None, cache_file=str(model_dir / '.extract_cache.json'), verify=False)
+
+
+def change_xmi(path, old, new):
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert old in data
+    with open(path, 'wb') as f:
+        f.write(data.replace(old, new))
+    return os.path.normpath(str(path))
+
+
+def test_use_case_change_refreshes_report_and_dependent_checks(model_dir):
+    watcher = make_watcher(model_dir)
+    changed = change_xmi(model_dir / 'ユースケース図' / 'ユースケース図.xml', b'UC10 ', b'UC11 ')
+
+    written, checks = watcher.process({changed})
+
+    report = os.path.normpath(str(model_dir / 'ユースケース図' / 'ユースケース_要素.md'))
+    assert written == [report]
+    assert 'UC11' in (model_dir / 'ユースケース図' / 'ユースケース_要素.md').read_text(encoding='utf-8')
+    assert sorted(os.listdir(model_dir / 'ユースケース図')) == ['ユースケース_要素.md', 'ユースケース図.xml']
+    for check in ('図妥当性チェック ユースケース図',
+                  '図間整合性チェック 要求図とユースケース図',
+                  '図面間整合チェック ユースケース図とユースケース記述',
+                  '図間整合性チェック 用語_ID整合性チェック',
+                  '網羅性チェック 要求カバレッジ'):
+        assert check in checks
+    for check in ('図妥当性チェック 要求の重複_矛盾',
+                  '網羅性チェック フローカバレッジ',
+                  '網羅性チェック 状態_遷移カバレッジ',
+                  '網羅性チェック リスク対応カバレッジ'):
+        assert check not in checks
+
+
+def test_activity_change_selects_only_activity_checks(model_dir):
+    watcher = make_watcher(model_dir)
+    # 内容を変えずに書き直しても（更新時刻だけの変更）、抽出キャッシュがないので再抽出される
+    path = model_dir / 'ユースケース記述' / '商品一覧を表示する.xml'
+    changed = change_xmi(path, b'<XMI', b'<XMI')
+
+    written, checks = watcher.process({changed})
+
+    assert written == [os.path.normpath(str(model_dir / 'ユースケース記述' / '商品一覧を表示する_アクティビティ図.md'))]
+    # 抽出結果のMarkdownを生のPlantUMLの代わりに送る検証項目と、アクティビティ図のルールを持つ検証項目
+    assert checks == ['図間整合性チェック ユースケース記述内のフローとアクティビティ図（ユースケース）',
+                      '図間整合性チェック アクティビティ図（ユースケース）とステートマシン図',
+                      '網羅性チェック フローカバレッジ',
+                      '網羅性チェック 状態_遷移カバレッジ']
+
+
+def test_new_use_case_description_reruns_description_checks(model_dir):
+    watcher = make_watcher(model_dir)
+    path = model_dir / 'ユースケース記述' / '新しいユースケース.md'
+    path.write_text('# 新しいユースケース\n', encoding='utf-8')
+
+    written, checks = watcher.process({os.path.normpath(str(path))})
+
+    assert written == []
+    assert checks == ['図面間整合チェック ユースケース図とユースケース記述']
+
+
+def test_edit_during_reverify_is_detected_on_next_poll(model_dir):
+    watcher = ModelWatcher(str(model_dir), qea_file=None, debounce=0.05, interval=0.01,
+                           cache_file=str(model_dir / '.extract_cache.json'))
+    requirement_xmi = model_dir / '要求図' / '要求図.xml'
+    edited = []
+
+    def reverify(checks):
+        # 再検証（AI検証）の間に、利用者が別の図を保存する
+        edited.append(change_xmi(requirement_xmi, b'<XMI', b'<XMI '))
+        return {}
+
+    watcher.reverify = reverify
+    change_xmi(model_dir / 'ユースケース図' / 'ユースケース図.xml', b'UC10 ', b'UC11 ')
+    written, checks = watcher.run(once=True)
+
+    assert edited and checks
+    # 自分で書き出した抽出結果は変更として扱わず、再検証中の編集だけが次のポーリングで検知される
+    assert changed_paths(watcher.state, snapshot(str(model_dir))) == set(edited)
+    assert written[0] not in changed_paths(watcher.state, snapshot(str(model_dir)))
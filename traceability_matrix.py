@@ -0,0 +1,538 @@
+import argparse
+import csv
+import re
+import time
+
+import numpy as np
+
+try:
+    from scipy import sparse
+    from scipy.sparse import csgraph
+except ImportError:
+    sparse = None
+
+import instrumentation
+from model_graph import DERIVE_REQT, NESTING, REFINE, SATISFY
+
+# 要求同士の派生・詳細化（下位 → 上位）
+HIERARCHY_TYPES = (DERIVE_REQT, NESTING, REFINE)
+# 要求を詳細化・充足する関連（ユースケース → 要求）
+TRACE_TYPES = (REFINE, SATISFY, 'trace', 'verify')
+
+# Markdownで行列の形にするユースケースの上限（超えたら一覧の形にする）
+DEFAULT_MAX_COLUMNS = 30
+
+# 行列のセル：直接の詳細化、下位要求を経由した詳細化
+DIRECT = '●'
+DERIVED = '○'
+
+_NUMBERED = re.compile(r'(\D*)(\d+)(.*)', re.DOTALL)
+
+# CSVの1つのセルに並べる名前の上限（超えた分は件数で示す）
+MAX_LISTED = 20
+
+CSV_HEADER = ['要求ID', '要求名', '上位要求', 'ユースケース（直接）', 'ユースケース（下位要求経由）',
+              'アクティビティ', '末端の要求', '詳細化済みの末端の要求', 'カバレッジ(%)']
+
+
+class Relation:
+    """
+    疎な0/1行列（行の要素 → 列の要素の関係）。
+    非ゼロの位置を行番号・列番号の整数配列（COO形式）で持ち、重複は除きます。
+    積はSciPyがあればscipy.sparseのCSR行列で、なければNumPyの配列演算だけで計算します。
+    """
+
+    def __init__(self, rows, cols, shape):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if len(rows):
+            # (行, 列) を1つの整数にして並べ、重複を除く
+            keys = np.sort(rows * shape[1] + cols, kind='stable')   # 整列済みの列の連結は線形時間で並ぶ
+            keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+            rows, cols = np.divmod(keys, shape[1])
+        self.rows = rows
+        self.cols = cols
+        self.shape = tuple(shape)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def identity(cls, size):
+        index = np.arange(size, dtype=np.int64)
+        return cls(index, index, (size, size))
+
+    @property
+    def T(self):
+        return Relation(self.cols, self.rows, (self.shape[1], self.shape[0]))
+
+    def csr(self):
+        """CSR形式の (行ごとの開始位置, 列番号) を返す（rows, cols は (行, 列) の順に並んでいる）"""
+        return np.concatenate([[0], np.cumsum(np.bincount(self.rows, minlength=self.shape[0]))]), self.cols
+
+    def to_sparse(self):
+        """scipy.sparse のCSR行列（0/1の重み）にする"""
+        return sparse.csr_matrix((np.ones(len(self), dtype=np.int32), (self.rows, self.cols)), shape=self.shape)
+
+    def _keys(self):
+        return self.rows * self.shape[1] + self.cols
+
+    def __or__(self, other):
+        return Relation(np.concatenate([self.rows, other.rows]), np.concatenate([self.cols, other.cols]), self.shape)
+
+    def __sub__(self, other):
+        keep = ~np.isin(self._keys(), other._keys(), assume_unique=True)
+        return Relation(self.rows[keep], self.cols[keep], self.shape)
+
+    def __matmul__(self, other):
+        shape = (self.shape[0], other.shape[1])
+        if not len(self) or not len(other):
+            return Relation([], [], shape)
+        if sparse is not None:
+            # 積の値は経路の数なので、非ゼロの位置だけを使う
+            product = (self.to_sparse() @ other.to_sparse()).tocoo()
+            return Relation(product.row, product.col, shape)
+        # selfの各非ゼロ (i, k) を、otherの行kの非ゼロ (k, j) の数だけ (i, j) に展開する
+        indptr, indices = other.csr()
+        counts = np.diff(indptr)[self.cols]
+        total = int(counts.sum())
+        rows = np.repeat(self.rows, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        cols = indices[np.repeat(indptr[self.cols], counts) + offsets]
+        return Relation(rows, cols, shape)
+
+    def row_any(self):
+        """行ごとに非ゼロがあるか（bool配列）"""
+        return np.bincount(self.rows, minlength=self.shape[0]) > 0
+
+    def col_any(self):
+        """列ごとに非ゼロがあるか（bool配列）"""
+        return np.bincount(self.cols, minlength=self.shape[1]) > 0
+
+    def row_counts(self, col_mask=None):
+        """行ごとの非ゼロの数（col_maskを指定したらその列だけを数える）"""
+        weights = None if col_mask is None else col_mask[self.cols].astype(np.int64)
+        return np.bincount(self.rows, weights=weights, minlength=self.shape[0]).astype(np.int64)
+
+    def row_lists(self):
+        """行ごとの列番号のリスト"""
+        bounds = np.cumsum(np.bincount(self.rows, minlength=self.shape[0]))
+        return np.split(self.cols, bounds[:-1])
+
+
+def strong_components(relation):
+    """
+    正方の関係を有向グラフとみなし、強連結成分（互いに到達できる要素の集まり）に分けます。
+
+    Returns:
+        tuple: (成分の数, 要素ごとの成分の番号の配列)。
+    """
+    size = relation.shape[0]
+    if sparse is not None:
+        return csgraph.connected_components(relation.to_sparse(), directed=True, connection='strong')
+    # 入ってくる関連か出ていく関連のない要素は循環に含まれないので、配列演算で繰り返し取り除き、
+    # 残った要素（循環とその間の経路）だけをTarjanの方法で分ける
+    alive = np.ones(size, dtype=bool)
+    rows, cols = relation.rows, relation.cols
+    while True:
+        keep = alive[rows] & alive[cols]
+        rows, cols = rows[keep], cols[keep]
+        cyclic = np.zeros(size, dtype=bool)
+        cyclic[rows] = True
+        has_in = np.zeros(size, dtype=bool)
+        has_in[cols] = True
+        cyclic &= has_in
+        if np.array_equal(cyclic, alive):
+            break
+        alive = cyclic
+    core = np.flatnonzero(alive)
+    position = np.full(size, -1, dtype=np.int64)
+    position[core] = np.arange(len(core))
+    count, core_labels = _tarjan(Relation(position[rows], position[cols], (len(core), len(core))))
+    labels = np.empty(size, dtype=np.int64)
+    labels[core] = core_labels
+    labels[~alive] = count + np.arange(size - len(core))
+    return count + size - len(core), labels
+
+
+def _tarjan(relation):
+    """Tarjanの方法で強連結成分に分ける（再帰を使わず、作業用のスタックに [ノード, 次に見る隣接の位置] を積む）"""
+    size = relation.shape[0]
+    indptr, indices = (array.tolist() for array in relation.csr())
+    order = [-1] * size
+    low = [0] * size
+    on_stack = [False] * size
+    labels = [-1] * size
+    stack = []
+    counter = count = 0
+    for root in range(size):
+        if order[root] >= 0:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [[root, indptr[root]]]
+        while work:
+            frame = work[-1]
+            node, position = frame
+            if position < indptr[node + 1]:
+                frame[1] += 1
+                succ = indices[position]
+                if order[succ] < 0:
+                    order[succ] = low[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack[succ] = True
+                    work.append([succ, indptr[succ]])
+                elif on_stack[succ] and order[succ] < low[node]:
+                    low[node] = order[succ]
+                continue
+            work.pop()
+            if work and low[node] < low[work[-1][0]]:
+                low[work[-1][0]] = low[node]
+            if low[node] == order[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    labels[member] = count
+                    if member == node:
+                        break
+                count += 1
+    return count, np.array(labels, dtype=np.int64)
+
+
+def transitive_closure(relation):
+    """
+    正方の関係の反射推移閉包を返します。
+    差分（前回までに到達していない組）だけを次の積に回すため、積の回数は最長の経路の長さで済み、循環があっても止まります。
+    大きな循環があると閉包は要素数の2乗に近づくため、強連結成分をまとめた関係に使います。
+    """
+    closure = frontier = Relation.identity(relation.shape[0])
+    while len(frontier):
+        frontier = (frontier @ relation) - closure
+        closure = closure | frontier
+    return closure
+
+
+def _index(names):
+    return {name: i for i, name in enumerate(names)}
+
+
+class TraceabilityMatrix:
+    """
+    要求・ユースケース・アクティビティ・FMEA項目・状態の間の追跡行列とカバレッジ。
+
+    Attributes:
+        requirements (list): 要求のxmi.id（要求IDの順）。
+        requirement_info (list): 要求の {'name', 'id', 'text'}（requirementsと同じ順）。
+        use_cases (list): ユースケース名。
+        activities (list): アクティビティ図の名前。
+        fmea_items (list): FMEAの項目ID。
+        states (list): (状態機械の名前, 状態名) のタプル。
+        hierarchy (Relation): 要求 → 上位要求。
+        direct (Relation): 要求 → 直接詳細化するユースケース。
+        use_case_activities (Relation): ユースケース → アクティビティ。
+        fmea_states (Relation): FMEA項目 → 状態。
+        component (ndarray): 要求ごとの、要求の階層の強連結成分（循環する派生をまとめたもの）の番号。
+        ancestors (Relation): 成分 → 自身と上位の成分（反射推移閉包）。
+        covered_by (Relation): 成分 → 成分またはその下位の要求を詳細化するユースケース。
+        component_activities (Relation): 成分 → アクティビティ（ユースケース経由）。
+        leaves (ndarray): 末端の要求か（bool）。
+        leaf_total (ndarray): 要求ごとの、自身以下の末端の要求の数。
+        leaf_covered (ndarray): 要求ごとの、自身以下の末端の要求のうちユースケースで詳細化されたものの数。
+    """
+
+    def __init__(self, requirements, requirement_info, use_cases, activities, fmea_items, states,
+                 hierarchy, direct, use_case_activities, fmea_states):
+        self.requirements = requirements
+        self.requirement_info = requirement_info
+        self.use_cases = use_cases
+        self.activities = activities
+        self.fmea_items = fmea_items
+        self.states = states
+        self.hierarchy = hierarchy
+        self.direct = direct
+        self.use_case_activities = use_case_activities
+        self.fmea_states = fmea_states
+
+        with instrumentation.span('trace.closure'):
+            # 同じ強連結成分の要求は下位の要求の集合が等しいので、成分をまとめた関係（循環のない関係）の閉包で済む
+            count, self.component = strong_components(hierarchy)
+            component_of = Relation(np.arange(len(requirements)), self.component, (len(requirements), count))
+            self.ancestors = transitive_closure(component_of.T @ hierarchy @ component_of)
+        with instrumentation.span('trace.coverage'):
+            # 上位の成分 → 自身以下の成分、に転置して成分ごとの直接の詳細化を掛けると、下位要求経由の詳細化になる
+            descendants = self.ancestors.T
+            self.covered_by = descendants @ (component_of.T @ direct)
+            self.component_activities = self.covered_by @ use_case_activities
+            # 末端の要求は下位要求を持たないため循環に含まれず、1つで1つの成分になる
+            self.leaves = ~hierarchy.col_any()
+            leaf_components = np.zeros(count, dtype=bool)
+            leaf_components[self.component[self.leaves]] = True
+            covered_components = np.zeros(count, dtype=bool)
+            covered_components[self.component[self.leaves & direct.row_any()]] = True
+            self.leaf_total = descendants.row_counts(leaf_components)[self.component]
+            self.leaf_covered = descendants.row_counts(covered_components)[self.component]
+
+    def coverage(self):
+        """要求ごとのカバレッジ（自身以下の末端の要求のうちユースケースで詳細化されたものの割合、%）"""
+        return np.where(self.leaf_total > 0, 100.0 * self.leaf_covered / np.maximum(self.leaf_total, 1), 0.0)
+
+    def requirement_label(self, index):
+        info = self.requirement_info[index]
+        return f"{info['id'] or '（IDなし）'} {info['name']}"
+
+    def orphans(self):
+        """
+        どこからも追跡されない要素を種別ごとに返します。
+
+        Returns:
+            dict: 'requirements'（自身・下位要求ともにユースケースがない要求の番号）,
+                  'use_cases_without_requirement', 'use_cases_without_activity',
+                  'activities_without_use_case', 'fmea_without_state',
+                  'states_without_fmea'（FMEAがない場合は空）をキーとする番号の配列の辞書。
+        """
+        uncovered_states = ~self.fmea_states.col_any() if self.fmea_items else np.zeros(len(self.states), dtype=bool)
+        return {
+            'requirements': np.flatnonzero(~self.covered_by.row_any()[self.component]),
+            'use_cases_without_requirement': np.flatnonzero(~self.direct.col_any()),
+            'use_cases_without_activity': np.flatnonzero(~self.use_case_activities.row_any()),
+            'activities_without_use_case': np.flatnonzero(~self.use_case_activities.col_any()),
+            'fmea_without_state': np.flatnonzero(~self.fmea_states.row_any()),
+            'states_without_fmea': np.flatnonzero(uncovered_states),
+        }
+
+    def summary(self):
+        """全体の件数とカバレッジ"""
+        leaves = int(self.leaves.sum())
+        covered_leaves = int((self.leaves & self.direct.row_any()).sum())
+        covered_states = int(self.fmea_states.col_any().sum())
+        return {
+            'requirements': len(self.requirements),
+            'leaf_requirements': leaves,
+            'covered_leaf_requirements': covered_leaves,
+            'requirement_coverage': 100.0 * covered_leaves / leaves if leaves else 0.0,
+            'use_cases': len(self.use_cases),
+            'use_cases_with_activity': int(self.use_case_activities.row_any().sum()),
+            'activities': len(self.activities),
+            'fmea_items': len(self.fmea_items),
+            'states': len(self.states),
+            'covered_states': covered_states,
+            'state_coverage': 100.0 * covered_states / len(self.states) if self.states else 0.0,
+        }
+
+    def covered_use_cases(self):
+        """要求ごとの、自身または下位要求を詳細化するユースケースの番号の配列"""
+        lists = self.covered_by.row_lists()
+        return [lists[c] for c in self.component]
+
+    def rows(self):
+        """CSV_HEADER の順の行（要求ごと）を返す"""
+        parents = self.hierarchy.row_lists()
+        direct = self.direct.row_lists()
+        covered = self.covered_use_cases()
+        activities = self.component_activities.row_lists()
+        coverage = self.coverage()
+        for i, info in enumerate(self.requirement_info):
+            derived = np.setdiff1d(covered[i], direct[i], assume_unique=True)
+            yield [info['id'] or '', info['name'],
+                   _join([self.requirement_label(j) for j in parents[i][:MAX_LISTED]], len(parents[i])),
+                   _join([self.use_cases[j] for j in direct[i][:MAX_LISTED]], len(direct[i])),
+                   _join([self.use_cases[j] for j in derived[:MAX_LISTED]], len(derived)),
+                   _join([self.activities[j] for j in activities[self.component[i]][:MAX_LISTED]],
+                         len(activities[self.component[i]])),
+                   int(self.leaf_total[i]), int(self.leaf_covered[i]), f"{coverage[i]:.1f}"]
+
+
+def _join(names, total):
+    """名前を「; 」でつなぐ（MAX_LISTED を超えた分は件数で示す）"""
+    text = '; '.join(names)
+    return f"{text} ほか{total - len(names)}件" if total > len(names) else text
+
+
+def _natural_key(text):
+    """数字の部分を数として比べる並べ替えのキー（R2 が R10 より前になる）"""
+    match = _NUMBERED.match(text or '')
+    return (match[1], int(match[2]), match[3]) if match else (text or '', -1, '')
+
+
+def _requirement_order(requirements):
+    xmi_ids = list(requirements)
+    keys = [(_natural_key(req['id']), req['name']) for req in requirements.values()]
+    return [xmi_ids[i] for i in sorted(range(len(keys)), key=keys.__getitem__)]
+
+
+def _use_case_activities(use_cases, activities):
+    """ユースケースとアクティビティ図を、IDを除いたユースケース名と図の名前の一致で対応付ける"""
+    from rule_checks import use_case_title
+
+    activity_index = _index(activities)
+    pairs = [(i, activity_index[name])
+             for i, use_case in enumerate(use_cases)
+             for name in (use_case, use_case_title(use_case)) if name in activity_index]
+    return Relation([i for i, _ in pairs], [j for _, j in pairs], (len(use_cases), len(activities)))
+
+
+def _state_of_machines(machines):
+    """状態機械の状態（疑似状態を除く）を (状態機械の名前, 状態名) で返す"""
+    return [(machine.name, state) for machine in machines
+            for state, kind in machine.states.items() if kind == 'state']
+
+
+def _fmea_states(fmea_items, states):
+    """FMEAの項目と、その行に名前（サブマシンの状態は最後の部分）が現れる状態を対応付ける"""
+    names = [state.split('::')[-1] for _, state in states]
+    pairs = [(i, j) for i, (_, text) in enumerate(fmea_items)
+             for j, name in enumerate(names) if name and name in text]
+    return Relation([i for i, _ in pairs], [j for _, j in pairs], (len(fmea_items), len(states)))
+
+
+def build_traceability(facts):
+    """
+    rule_checks.load_model_facts の結果から追跡行列を作ります。
+
+    要求同士の関連・ユースケースと要求の関連はモデルグラフのエッジの配列から一括で取り出し、
+    要素の番号に読み替えて疎行列にします（Pythonのループは要素数ではなく関連の種別の数だけ回る）。
+
+    Returns:
+        TraceabilityMatrix: 追跡行列。
+    """
+    graph = facts['graph']
+    with instrumentation.span('trace.index'):
+        requirements = _requirement_order(facts['requirements'])
+        kinds = np.array(graph.kinds, dtype=object)
+        use_case_nodes = np.array(sorted(np.flatnonzero(kinds == 'UseCase').tolist(),
+                                         key=lambda node: _natural_key(graph.names[node])), dtype=np.int64)
+        use_cases = [graph.names[node] for node in use_case_nodes]
+        activities = sorted(facts['activities'])
+        fmea_items = facts.get('fmea', [])
+        states = _state_of_machines(facts.get('state_machines', []))
+
+        # モデルグラフのノード番号 → 要求・ユースケースの番号（該当しなければ-1）
+        requirement_of = np.full(len(graph), -1, dtype=np.int64)
+        requirement_of[[graph.index[xmi_id] for xmi_id in requirements if xmi_id in graph.index]] = \
+            [i for i, xmi_id in enumerate(requirements) if xmi_id in graph.index]
+        use_case_of = np.full(len(graph), -1, dtype=np.int64)
+        use_case_of[use_case_nodes] = np.arange(len(use_case_nodes))
+
+    with instrumentation.span('trace.relations'):
+        edge_types = np.array(graph.edge_types, dtype=object)
+        sources = np.array(graph.sources, dtype=np.int64)
+        targets = np.array(graph.targets, dtype=np.int64)
+        source_req, target_req = requirement_of[sources], requirement_of[targets]
+        is_hierarchy = np.isin(edge_types, HIERARCHY_TYPES) & (source_req >= 0) & (target_req >= 0)
+        hierarchy = Relation(source_req[is_hierarchy], target_req[is_hierarchy], (len(requirements),) * 2)
+        source_uc = use_case_of[sources]
+        is_trace = np.isin(edge_types, TRACE_TYPES) & (source_uc >= 0) & (target_req >= 0)
+        direct = Relation(target_req[is_trace], source_uc[is_trace], (len(requirements), len(use_cases)))
+
+        use_case_activities = _use_case_activities(use_cases, activities)
+        fmea_states = _fmea_states(fmea_items, states)
+
+    return TraceabilityMatrix(requirements, [facts['requirements'][xmi_id] for xmi_id in requirements],
+                              use_cases, activities, [item for item, _ in fmea_items], states,
+                              hierarchy, direct, use_case_activities, fmea_states)
+
+
+def write_csv(matrix, path):
+    """追跡行列を要求ごとの行のCSV（Excelで開けるようBOM付きUTF-8）に出力する"""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(matrix.rows())
+
+
+def _cell(text):
+    return str(text).replace('|', '\\|')
+
+
+def format_markdown(matrix, max_columns=DEFAULT_MAX_COLUMNS):
+    """
+    追跡行列・カバレッジ・追跡されない要素をMarkdownにします。
+    ユースケースが max_columns 以下なら要求 × ユースケースの行列、超えたら要求ごとの一覧の形にします。
+    """
+    summary = matrix.summary()
+    lines = ["# 追跡行列", "",
+             "## カバレッジ",
+             f"- 要求: {summary['requirements']}件（末端の要求 {summary['leaf_requirements']}件のうち"
+             f"ユースケースで詳細化済み {summary['covered_leaf_requirements']}件、"
+             f"{summary['requirement_coverage']:.1f}%）",
+             f"- ユースケース: {summary['use_cases']}件（アクティビティ図あり {summary['use_cases_with_activity']}件）",
+             f"- アクティビティ図: {summary['activities']}件",
+             f"- FMEAの項目: {summary['fmea_items']}件",
+             f"- 状態: {summary['states']}件（FMEAで扱われている状態 {summary['covered_states']}件、"
+             f"{summary['state_coverage']:.1f}%）", ""]
+
+    coverage = matrix.coverage()
+    lines += ["## 要求 × ユースケース", "",
+              f"{DIRECT}: 直接の詳細化、{DERIVED}: 下位要求を経由した詳細化", ""]
+    if len(matrix.use_cases) <= max_columns:
+        direct = matrix.direct.row_lists()
+        covered = matrix.covered_use_cases()
+        lines.append('| 要求 | ' + ' | '.join(_cell(name) for name in matrix.use_cases) + ' | カバレッジ(%) |')
+        lines.append('|' + '---|' * (len(matrix.use_cases) + 2))
+        for i in range(len(matrix.requirements)):
+            cells = [''] * len(matrix.use_cases)
+            for j in covered[i]:
+                cells[j] = DERIVED
+            for j in direct[i]:
+                cells[j] = DIRECT
+            lines.append(f"| {_cell(matrix.requirement_label(i))} | " + ' | '.join(cells) + f" | {coverage[i]:.1f} |")
+    else:
+        lines.append('| ' + ' | '.join(CSV_HEADER) + ' |')
+        lines.append('|' + '---|' * len(CSV_HEADER))
+        lines += ['| ' + ' | '.join(_cell(value) for value in row) + ' |' for row in matrix.rows()]
+    lines.append("")
+
+    orphans = matrix.orphans()
+    sections = [
+        ('ユースケースで詳細化されていない要求（下位要求を含む）', orphans['requirements'], matrix.requirement_label),
+        ('詳細化する要求がないユースケース', orphans['use_cases_without_requirement'], matrix.use_cases.__getitem__),
+        ('アクティビティ図がないユースケース', orphans['use_cases_without_activity'], matrix.use_cases.__getitem__),
+        ('ユースケースに対応しないアクティビティ図', orphans['activities_without_use_case'], matrix.activities.__getitem__),
+        ('状態を扱っていないFMEAの項目', orphans['fmea_without_state'], matrix.fmea_items.__getitem__),
+        ('FMEAで扱われていない状態', orphans['states_without_fmea'], lambda j: ': '.join(matrix.states[j])),
+    ]
+    lines.append("## 追跡されない要素")
+    for title, indexes, label in sections:
+        lines += ["", f"### {title}（{len(indexes)}件）"]
+        lines += [f"- {_cell(label(i))}" for i in indexes] or ["- なし"]
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    import rule_checks
+
+    parser = argparse.ArgumentParser(description='要求・ユースケース・アクティビティ図・FMEA・状態の追跡行列を作り、'
+                                                 'カバレッジと追跡されない要素を求めます')
+    parser.add_argument('root_dir', nargs='?', default='.', help='モデルのディレクトリ')
+    parser.add_argument('--csv', help='追跡行列のCSVの出力先')
+    parser.add_argument('-o', '--output', help='追跡行列のMarkdownの出力先（省略時は標準出力）')
+    parser.add_argument('--max-columns', type=int, default=DEFAULT_MAX_COLUMNS,
+                        help='Markdownで行列の形にするユースケースの上限')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    with instrumentation.tracing(args.trace):
+        with instrumentation.span('trace.load_facts'):
+            facts = rule_checks.load_model_facts(args.root_dir)
+        with instrumentation.span('trace.build'):
+            matrix = build_traceability(facts)
+        report = format_markdown(matrix, args.max_columns)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Exported: {args.output}")
+    else:
+        print(report)
+    if args.csv:
+        write_csv(matrix, args.csv)
+        print(f"Exported: {args.csv}")
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
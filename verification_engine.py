@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import check_runner
+import context_packer
+import findings_store
+import instrumentation
+import rule_checks
+import state_machine_sim
+from check_registry import CHECKS, CHECKS_BY_NAME, CHECK_FILES
+from response_cache import ResponseCache
+
+
+# 再検証の対象を絞るときにプロンプトに加える見出し
+FOCUS_HEADER = ("## 再検証の対象（前回の検証以降にモデルで追加・変更・削除された要素）\n"
+                "以下の要素と、それに直接関係する記述だけを検証してください。"
+                "指摘もこれらの要素に関するものだけを出力してください（その他の要素の前回の指摘は引き継ぎます）。")
+
+
+def create_client():
+    """
+    検証で共有する非同期クライアントを作ります。
+    1つのクライアントが接続プールを持つため、複数のモデル・検証項目で使い回します。
+    再試行はcheck_runner側でバックオフ付きで行うため、クライアントの再試行は無効にします。
+    """
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+class VerificationEngine:
+    """
+    1つのモデル（プロジェクトのディレクトリ）に対するAI検証を、画面なしで実行します。
+    検証項目とプロンプト・検証対象ファイルの対応は check_registry の定義に従います。
+
+    Args:
+        root_dir (str): モデルのディレクトリ（プロンプト・検証対象ファイル・検証結果の基準）。
+        client (openai.AsyncOpenAI): 共有する非同期クライアント（省略時は最初の実行時に作る）。
+        cache (ResponseCache): 応答キャッシュ（Noneならキャッシュしない）。
+        concurrency (int): 同時に実行するAPI呼び出しの上限。
+        tokens_per_minute (int): 1分あたりに送るトークン数の上限。
+        context_budget (int): 1回のAPI呼び出しに載せるトークン数の上限。
+        use_rules (bool): ルールベースの事前チェック結果をプロンプトに含めるか。
+        stream (bool): 応答をストリーミングで受け取り、受信しながら検証結果ファイルに書くか。
+        history (bool): 実行と構造化された指摘を検証履歴（root_dir直下のSQLite）に保存するか。
+        simulation_depth (int): ステートマシン図の動的検証で生成するイベント列の最大の長さ。
+        simulation_jobs (int): イベント列の生成に使うプロセス数。
+        focus (list): 再検証の対象に絞る要素の表記（model_diff.focus_labels）。指定するとプロンプトで
+            これらの要素に関する検証だけを指示し、それ以外の要素の前回の指摘は引き継ぎます。
+        store (FindingStore): 共有する検証履歴。省略時はroot_dirの検証履歴を最初に参照したときに開き、
+            close（またはwith文の終了）で閉じます。指定した検証履歴は閉じません。
+    """
+
+    def __init__(self, root_dir='.', client=None, cache=None, concurrency=4, tokens_per_minute=30000,
+                 context_budget=context_packer.DEFAULT_CONTEXT_BUDGET, use_rules=True, stream=True, history=True,
+                 simulation_depth=state_machine_sim.DEFAULT_MAX_DEPTH, simulation_jobs=1, focus=None, store=None):
+        self.root_dir = root_dir
+        self.client = client
+        self.cache = cache
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.context_budget = context_budget
+        self.use_rules = use_rules
+        self.stream = stream
+        self.history = history
+        self.simulation_depth = simulation_depth
+        self.simulation_jobs = simulation_jobs
+        self.focus = list(focus) if focus else None
+        self._facts = None
+        self._store = store
+        self._owns_store = store is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """自分で開いた検証履歴を閉じる"""
+        if self._owns_store and self._store is not None:
+            self._store.close()
+            self._store = None
+
+    @staticmethod
+    def checks():
+        """実行できる検証項目（検証対象ファイルのある項目）"""
+        return list(CHECK_FILES)
+
+    @staticmethod
+    def runs_locally(name):
+        """生成AIを使わずにローカルで実行する検証項目か（プロンプト不要）"""
+        check = CHECKS_BY_NAME.get(name)
+        return bool(check and check['runner'])
+
+    @property
+    def facts(self):
+        """ルールの判定に使う抽出結果（最初に参照したときに読み込む）"""
+        if self._facts is None:
+            self._facts = rule_checks.load_model_facts(self.root_dir)
+        return self._facts
+
+    def findings(self, name):
+        """検証項目の事前チェック結果 (findings, rule_names)"""
+        if not self.use_rules or name not in rule_checks.CHECK_RULES:
+            return [], []
+        return rule_checks.run_rules(name, self.facts)
+
+    @property
+    def store(self):
+        """検証履歴（最初に参照したときに開く）"""
+        if self._store is None:
+            self._store = findings_store.FindingStore(os.path.join(self.root_dir, findings_store.DEFAULT_HISTORY_FILE))
+        return self._store
+
+    def prompt(self, name):
+        """事前チェック結果と出力形式の指示を含めたプロンプト本文（プロンプトファイルがなければNone）"""
+        prompt_text = check_runner.load_prompt(name, self.root_dir)
+        if not prompt_text:
+            return None
+        prompt_text = rule_checks.augment_prompt(prompt_text, *self.findings(name))
+        if self.focus:
+            prompt_text = f"{prompt_text}\n\n{self._focus_section()}"
+        return f"{prompt_text}\n\n{findings_store.FINDINGS_INSTRUCTION}"
+
+    def _focus_section(self):
+        lines = [FOCUS_HEADER]
+        lines += [f"- {label}" for label in self.focus]
+        return '\n'.join(lines)
+
+    def _focus_names(self):
+        """再検証の対象の表記（ユースケース名は先頭のIDを除いた名前も含める）"""
+        return set(self.focus) | {rule_checks.use_case_title(label) for label in self.focus}
+
+    def _carried_findings(self, name):
+        """前回の実行のAIの指摘のうち、再検証の対象の要素を含まないもの（絞り込んだ再検証で引き継ぐ）"""
+        focus = self._focus_names()
+        return [{'severity': f['severity'], 'elements': f['elements'], 'message': f['message']}
+                for f in self.store.findings(self.store.latest_runs(name))
+                if f['source'] == 'llm' and not focus & set(f['elements'])]
+
+    def _element_label(self, xmi_id):
+        """事前チェックの対象要素（xmi.id）を要求IDまたは要素名にする"""
+        requirement = self.facts['requirements'].get(xmi_id)
+        if requirement and requirement.get('id'):
+            return requirement['id']
+        return self.facts['graph'].name(xmi_id) or xmi_id
+
+    @instrumentation.traced('history.record')
+    def record(self, name, outcome):
+        """
+        実行結果から構造化された指摘を取り出して検証し、検証履歴に保存します。
+        outcomeには 'status', 'findings'（AIの指摘）, 'parse_error', 'run_id' を追加します。
+        ローカルの検証（'rule_findings' を持つ結果）の指摘は、判定した規則を出典として保存します。
+        再検証の対象を絞った実行では、対象外の要素の前回の指摘を引き継ぎ、件数を 'carried' に入れます。
+        """
+        findings, parse_error = [], None
+        if outcome['cancelled']:
+            status = 'cancelled'
+        elif outcome['error']:
+            status = 'error'
+        else:
+            findings, parse_error = findings_store.parse_findings(outcome['result'])
+            status = 'ok' if findings is not None else 'invalid'
+            findings = findings or []
+        rule_findings = [dict(f, elements=[self._element_label(e) for e in f['elements']])
+                         for f in self.findings(name)[0]] if status in ('ok', 'invalid') else []
+        local = 'rule_findings' in outcome
+        if local:
+            findings = rule_findings = outcome['rule_findings'] if status == 'ok' else []
+        elif self.focus and status == 'ok':
+            carried = self._carried_findings(name)
+            outcome['carried'] = len(carried)
+            findings = findings + carried
+        outcome.update(status=status, findings=findings, parse_error=parse_error)
+        outcome['run_id'] = self.store.record_run(name, status, [] if local else findings, rule_findings,
+                                                  outcome['result'], outcome.get('model', check_runner.MODEL),
+                                                  outcome['cached'], parse_error)
+        return outcome
+
+    def build_jobs(self, names=None):
+        """
+        検証項目をcheck_runnerのジョブにします。
+
+        Returns:
+            tuple: (jobs, skipped) のタプル。skippedは (検証項目, 理由) のリスト。
+        """
+        jobs = []
+        skipped = []
+        for name in names or self.checks():
+            if name not in CHECK_FILES:
+                skipped.append((name, "検証対象ファイルが定義されていません"))
+                continue
+            if self.runs_locally(name):
+                # プロンプトなし（None）のジョブはローカルで実行する
+                jobs.append((name, None, CHECK_FILES[name]))
+                continue
+            prompt_text = self.prompt(name)
+            if not prompt_text:
+                skipped.append((name, f"{name}.txt ファイルが見つかりません"))
+                continue
+            jobs.append((name, prompt_text, CHECK_FILES[name] if CHECKS_BY_NAME[name]['send_files'] else []))
+        return jobs, skipped
+
+    def simulate(self):
+        """
+        状態遷移図とアクティビティ図をシミュレーションします。
+
+        Returns:
+            tuple: (検証結果のMarkdown, 指摘のリスト) のタプル。指摘は判定した規則名（'rule'）を持つ。
+        """
+        results = state_machine_sim.simulate_model(self.facts, self.simulation_depth, jobs=self.simulation_jobs)
+        findings = [f for kind, result in results for f in state_machine_sim.findings(result, kind)]
+        return state_machine_sim.format_report(results, self.simulation_depth), findings
+
+    async def run_local(self, name, files, on_progress=None, cancel=None):
+        """
+        ローカルで実行する検証項目を実行し、検証結果ファイルに保存します。
+        シミュレーションはイベントループを止めないよう別スレッドで実行します。
+
+        Returns:
+            dict: check_runner.run_checks の結果と同じ形式の辞書。'model' にローカルの検証の名前、
+                  'rule_findings' に検証で判定した指摘が入る。
+        """
+        def notify(status, detail=None):
+            if on_progress:
+                on_progress(name, status, detail)
+
+        runner = CHECKS_BY_NAME[name]['runner']
+        outcome = {'result': None, 'error': None, 'result_file': None, 'cached': False, 'chunks': 0,
+                   'missing': [path for path in files if not os.path.exists(os.path.join(self.root_dir, path))],
+                   'cancelled': False, 'model': runner}
+        if cancel is not None and cancel.is_set():
+            outcome.update(cancelled=True, error="中断しました")
+            notify("中断")
+            return outcome
+        notify("実行中")
+        try:
+            with instrumentation.span('local.run', check=name, runner=runner):
+                outcome['result'], outcome['rule_findings'] = await asyncio.to_thread(self.simulate)
+            outcome['result_file'] = check_runner.save_result(name, outcome['result'], self.root_dir)
+        except Exception as e:
+            outcome['error'] = str(e)
+            notify("エラー", str(e))
+            return outcome
+        notify("完了", outcome['result_file'])
+        return outcome
+
+    async def run_async(self, names=None, force=False, on_progress=None, semaphore=None, limiter=None,
+                        on_delta=None, cancel=None):
+        """
+        検証項目を並列に実行します（イベントループ内から呼ぶ版）。
+        on_delta(name, text) で最終結果の受信差分を、cancel（threading.Event）で中断を指示できます。
+
+        Returns:
+            dict: 検証項目をキーとする check_runner.run_checks の結果。
+                  スキップした項目は {'skipped': 理由} を持つ。
+        """
+        jobs, skipped = self.build_jobs(names)
+        # ローカルの検証はAI検証と並行して実行する
+        local_runs = [(name, asyncio.create_task(self.run_local(name, files, on_progress, cancel)))
+                      for name, prompt_text, files in jobs if prompt_text is None]
+        jobs = [job for job in jobs if job[1] is not None]
+        if jobs and self.client is None:
+            self.client = create_client()
+        outcomes = await check_runner.run_checks(
+            self.client, jobs,
+            concurrency=self.concurrency,
+            tokens_per_minute=self.tokens_per_minute,
+            on_progress=on_progress,
+            cache=self.cache,
+            force=force,
+            context_budget=self.context_budget,
+            root_dir=self.root_dir,
+            semaphore=semaphore,
+            limiter=limiter,
+            stream=self.stream,
+            on_delta=on_delta,
+            cancel=cancel) if jobs else {}
+        for name, task in local_runs:
+            outcomes[name] = await task
+        if self.history:
+            for name, outcome in outcomes.items():
+                self.record(name, outcome)
+        for name, reason in skipped:
+            outcomes[name] = {'result': None, 'error': None, 'result_file': None, 'cached': False,
+                              'chunks': 0, 'missing': [], 'cancelled': False, 'skipped': reason}
+        return outcomes
+
+    def run(self, names=None, force=False, on_progress=None, on_delta=None, cancel=None):
+        """検証項目を並列に実行します"""
+        return asyncio.run(self.run_async(names, force, on_progress, on_delta=on_delta, cancel=cancel))
+
+
+async def run_models(root_dirs, names=None, force=False, on_progress=None, client=None, cache=None,
+                     concurrency=4, tokens_per_minute=30000,
+                     context_budget=context_packer.DEFAULT_CONTEXT_BUDGET, use_rules=True, stream=True, cancel=None,
+                     history=True):
+    """
+    複数のモデルの検証を1つのイベントループで実行します。
+    クライアント（接続プール）・同時実行数・TPM制限はすべてのモデルで共有します。
+
+    Args:
+        on_progress (callable): on_progress(root_dir, name, status, detail) の形で進捗を通知する関数。
+
+    Returns:
+        dict: モデルのディレクトリ → 検証項目ごとの結果の辞書。
+    """
+    # ローカルで実行する検証項目だけならクライアント（APIキー）は不要
+    if client is None and not all(map(VerificationEngine.runs_locally, names or VerificationEngine.checks())):
+        client = create_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = check_runner.TokenRateLimiter(tokens_per_minute)
+
+    async def run_model(root_dir):
+        progress = None
+        if on_progress:
+            def progress(name, status, detail=None):
+                on_progress(root_dir, name, status, detail)
+        with VerificationEngine(root_dir, client, cache, concurrency, tokens_per_minute,
+                                context_budget, use_rules, stream, history) as engine:
+            return root_dir, await engine.run_async(names, force, progress, semaphore, limiter, cancel=cancel)
+
+    results = await asyncio.gather(*(run_model(root_dir) for root_dir in root_dirs))
+    return dict(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI検証を画面なしで実行します（複数モデルの一括実行に対応）')
+    parser.add_argument('root_dirs', nargs='*', default=['.'], help='検証するモデルのディレクトリ')
+    parser.add_argument('--check', action='append', help='実行する検証項目（省略時はすべて）')
+    parser.add_argument('--list', action='store_true', help='検証項目の一覧を表示して終了する')
+    parser.add_argument('--force', action='store_true', help='応答キャッシュを使わずに再実行する')
+    parser.add_argument('--no-cache', action='store_true', help='応答キャッシュを読み書きしない')
+    parser.add_argument('--no-rules', action='store_true', help='ルールベースの事前チェック結果をプロンプトに含めない')
+    parser.add_argument('--no-stream', action='store_true', help='応答をストリーミングで受け取らない')
+    parser.add_argument('--no-history', action='store_true', help='実行と構造化された指摘を検証履歴に保存しない')
+    parser.add_argument('-j', '--concurrency', type=int, default=4, help='同時に実行するAPI呼び出しの上限')
+    parser.add_argument('--tpm', type=int, default=30000, help='1分あたりのトークン上限')
+    parser.add_argument('--budget', type=int, default=context_packer.DEFAULT_CONTEXT_BUDGET,
+                        help='1回のAPI呼び出しに載せるコンテキストの上限トークン数')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+
+    if args.list:
+        for check in CHECKS:
+            groups = ', '.join(check['groups']) or '(検証対象ファイルなし)'
+            print(f"{check['name']}\t{groups}")
+        return
+
+    def show_progress(root_dir, name, status, detail=None):
+        if status.startswith("完了") or status == "エラー":
+            print(f"[{root_dir}] {name}: {status} {detail or ''}")
+
+    start_time = time.time()
+    try:
+        with instrumentation.tracing(args.trace):
+            results = asyncio.run(run_models(
+                args.root_dirs, args.check, args.force, show_progress,
+                cache=None if args.no_cache else ResponseCache(),
+                concurrency=args.concurrency, tokens_per_minute=args.tpm,
+                context_budget=args.budget, use_rules=not args.no_rules, stream=not args.no_stream,
+                history=not args.no_history))
+    except KeyboardInterrupt:
+        # 実行中の呼び出しは接続を閉じて止め、途中までの結果は検証結果ファイルに残る
+        print("検証を中断しました。")
+        sys.exit(130)
+
+    failed = 0
+    for root_dir, outcomes in results.items():
+        succeeded = sum(1 for o in outcomes.values() if not o.get('skipped') and o['error'] is None)
+        cached = sum(1 for o in outcomes.values() if o['cached'])
+        errors = [name for name, o in outcomes.items() if o['error'] and not o['cancelled']]
+        for name, o in outcomes.items():
+            if o.get('skipped'):
+                print(f"[{root_dir}] {name}: スキップ ({o['skipped']})")
+        print(f"[{root_dir}] 成功: {succeeded}件（うちキャッシュ: {cached}件）, 失敗: {len(errors)}件")
+        findings = sum(len(o.get('findings', [])) for o in outcomes.values())
+        invalid = [name for name, o in outcomes.items() if o.get('status') == 'invalid']
+        print(f"[{root_dir}] 構造化された指摘: {findings}件"
+              f"{f'（取り出せなかった検証: {len(invalid)}件）' if invalid else ''}")
+        failed += len(errors)
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
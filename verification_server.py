@@ -0,0 +1,584 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import check_runner
+import context_packer
+from check_registry import CHECKS_BY_NAME
+from response_cache import ResponseCache
+from verification_engine import VerificationEngine, create_client
+
+# 複数のモデル・利用者のAI検証をまとめて受け付けるジョブサーバ。
+# 画面（ai_doc_checker_app.py）やスクリプトからHTTPでジョブを投入し、進捗と結果を問い合わせます。
+#   POST   /jobs               {"model", "checks", "user", "force"} でジョブを投入（同じ内容の実行中ジョブがあればそれを返す）
+#   GET    /jobs?user=...      ジョブの一覧
+#   GET    /jobs/<id>          ジョブの状態と検証項目ごとの進捗
+#   GET    /jobs/<id>/events   状態が変わるたびに通知する（Server-Sent Events、終了したら閉じる）
+#   GET    /jobs/<id>/result   検証項目ごとの検証結果と構造化された指摘
+#   DELETE /jobs/<id>          ジョブを中止する
+#   GET    /health             待ち行列と実行中のジョブの数
+
+DEFAULT_PORT = 8780
+DEFAULT_JOBS_FILE = '.verification_jobs.sqlite3'
+# 画面からジョブサーバを使うときのURL（未設定なら画面のプロセスで検証する）
+SERVER_URL_ENV = 'VERIFICATION_SERVER_URL'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'error'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    model TEXT NOT NULL,
+    checks TEXT,
+    force INTEGER NOT NULL,
+    dedup_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    progress TEXT,
+    outcomes TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, dedup_key);
+"""
+
+_JOB_PATH = re.compile(r'^/jobs/(\d+)(/events|/result)?$')
+
+
+def dedup_key(model, checks, force):
+    """同じ内容のジョブを同一視するキー（モデルの絶対パス・検証項目・再実行の指定）"""
+    material = [os.path.realpath(model), sorted(checks) if checks else None, bool(force)]
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class JobQueue:
+    """
+    ジョブの永続キュー（SQLite）。HTTPのスレッドとワーカーのスレッドから共有します。
+    取り出しは利用者ごとの待ち行列を順番に回すため、1人が大量に投入しても他の利用者が待たされません。
+    起動時に、前回の終了時点で待ち・実行中だったジョブを待ち行列に戻します。
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # 投入のたびのコミットを軽くする（WALでは電源断時に最後のコミットだけが失われ得る）
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.version = 0
+        self.pending = {}       # 利用者 → 待ちジョブのIDの deque
+        self.users = deque()    # 次に取り出す利用者の順番
+        self.cancels = {}       # 実行中のジョブのID → threading.Event
+        with self.conn:
+            self.conn.execute("UPDATE jobs SET status = ?, started = NULL, progress = NULL WHERE status = ?",
+                              (QUEUED, RUNNING))
+        for row in self.conn.execute("SELECT id, user FROM jobs WHERE status = ? ORDER BY id", (QUEUED,)):
+            self._enqueue(row['user'], row['id'])
+
+    def close(self):
+        self.conn.close()
+
+    def _enqueue(self, user, job_id):
+        if user not in self.pending:
+            self.pending[user] = deque()
+            self.users.append(user)
+        self.pending[user].append(job_id)
+
+    def _touch(self):
+        """状態が変わったことを待っているスレッドに知らせる（ロックを持って呼ぶ）"""
+        self.version += 1
+        self.changed.notify_all()
+
+    def submit(self, user, model, checks=None, force=False):
+        """
+        ジョブを投入します。同じ内容のジョブが待ち・実行中なら新しく作らずにそのジョブを返します。
+
+        Returns:
+            tuple: (job_id, deduplicated) のタプル。
+        """
+        key = dedup_key(model, checks, force)
+        with self.lock:
+            row = self.conn.execute("SELECT id FROM jobs WHERE dedup_key = ? AND status IN (?, ?) ORDER BY id LIMIT 1",
+                                    (key, QUEUED, RUNNING)).fetchone()
+            if row:
+                return row['id'], True
+            with self.conn:
+                job_id = self.conn.execute(
+                    "INSERT INTO jobs (user, model, checks, force, dedup_key, status, submitted) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (user, model, json.dumps(checks, ensure_ascii=False) if checks else None, int(bool(force)),
+                     key, QUEUED, time.time())).lastrowid
+            self._enqueue(user, job_id)
+            self._touch()
+        return job_id, False
+
+    def next(self):
+        """次に実行するジョブを実行中にして返す（待ちジョブがなければNone）"""
+        with self.lock:
+            while self.users:
+                user = self.users.popleft()
+                jobs = self.pending[user]
+                job_id = jobs.popleft()
+                if jobs:
+                    self.users.append(user)
+                else:
+                    del self.pending[user]
+                with self.conn:
+                    updated = self.conn.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ? AND status = ?",
+                                                (RUNNING, time.time(), job_id, QUEUED)).rowcount
+                if not updated:
+                    continue
+                self.cancels[job_id] = threading.Event()
+                self._touch()
+                return self._job(job_id)
+        return None
+
+    def update_progress(self, job_id, check, status):
+        with self.lock:
+            row = self.conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            progress = json.loads(row['progress'] or '{}')
+            progress[check] = status
+            with self.conn:
+                self.conn.execute("UPDATE jobs SET progress = ? WHERE id = ?",
+                                  (json.dumps(progress, ensure_ascii=False), job_id))
+            self._touch()
+
+    def finish(self, job_id, status, outcomes=None, error=None):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("UPDATE jobs SET status = ?, finished = ?, outcomes = ?, error = ? WHERE id = ?",
+                                  (status, time.time(), json.dumps(outcomes, ensure_ascii=False) if outcomes else None,
+                                   error, job_id))
+            self.cancels.pop(job_id, None)
+            self._touch()
+
+    def cancel(self, job_id):
+        """
+        ジョブを中止します。待ちジョブはそのまま中止にし、実行中のジョブには中断を指示します。
+
+        Returns:
+            bool: 中止できた（待ち・実行中だった）か。
+        """
+        with self.lock:
+            event = self.cancels.get(job_id)
+            if event is not None:
+                event.set()
+                return True
+            with self.conn:
+                updated = self.conn.execute("UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ?",
+                                            (CANCELLED, time.time(), job_id, QUEUED)).rowcount
+            if updated:
+                # 待ち行列に残ったIDは取り出すときに読み飛ばす
+                self._touch()
+            return bool(updated)
+
+    def cancel_event(self, job_id):
+        with self.lock:
+            return self.cancels.get(job_id)
+
+    def _job(self, job_id, results=False):
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {'id': row['id'], 'user': row['user'], 'model': row['model'],
+               'checks': json.loads(row['checks']) if row['checks'] else None, 'force': bool(row['force']),
+               'status': row['status'], 'submitted': row['submitted'], 'started': row['started'],
+               'finished': row['finished'], 'progress': json.loads(row['progress'] or '{}'), 'error': row['error']}
+        outcomes = json.loads(row['outcomes']) if row['outcomes'] else {}
+        if results:
+            job['outcomes'] = outcomes
+        else:
+            # 状態の問い合わせには本文を含めない（件数と保存先のみ）
+            job['outcomes'] = {check: {key: value for key, value in outcome.items() if key not in ('result', 'findings')}
+                               for check, outcome in outcomes.items()}
+        return job
+
+    def get(self, job_id, results=False):
+        with self.lock:
+            return self._job(job_id, results)
+
+    def list(self, user=None, limit=50):
+        """ジョブの一覧（新しい順）"""
+        where, params = ("WHERE user = ?", [user]) if user else ("", [])
+        with self.lock:
+            ids = [row[0] for row in self.conn.execute(f"SELECT id FROM jobs {where} ORDER BY id DESC LIMIT ?",
+                                                       params + [limit])]
+            return [self._job(job_id) for job_id in ids]
+
+    def wait(self, job_id, version, timeout=15.0):
+        """
+        状態がversionから変わるまで（最大timeout秒）待ち、(ジョブ, 現在のversion) を返します。
+        """
+        with self.changed:
+            if self.version == version:
+                self.changed.wait(timeout)
+            return self._job(job_id), self.version
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            return {'queued': counts.get(QUEUED, 0), 'running': counts.get(RUNNING, 0),
+                    'users_waiting': len(self.users), 'finished': sum(counts.get(s, 0) for s in FINISHED)}
+
+
+def _summarize(outcome):
+    """VerificationEngineの結果から、ジョブの結果として保存する項目"""
+    return {'status': outcome.get('status') or ('skipped' if outcome.get('skipped') else None),
+            'skipped': outcome.get('skipped'), 'error': outcome['error'], 'cached': outcome['cached'],
+            'cancelled': outcome['cancelled'], 'result_file': outcome['result_file'],
+            'findings_count': len(outcome.get('findings', [])), 'findings': outcome.get('findings', []),
+            'result': outcome['result']}
+
+
+class JobRunner:
+    """
+    1つのイベントループで、決まった数のワーカーがキューからジョブを取り出して検証します。
+    APIクライアント（接続プール）・同時実行数・TPM制限はすべてのジョブで共有します。
+    """
+
+    def __init__(self, queue, workers=2, concurrency=4, tokens_per_minute=30000,
+                 context_budget=context_packer.DEFAULT_CONTEXT_BUDGET, cache_dir=None):
+        self.queue = queue
+        self.workers = workers
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.context_budget = context_budget
+        self.cache = ResponseCache(cache_dir) if cache_dir else ResponseCache()
+        self.client = None
+        self.loop = None
+        self._signal = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """ワーカーのイベントループを別スレッドで起動する"""
+        threading.Thread(target=lambda: asyncio.run(self._run()), name='job-runner', daemon=True).start()
+        self._ready.wait()
+
+    def notify(self):
+        """ジョブが投入されたことをワーカーに知らせる（どのスレッドからでも呼べる）"""
+        self.loop.call_soon_threadsafe(self._signal.put_nowait, None)
+
+    async def _run(self):
+        self.loop = asyncio.get_running_loop()
+        self._signal = asyncio.Queue()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.limiter = check_runner.TokenRateLimiter(self.tokens_per_minute)
+        self._ready.set()
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    async def _worker(self):
+        while True:
+            job = self.queue.next()
+            if job is None:
+                await self._signal.get()
+                continue
+            await self.execute(job)
+
+    async def execute(self, job):
+        job_id = job['id']
+        names = job['checks']
+        if self.client is None and not all(map(VerificationEngine.runs_locally,
+                                               names or VerificationEngine.checks())):
+            self.client = create_client()
+        engine = VerificationEngine(job['model'], self.client, self.cache, self.concurrency, self.tokens_per_minute,
+                                    self.context_budget)
+
+        def on_progress(check, status, detail=None):
+            self.queue.update_progress(job_id, check, status)
+
+        cancel = self.queue.cancel_event(job_id)
+        try:
+            # XMIの解析はイベントループを止めないよう別スレッドで行う（他のジョブのAPI呼び出しを待たせない）
+            await asyncio.to_thread(lambda: engine.facts)
+            outcomes = await engine.run_async(names, job['force'], on_progress, self.semaphore, self.limiter,
+                                              cancel=cancel)
+        except Exception as e:
+            self.queue.finish(job_id, FAILED, error=str(e))
+            return
+        finally:
+            engine.close()
+        summary = {check: _summarize(outcome) for check, outcome in outcomes.items()}
+        if cancel is not None and cancel.is_set():
+            status = CANCELLED
+        elif any(outcome['error'] and not outcome['cancelled'] for outcome in outcomes.values()):
+            status = FAILED
+        else:
+            status = DONE
+        errors = [f"{check}: {outcome['error']}" for check, outcome in outcomes.items()
+                  if outcome['error'] and not outcome['cancelled']]
+        self.queue.finish(job_id, status, summary, '\n'.join(errors) or None)
+
+
+class JobHTTPServer(ThreadingHTTPServer):
+    # 同時に多数の投入を受けても接続を取りこぼさないよう、待ち受けの上限を広げる
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    queue = None
+    runner = None
+    models_root = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def _read_json(self):
+        """本文のJSONオブジェクトを読む（Content-Lengthや本文が不正ならNone）"""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # 本文の終わりが分からないので、読み残しを次の要求と取り違えないよう接続を閉じる
+            self.close_connection = True
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+
+    def _resolve_model(self, model):
+        """モデルのディレクトリをモデルのルート配下の絶対パスにする（配下でなければNone）"""
+        path = os.path.realpath(os.path.join(self.models_root, model))
+        if os.path.commonpath([path, self.models_root]) != self.models_root or not os.path.isdir(path):
+            return None
+        return path
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip('/') != '/jobs':
+            self._error(404, f"not found: {self.path}")
+            return
+        body = self._read_json()
+        if body is None:
+            self._error(400, "JSONのオブジェクトを送ってください")
+            return
+        model = self._resolve_model(str(body.get('model') or '.'))
+        if model is None:
+            self._error(400, f"モデルのディレクトリがありません: {body.get('model')}")
+            return
+        checks = body.get('checks') or None
+        if checks is not None and (not isinstance(checks, list) or
+                                   any(not isinstance(check, str) or check not in CHECKS_BY_NAME
+                                       for check in checks)):
+            self._error(400, "checks は検証項目の名前の配列で指定してください")
+            return
+        user = str(body.get('user') or self.headers.get('X-User') or 'anonymous')
+        job_id, deduplicated = self.queue.submit(user, model, checks, bool(body.get('force')))
+        if not deduplicated:
+            self.runner.notify()
+        self._send_json(200 if deduplicated else 202, {'id': job_id, 'deduplicated': deduplicated,
+                                                       'status': self.queue.get(job_id)['status']})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        if path == '/health':
+            self._send_json(200, self.queue.stats())
+            return
+        if path == '/jobs':
+            user = parse_qs(url.query).get('user', [None])[0]
+            self._send_json(200, {'jobs': self.queue.list(user)})
+            return
+        match = _JOB_PATH.match(path)
+        if not match:
+            self._error(404, f"not found: {self.path}")
+            return
+        job_id, action = int(match.group(1)), match.group(2)
+        if action == '/events':
+            self._send_events(job_id)
+            return
+        job = self.queue.get(job_id, results=action == '/result')
+        if job is None:
+            self._error(404, f"ジョブがありません: {job_id}")
+            return
+        self._send_json(200, job)
+
+    def do_DELETE(self):
+        match = _JOB_PATH.match(urlsplit(self.path).path.rstrip('/'))
+        if not match or match.group(2):
+            self._error(404, f"not found: {self.path}")
+            return
+        job_id = int(match.group(1))
+        if self.queue.get(job_id) is None:
+            self._error(404, f"ジョブがありません: {job_id}")
+            return
+        cancelled = self.queue.cancel(job_id)
+        self._send_json(200 if cancelled else 409, {'id': job_id, 'cancelled': cancelled})
+
+    def _send_events(self, job_id):
+        """ジョブの状態が変わるたびにServer-Sent Eventsで送り、終了したら閉じる"""
+        job, version = self.queue.wait(job_id, None, timeout=0)
+        if job is None:
+            self._error(404, f"ジョブがありません: {job_id}")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        last = None
+        try:
+            while True:
+                data = json.dumps(job, ensure_ascii=False)
+                if data != last:
+                    self.wfile.write(f"data: {data}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    last = data
+                if job['status'] in FINISHED:
+                    return
+                job, version = self.queue.wait(job_id, version)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server(port=DEFAULT_PORT, jobs_file=DEFAULT_JOBS_FILE, models_root='.', workers=2, concurrency=4,
+                 tokens_per_minute=30000, cache_dir=None, host='127.0.0.1'):
+    """
+    ジョブサーバを別スレッドで起動します。
+
+    Returns:
+        tuple: (server, queue, runner) のタプル。server.server_address[1] で実際のポートを取得できます。
+    """
+    queue = JobQueue(jobs_file)
+    runner = JobRunner(queue, workers, concurrency, tokens_per_minute, cache_dir=cache_dir)
+    runner.start()
+    # 前回から残っている待ちジョブをワーカーに知らせる
+    for _ in range(workers):
+        runner.notify()
+    handler = type('BoundJobRequestHandler', (JobRequestHandler,),
+                   {'queue': queue, 'runner': runner, 'models_root': os.path.realpath(models_root)})
+    server = JobHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, queue, runner
+
+
+# --- クライアント（画面・スクリプトから使う） ---
+
+def request_json(url, method='GET', body=None, timeout=10.0):
+    """
+    ジョブサーバにJSONで問い合わせます。
+
+    Raises:
+        RuntimeError: サーバに接続できない、またはエラーを返した場合。
+    """
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get('error')
+        except ValueError:
+            message = None
+        raise RuntimeError(message or f"HTTP {e.code}") from e
+    except urllib.error.URLError as e:
+        raise RuntimeError(f"ジョブサーバに接続できません: {e.reason}") from e
+
+
+def submit_job(server_url, model, checks=None, user=None, force=False):
+    """ジョブを投入し {'id', 'deduplicated', 'status'} を返す"""
+    return request_json(server_url.rstrip('/') + '/jobs', 'POST',
+                        {'model': model, 'checks': checks, 'user': user, 'force': force})
+
+
+def get_job(server_url, job_id, results=False):
+    """ジョブの状態（results=Trueなら検証結果と指摘を含む）"""
+    return request_json(f"{server_url.rstrip('/')}/jobs/{job_id}{'/result' if results else ''}")
+
+
+def cancel_job(server_url, job_id):
+    try:
+        return request_json(f"{server_url.rstrip('/')}/jobs/{job_id}", 'DELETE')
+    except RuntimeError:
+        return {'id': job_id, 'cancelled': False}
+
+
+def wait_job(server_url, job_id, on_update=None, interval=0.5):
+    """
+    ジョブが終了するまで問い合わせを繰り返し、検証結果を含むジョブを返します。
+    on_update(job) で状態の変化を受け取れます。
+    """
+    last = None
+    while True:
+        job = get_job(server_url, job_id)
+        if on_update and job != last:
+            on_update(job)
+            last = job
+        if job['status'] in FINISHED:
+            return get_job(server_url, job_id, results=True)
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI検証のジョブを受け付け、待ち行列とワーカーで実行するHTTPサーバ')
+    parser.add_argument('--host', default='127.0.0.1', help='待ち受けるアドレス')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='待ち受けるポート')
+    parser.add_argument('--models-root', default='.', help='投入できるモデルのディレクトリの基準（この配下のみ受け付ける）')
+    parser.add_argument('--jobs-file', default=DEFAULT_JOBS_FILE, help='ジョブの待ち行列と結果を保存するSQLiteファイル')
+    parser.add_argument('--cache-dir', help='応答キャッシュのディレクトリ（省略時は .llm_cache）')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='同時に実行するジョブの数')
+    parser.add_argument('-j', '--concurrency', type=int, default=4, help='すべてのジョブで共有するAPI呼び出しの同時実行数')
+    parser.add_argument('--tpm', type=int, default=30000, help='すべてのジョブで共有する1分あたりのトークン上限')
+    parser.add_argument('--stub-llm', action='store_true',
+                        help='検証用のスタブLLMサーバを起動してそれに接続する（APIキー・ネットワーク不要）')
+    args = parser.parse_args()
+
+    if args.stub_llm:
+        import stub_llm_server
+        stub, _ = stub_llm_server.start_server(0, delay=0.2)
+        os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{stub.server_address[1]}/v1"
+        os.environ.setdefault('OPENAI_API_KEY', 'stub')
+        print(f"スタブLLMサーバ: {os.environ['OPENAI_BASE_URL']}")
+
+    server, queue, _ = start_server(args.port, args.jobs_file, args.models_root, args.workers, args.concurrency,
+                                    args.tpm, args.cache_dir, args.host)
+    stats = queue.stats()
+    print(f"ジョブサーバを起動しました: http://{args.host}:{server.server_address[1]} "
+          f"(ワーカー: {args.workers}, 待ちジョブ: {stats['queued']}件)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("ジョブサーバを終了しました。実行中だったジョブは次の起動時に再実行します。")
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import os
+import time
+
+import instrumentation
+from batch_extract import is_xmi_file, extract_file
+from check_registry import CHECK_FILES, checks_for_files
+from extraction_cache import DEFAULT_CACHE_FILE, ExtractionCache
+from qea_repository import export_diagrams
+
+# 監視するモデルのディレクトリ（XMIと抽出結果、ユースケース記述、プロンプト）
+WATCH_DIRS = ('要求図', 'ユースケース図', 'ユースケース記述', 'プロンプト')
+DEFAULT_QEA_FILE = '自動販売機.qea'
+
+# 変更を検知する拡張子（PNGなどの画像や抽出途中の一時ファイルは対象外）
+WATCH_SUFFIXES = ('.xml', '.md', '.txt', '.wsd', '.qea')
+
+
+def snapshot(root_dir, qea_file=None):
+    """監視対象ファイルの (更新時刻, サイズ) をパスごとに返す"""
+    state = {}
+    paths = [qea_file] if qea_file else []
+    for directory in WATCH_DIRS:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root_dir, directory)):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            paths.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(WATCH_SUFFIXES))
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        state[os.path.normpath(path)] = (st.st_mtime_ns, st.st_size)
+    return state
+
+
+def changed_paths(before, after):
+    """追加・更新・削除されたファイルのパスの集合"""
+    return {path for path in before.keys() | after.keys() if before.get(path) != after.get(path)}
+
+
+class ModelWatcher:
+    """
+    モデルのディレクトリと.qeaをポーリングで監視し、変更のあった図だけを再抽出して、
+    影響を受ける検証項目だけを再実行します。
+    書き込みが続く間は待ち、debounce秒間変更が止まってからまとめて処理します。
+    """
+
+    def __init__(self, root_dir='.', qea_file=DEFAULT_QEA_FILE, debounce=2.0, interval=0.5,
+                 cache_file=DEFAULT_CACHE_FILE, verify=True, concurrency=4, tokens_per_minute=30000):
+        self.root_dir = root_dir
+        self.qea_file = qea_file if qea_file and os.path.exists(qea_file) else None
+        self.debounce = debounce
+        self.interval = interval
+        self.cache_file = cache_file
+        self.verify = verify
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.state = snapshot(root_dir, self.qea_file)
+
+    @instrumentation.traced('watch.reextract')
+    def reextract(self, changed):
+        """
+        変更されたXMI/.qeaから抽出結果のMarkdownを作り直します。
+
+        Returns:
+            list: 書き出したMarkdownのパス。
+        """
+        cache = ExtractionCache(self.cache_file)
+        written = []
+        for path in sorted(changed):
+            if not os.path.exists(path):
+                continue
+            if self.qea_file and path == os.path.normpath(self.qea_file):
+                qea_written, _ = export_diagrams(path, self.root_dir, cache)
+                written.extend(qea_written)
+            elif path.endswith('.xml') and is_xmi_file(path):
+                key = cache.file_key(path)
+                if cache.is_source_fresh(path, key):
+                    continue
+                try:
+                    _, xmi_written = extract_file(path)
+                except Exception as e:
+                    print(f"  エラー: {path}: {e}")
+                    continue
+                cache.record_source(path, key, xmi_written)
+                for output_path in xmi_written:
+                    print(f"Exported: {path} -> {output_path}")
+                written.extend(xmi_written)
+        cache.save()
+        return [os.path.normpath(path) for path in written]
+
+    def affected_checks(self, changed, written):
+        """
+        変更・再抽出したファイルを検証対象またはプロンプトに含む検証項目と、
+        事前チェックのルールが読む図・ファイルが変わった検証項目（CHECK_FILESの順）
+        """
+        # 検証項目のファイルはモデルのディレクトリからの相対パスで定義されている
+        checks = set(checks_for_files(os.path.relpath(path, self.root_dir) for path in changed | set(written)))
+        # ルールの事前チェック結果はプロンプトに含まれるため、入力が変わったルールの検証項目も再実行する
+        import rule_checks
+        checks.update(rule_checks.checks_for_inputs(rule_checks.changed_inputs(changed, self.root_dir)))
+        return [check for check in CHECK_FILES if check in checks]
+
+    @instrumentation.traced('watch.reverify')
+    def reverify(self, checks):
+        """検証項目を再実行する（入力が前回と同じ検証は応答キャッシュから返る）"""
+        # 検証を使わない監視（--no-verify）ではAPIクライアントを読み込まない
+        from response_cache import ResponseCache
+        from verification_engine import VerificationEngine
+
+        def show_progress(check, status, detail=None):
+            if status.startswith("完了") or status == "エラー":
+                print(f"  {check}: {status} {detail or ''}")
+
+        with VerificationEngine(self.root_dir, cache=ResponseCache(),
+                                concurrency=self.concurrency, tokens_per_minute=self.tokens_per_minute) as engine:
+            outcomes = engine.run(checks, on_progress=show_progress)
+        for check, outcome in outcomes.items():
+            if outcome.get('skipped'):
+                print(f"  {check}: スキップ（{outcome['skipped']}）")
+        return outcomes
+
+    def accept_own_writes(self, paths):
+        """
+        自分で書き出したファイルだけ、現在の状態を基準に取り込む（次の変更として扱わない）。
+        再検証の間に利用者が保存したほかのファイルの変更は、次のポーリングで検知する。
+        """
+        current = snapshot(self.root_dir, self.qea_file)
+        for path in paths:
+            if path in current:
+                self.state[path] = current[path]
+            else:
+                self.state.pop(path, None)
+
+    def process(self, changed):
+        start_time = time.time()
+        print(f"変更を検知: {', '.join(sorted(changed))}")
+        written = self.reextract(changed)
+        checks = self.affected_checks(changed, written)
+        print(f"再検証の対象: {', '.join(checks) if checks else 'なし'}")
+        own = set(written)
+        if self.verify and checks:
+            outcomes = self.reverify(checks)
+            own.update(os.path.normpath(outcome['result_file']) for outcome in outcomes.values()
+                       if outcome.get('result_file'))
+        self.accept_own_writes(own)
+        elapsed = time.time() - start_time
+        print(f'処理時間: {elapsed:.2f} 秒')
+        return written, checks
+
+    def run(self, once=False):
+        """
+        監視を続けます。once=Trueなら最初の変更をまとめて処理した時点で終了します。
+        """
+        pending = set()
+        last_change = 0.0
+        while True:
+            time.sleep(self.interval)
+            current = snapshot(self.root_dir, self.qea_file)
+            changed = changed_paths(self.state, current)
+            self.state = current
+            if changed:
+                pending |= changed
+                last_change = time.monotonic()
+                continue
+            if pending and time.monotonic() - last_change >= self.debounce:
+                result = self.process(pending)
+                pending = set()
+                if once:
+                    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='モデルの変更を監視し、変更のあった図の再抽出と影響する検証の再実行を行います')
+    parser.add_argument('root_dir', nargs='?', default='.', help='監視するプロジェクトのディレクトリ')
+    parser.add_argument('--qea', default=DEFAULT_QEA_FILE, help='監視する.qeaファイル')
+    parser.add_argument('--debounce', type=float, default=2.0, help='変更が止まってから処理するまでの秒数')
+    parser.add_argument('--interval', type=float, default=0.5, help='ポーリング間隔（秒）')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE, help='抽出キャッシュのファイル')
+    parser.add_argument('--no-verify', action='store_true', help='再抽出のみ行い、AI検証は実行しない')
+    parser.add_argument('--once', action='store_true', help='最初の変更を処理したら終了する')
+    instrumentation.add_trace_argument(parser)
+    args = parser.parse_args()
+
+    watcher = ModelWatcher(args.root_dir, args.qea, args.debounce, args.interval,
+                           args.cache_file, verify=not args.no_verify)
+    print(f"監視を開始しました: {', '.join(WATCH_DIRS)}{', ' + watcher.qea_file if watcher.qea_file else ''}")
+    # 監視を終了した時点（Ctrl-Cを含む）までの計測結果を書き出す
+    with instrumentation.tracing(args.trace):
+        try:
+            watcher.run(once=args.once)
+        except KeyboardInterrupt:
+            print("監視を終了しました。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+import argparse
+import os
+import random
+import time
+from xml.sax.saxutils import escape
+
+# 生成できるXMIの種別（batch_extractの抽出の種別と同じ）
+KINDS = ('requirement', 'use_case', 'activity')
+
+EXPORTER = 'Enterprise Architect 2.5'
+AUTHOR = 'masaki-kato'
+TIMESTAMP = '2025/06/16 18:51:13'
+
+# 名前・要求テキストの組み立てに使う語彙
+_NOUNS = ('商品', '釣銭', '売上金', '在庫', '投入金額', '商品ボタン', '表示パネル', '硬貨', '紙幣', '故障情報',
+          '販売履歴', '温度設定', '補充記録', '管理画面', '返却口', '電子マネー', '点検結果', '販売価格')
+_VERBS = ('表示する', '確認する', '補充する', '回収する', '変更する', '記録する', '通知する', '返金する',
+          '選択する', '払い出す', '監視する', '受け付ける')
+_ACTORS = ('利用者', 'メンテナンス担当者', '管理者', '補充担当者', '決済サーバ', '監視センター')
+_GUARDS = ('YES', 'NO', '在庫あり', '在庫なし', '金額不足', '釣銭不足')
+
+# 要素の共通のタグ付き値（EAのエクスポートと同じ並び）
+_ELEMENT_TAGS = ('isAbstract', 'isSpecification', 'ea_stype', 'ea_ntype', 'version', 'isActive', 'package',
+                 'date_created', 'date_modified', 'gentype', 'tagged', 'package_name', 'phase', 'author',
+                 'complexity', 'status', 'tpos', 'ea_localid', 'ea_eleType', 'style')
+
+
+def _attr(value):
+    return escape(str(value), {'"': '&quot;'})
+
+
+class _XmiWriter:
+    """EA形式のXMIを1行ずつファイルへ書き出す（文書全体をメモリに持たない）"""
+
+    def __init__(self, f, rng):
+        self.f = f
+        self.rng = rng
+        self.local_id = 0
+
+    def guid(self):
+        """EAのGUIDと同じ形のxmi.id（EAID_ + 8-4-4-4-12桁の16進数）"""
+        value = '%032X' % self.rng.getrandbits(128)
+        return f"EAID_{value[:8]}_{value[8:12]}_{value[12:16].lower()}_{value[16:20]}_{value[20:]}"
+
+    def next_local_id(self):
+        self.local_id += 1
+        return self.local_id
+
+    def line(self, depth, text):
+        self.f.write('\t' * depth + text + '\n')
+
+    def open(self, depth, element, **attrs):
+        self.line(depth, f"<UML:{element}{self._attrs(attrs)}>")
+
+    def close(self, depth, element):
+        self.line(depth, f"</UML:{element}>")
+
+    def empty(self, depth, element, **attrs):
+        self.line(depth, f"<UML:{element}{self._attrs(attrs)}/>")
+
+    @staticmethod
+    def _attrs(attrs):
+        return ''.join(f' {key.replace("__", ".")}="{_attr(value)}"' for key, value in attrs.items() if value is not None)
+
+    def tagged_values(self, depth, values):
+        self.open(depth, 'ModelElement.taggedValue')
+        for tag, value in values:
+            self.empty(depth + 1, 'TaggedValue', tag=tag, value=value)
+        self.close(depth, 'ModelElement.taggedValue')
+
+    def stereotype(self, depth, name):
+        self.open(depth, 'ModelElement.stereotype')
+        self.empty(depth + 1, 'Stereotype', name=name)
+        self.close(depth, 'ModelElement.stereotype')
+
+    def element_tags(self, depth, stype, package_id, package_name, ntype=0, extra=()):
+        values = {
+            'isAbstract': 'false', 'isSpecification': 'false', 'ea_stype': stype, 'ea_ntype': ntype,
+            'version': '1.0', 'isActive': 'false', 'package': package_id,
+            'date_created': '2025/06/03 17:00:18', 'date_modified': '2025/06/03 17:25:55',
+            'gentype': '<none>', 'tagged': '0', 'package_name': package_name, 'phase': '1.0',
+            'author': AUTHOR, 'complexity': '1', 'status': '設計中', 'tpos': '0',
+            'ea_localid': self.next_local_id(), 'ea_eleType': 'element',
+            'style': 'BackColor=-1;BorderColor=-1;BorderWidth=-1;FontColor=-1;VSwimLanes=1;HSwimLanes=1;BorderStyle=0;',
+        }
+        self.tagged_values(depth, [(tag, values[tag]) for tag in _ELEMENT_TAGS] + list(extra))
+
+    def connector_tags(self, ea_type, source, target, stereotype=None):
+        """関連・依存・遷移の共通のタグ付き値（source/targetは (名前, 種別, ローカルID)）"""
+        values = [('style', '3'), ('ea_type', ea_type), ('direction', 'Source -> Destination'),
+                  ('linemode', '3'), ('linecolor', '-1'), ('linewidth', '0'), ('seqno', '0')]
+        if stereotype:
+            values.append(('stereotype', stereotype))
+        values += [('headStyle', '0'), ('lineStyle', '0'), ('ea_localid', self.next_local_id())]
+        if stereotype:
+            values.append(('conditional', f'«{stereotype}»'))
+        values += [('ea_sourceName', source[0]), ('ea_targetName', target[0]),
+                   ('ea_sourceType', source[1]), ('ea_targetType', target[1]),
+                   ('ea_sourceID', source[2]), ('ea_targetID', target[2])]
+        for end, navigable in (('src', 'false'), ('dst', 'true')):
+            values += [(f'{end}_visibility', 'Public'), (f'{end}_aggregation', '0'),
+                       (f'{end}_isOrdered', 'false'), (f'{end}_targetScope', 'instance'),
+                       (f'{end}_changeable', 'none'), (f'{end}_isNavigable', navigable),
+                       (f'{end}_containment', 'Unspecified'),
+                       (f'{end}_style', 'Union=0;Derived=0;AllowDuplicates=0;Owned=0;')]
+        values.append(('virtualInheritance', '0'))
+        return values
+
+    def association(self, depth, ea_type, source, target, source_id, target_id):
+        self.open(depth, 'Association', xmi__id=self.guid(), visibility='public',
+                  isRoot='false', isLeaf='false', isAbstract='false')
+        self.tagged_values(depth + 1, self.connector_tags(ea_type, source, target))
+        self.open(depth + 1, 'Association.connection')
+        for end, type_id, navigable in (('source', source_id, 'false'), ('target', target_id, 'true')):
+            self.open(depth + 2, 'AssociationEnd', visibility='public', aggregation='none', isOrdered='false',
+                      targetScope='instance', changeable='none', isNavigable=navigable, type=type_id)
+            self.tagged_values(depth + 3, [('containment', 'Unspecified'), ('ea_end', end)])
+            self.close(depth + 2, 'AssociationEnd')
+        self.close(depth + 1, 'Association.connection')
+        self.close(depth, 'Association')
+
+    def dependency(self, depth, stereotype, source, target, client_id, supplier_id):
+        self.open(depth, 'Dependency', xmi__id=self.guid(), visibility='public',
+                  client=client_id, supplier=supplier_id)
+        self.stereotype(depth + 1, stereotype)
+        self.tagged_values(depth + 1, self.connector_tags('Dependency', source, target, stereotype))
+        self.close(depth, 'Dependency')
+
+    def header(self):
+        self.f.write('<?xml version="1.0" encoding="SHIFT_JIS" standalone="no" ?>\n')
+        self.line(0, f'<XMI xmi.version="1.1" xmlns:UML="omg.org/UML1.3" timestamp="{TIMESTAMP}">')
+        self.line(1, '<XMI.header>')
+        self.line(2, '<XMI.documentation>')
+        self.line(3, '<XMI.exporter>Enterprise Architect</XMI.exporter>')
+        self.line(3, '<XMI.exporterVersion>2.5</XMI.exporterVersion>')
+        self.line(2, '</XMI.documentation>')
+        self.line(1, '</XMI.header>')
+        self.line(1, '<XMI.content>')
+
+    def open_package(self, package_id, package_name):
+        """ModelとPackageを開き、Packageの子要素を書く深さを返す"""
+        self.open(2, 'Model', name='EA Model', xmi__id='MX_' + package_id)
+        self.open(3, 'Namespace.ownedElement')
+        self.empty(4, 'Class', name='EARootClass', xmi__id='EAID_11111111_5487_4080_A7F4_41526CB0AA00',
+                   isRoot='true', isLeaf='false', isAbstract='false')
+        self.open(4, 'Package', name=package_name, xmi__id=package_id, isRoot='false', isLeaf='false',
+                  isAbstract='false', visibility='public')
+        self.tagged_values(5, [('created', '2025/06/03 17:00:18'), ('modified', '2025/06/03 17:25:55'),
+                               ('iscontrolled', '0'), ('version', '1.0'), ('author', AUTHOR),
+                               ('ea_stype', 'Public'), ('gentype', 'Java')])
+        self.open(5, 'Namespace.ownedElement')
+        return 6
+
+    def close_package(self):
+        self.close(5, 'Namespace.ownedElement')
+        self.close(4, 'Package')
+        self.close(3, 'Namespace.ownedElement')
+        self.close(2, 'Model')
+
+    def diagram(self, name, diagram_type, package_id, element_ids):
+        """ダイアグラムと配置（要素を格子状に並べる）"""
+        self.open(2, 'Diagram', name=name, xmi__id=self.guid(), diagramType=diagram_type,
+                  owner=package_id, toolName=EXPORTER)
+        self.tagged_values(3, [('version', '1.0'), ('author', AUTHOR), ('package', package_id),
+                               ('type', diagram_type.replace('Diagram', ''))])
+        self.open(3, 'Diagram.element')
+        for seqno, element_id in enumerate(element_ids, 1):
+            left, top = 40 + (seqno - 1) % 20 * 160, 40 + (seqno - 1) // 20 * 100
+            self.empty(4, 'DiagramElement', geometry=f"Left={left};Top={top};Right={left + 120};Bottom={top + 60};",
+                       subject=element_id, seqno=seqno, style=f"DUID={self.rng.getrandbits(32):08X};")
+        self.close(3, 'Diagram.element')
+        self.close(2, 'Diagram')
+
+    def footer(self, stubs=()):
+        self.line(1, '</XMI.content>')
+        self.line(1, '<XMI.difference/>')
+        if stubs:
+            self.line(1, f'<XMI.extensions xmi.extender="{EXPORTER}">')
+            for stub_id, name, uml_type in stubs:
+                self.line(2, f'<EAStub xmi.id="{stub_id}" name="{_attr(name)}" UMLType="{uml_type}"/>')
+            self.line(1, '</XMI.extensions>')
+        else:
+            self.line(1, f'<XMI.extensions xmi.extender="{EXPORTER}"/>')
+        self.line(0, '</XMI>')
+
+
+def _phrase(rng, index):
+    """重複しない日本語の名前（語彙の組み合わせ＋通し番号）"""
+    return f"{rng.choice(_NOUNS)}{index + 1}を{rng.choice(_VERBS)}"
+
+
+def _write_requirements(w, size):
+    """
+    要求図: size件の要求（id/textは拡張部のタグ付き値）、4分木の包含（Nesting）、
+    要求間のderiveReqt、ユースケース（EAStub）からのrefineを書く。
+    """
+    rng = w.rng
+    package_id = 'EAPK' + w.guid()[4:]
+    package_name = '要求図'
+    requirements = [(w.guid(), _phrase(rng, i) + 'こと', w.next_local_id()) for i in range(size)]
+    use_cases = [(w.guid(), f"UC{i + 1} {_phrase(rng, i)}", w.next_local_id()) for i in range(max(1, size // 5))]
+
+    depth = w.open_package(package_id, package_name)
+    w.open(depth, 'Collaboration', xmi__id=package_id + '_Collaboration', name='Collaborations')
+    w.open(depth + 1, 'Namespace.ownedElement')
+    for req_id, name, _ in requirements:
+        w.open(depth + 2, 'ClassifierRole', name=name, xmi__id=req_id, visibility='public',
+               base='EAID_11111111_5487_4080_A7F4_41526CB0AA00')
+        w.stereotype(depth + 3, 'requirement')
+        w.element_tags(depth + 3, 'Requirement', package_id, package_name,
+                       extra=[('stereotype', 'requirement'), ('difficulty', '普通'), ('priority', '普通')])
+        w.close(depth + 2, 'ClassifierRole')
+    w.close(depth + 1, 'Namespace.ownedElement')
+    w.line(depth + 1, '<UML:Collaboration.interaction/>')
+    w.close(depth, 'Collaboration')
+
+    def end(item, kind):
+        return item[1], kind, item[2]
+
+    for i in range(1, size):
+        parent = requirements[(i - 1) // 4]
+        w.association(depth, 'Nesting', end(requirements[i], 'Requirement'), end(parent, 'Requirement'),
+                      requirements[i][0], parent[0])
+    for _ in range(size // 2):
+        source, target = rng.sample(requirements, 2) if size > 1 else (requirements[0], requirements[0])
+        w.dependency(depth, 'deriveReqt', end(source, 'Requirement'), end(target, 'Requirement'),
+                     source[0], target[0])
+    for use_case in use_cases:
+        target = rng.choice(requirements)
+        w.dependency(depth, 'refine', end(use_case, 'UseCase'), end(target, 'Requirement'),
+                     use_case[0], target[0])
+    w.close_package()
+
+    w.diagram(package_name, 'CustomDiagram', package_id, [req_id for req_id, _, _ in requirements])
+    # 要求のIDとテキストは拡張部のタグ付き値としてmodelElementで要素を参照する
+    for i, (req_id, name, _) in enumerate(requirements):
+        w.empty(2, 'TaggedValue', tag='id', xmi__id=w.guid(), value=f"R{i + 1}", modelElement=req_id)
+        w.empty(2, 'TaggedValue', tag='text', xmi__id=w.guid(),
+                value=f"<memo>#NOTES#{name[:-2]}必要がある。{rng.choice(_NOUNS)}の状態に応じて{rng.choice(_VERBS)}。",
+                modelElement=req_id)
+    return [(use_case_id, name, 'UseCase') for use_case_id, name, _ in use_cases]
+
+
+def _write_use_cases(w, size):
+    """ユースケース図: size件のユースケース、アクター、システム境界、アクターとの関連を書く"""
+    rng = w.rng
+    package_id = 'EAPK' + w.guid()[4:]
+    package_name = 'ユースケース図'
+    actor_count = max(1, min(size // 10, 200))
+    actors = [(w.guid(), f"{_ACTORS[i % len(_ACTORS)]}{i // len(_ACTORS) + 1 if i >= len(_ACTORS) else ''}",
+               w.next_local_id()) for i in range(actor_count)]
+    use_cases = [(w.guid(), f"UC{i + 1} {_phrase(rng, i)}", w.next_local_id()) for i in range(size)]
+    boundary_id = w.guid()
+
+    depth = w.open_package(package_id, package_name)
+    for kind, items in (('Actor', actors), ('UseCase', use_cases)):
+        for item_id, name, _ in items:
+            w.open(depth, kind, name=name, xmi__id=item_id, visibility='public', namespace=package_id,
+                   isRoot='false', isLeaf='false', isAbstract='false')
+            w.element_tags(depth + 1, kind, package_id, package_name)
+            w.close(depth, kind)
+    for i, use_case in enumerate(use_cases):
+        for actor in {actors[i % actor_count], rng.choice(actors)}:
+            # EAは描いた向きのまま出力するため、一部はユースケース→アクターの向きにする
+            if rng.random() < 0.2:
+                w.association(depth, 'Association', (use_case[1], 'UseCase', use_case[2]),
+                              (actor[1], 'Actor', actor[2]), use_case[0], actor[0])
+            else:
+                w.association(depth, 'Association', (actor[1], 'Actor', actor[2]),
+                              (use_case[1], 'UseCase', use_case[2]), actor[0], use_case[0])
+    w.open(depth, 'Collaboration', xmi__id=package_id + '_Collaboration', name='Collaborations')
+    w.open(depth + 1, 'Namespace.ownedElement')
+    w.open(depth + 2, 'ClassifierRole', name='自動販売機システム', xmi__id=boundary_id, visibility='public',
+           base='EAID_11111111_5487_4080_A7F4_41526CB0AA00')
+    w.element_tags(depth + 3, 'Boundary', package_id, package_name)
+    w.close(depth + 2, 'ClassifierRole')
+    w.close(depth + 1, 'Namespace.ownedElement')
+    w.line(depth + 1, '<UML:Collaboration.interaction/>')
+    w.close(depth, 'Collaboration')
+    w.close_package()
+
+    w.diagram(package_name, 'UseCaseDiagram', package_id,
+              [boundary_id] + [item_id for item_id, _, _ in actors + use_cases])
+    return []
+
+
+def _write_activity(w, size):
+    """
+    アクティビティ図: size件のアクションをパーティションに割り当て、
+    開始→アクション→（分岐で条件付きの2方向）→…→終了 のフローと、
+    アクションの出力ピン（ActionPin）を書く。
+    """
+    rng = w.rng
+    package_id = 'EAPK' + w.guid()[4:]
+    package_name = 'アクティビティ図_ユースケース'
+    partitions = [(w.guid(), _ACTORS[i % len(_ACTORS)] + (str(i // len(_ACTORS) + 1) if i >= len(_ACTORS) else ''))
+                  for i in range(max(1, min(size // 20, 50)))]
+    # (xmi.id, 要素名, XMI要素, ea_stype, ea_ntype, kind属性, 所有者)
+    nodes = []
+
+    def node(name, uml, stype, ntype=0, kind=None, owner=None):
+        item = (w.guid(), name, uml, stype, ntype, kind, owner)
+        nodes.append(item)
+        return item
+
+    transitions = []
+    start = node('開始', 'PseudoState', 'StateNode', 100, owner=partitions[0][0])
+    previous = start
+    for i in range(size):
+        action = node(_phrase(rng, i), 'ActionState', 'Action', owner=rng.choice(partitions)[0])
+        transitions.append((previous, action, None))
+        previous = action
+        # 5アクションごとに分岐を挟み、片方は合流ノードへ戻す
+        if i % 5 == 4:
+            guard_yes, guard_no = rng.sample(_GUARDS, 2)
+            decision = node(f"{rng.choice(_NOUNS)}{i + 1}の確認", 'PseudoState', 'Decision', kind='branch',
+                            owner=previous[6])
+            merge = node(None, 'PseudoState', 'MergeNode', kind='join', owner=previous[6])
+            transitions += [(previous, decision, None), (decision, merge, guard_yes)]
+            retry = node(f"{_phrase(rng, i)}（再試行）", 'ActionState', 'Action', owner=previous[6])
+            transitions += [(decision, retry, guard_no), (retry, merge, None)]
+            previous = merge
+    final = node('終了', 'PseudoState', 'StateNode', 101, kind='final', owner=partitions[0][0])
+    transitions.append((previous, final, None))
+    actions = [item for item in nodes if item[3] == 'Action']
+    pins = [(w.guid(), f"{rng.choice(_NOUNS)}の情報", rng.choice(actions)[0]) for _ in range(max(1, size // 10))]
+
+    depth = w.open_package(package_id, package_name)
+    w.open(depth, 'ActivityModel', xmi__id=package_id[4:] + '_ActivityModel', context=package_id,
+           name='ActivityModel', visibility='public')
+    w.open(depth + 1, 'StateMachine.transitions')
+    for source, target, guard in transitions:
+        w.open(depth + 2, 'Transition', xmi__id=w.guid(), visibility='public', source=source[0], target=target[0])
+        if guard:
+            w.open(depth + 3, 'Transition.guard')
+            w.open(depth + 4, 'Guard')
+            w.open(depth + 5, 'Guard.expression')
+            w.empty(depth + 6, 'BooleanExpression', body=guard)
+            w.close(depth + 5, 'Guard.expression')
+            w.close(depth + 4, 'Guard')
+            w.close(depth + 3, 'Transition.guard')
+        w.tagged_values(depth + 3, w.connector_tags('ControlFlow', (source[1], source[3], 0),
+                                                    (target[1], target[3], 0)))
+        w.close(depth + 2, 'Transition')
+    w.close(depth + 1, 'StateMachine.transitions')
+    w.open(depth + 1, 'StateMachine.top')
+    w.open(depth + 2, 'CompositeState', xmi__id=package_id[4:] + '_Activity_Top', name='{top}')
+    w.open(depth + 3, 'CompositeState.substate')
+    for partition_id, classname in partitions:
+        w.open(depth + 4, 'ActionState', xmi__id=partition_id, visibility='public', namespace=package_id)
+        w.element_tags(depth + 5, 'ActivityPartition', package_id, package_name,
+                       extra=[('classifier', w.guid()), ('classname', classname)])
+        w.close(depth + 4, 'ActionState')
+    for node_id, name, uml, stype, ntype, kind, owner in nodes:
+        w.open(depth + 4, uml, name=name, xmi__id=node_id, visibility='public', namespace=package_id, kind=kind)
+        w.element_tags(depth + 5, stype, package_id, package_name, ntype, extra=[('owner', owner)])
+        w.close(depth + 4, uml)
+    w.close(depth + 3, 'CompositeState.substate')
+    w.close(depth + 2, 'CompositeState')
+    w.close(depth + 1, 'StateMachine.top')
+    w.close(depth, 'ActivityModel')
+    w.open(depth, 'Collaboration', xmi__id=package_id[4:] + '_Collaboration', name='Collaborations')
+    w.open(depth + 1, 'Namespace.ownedElement')
+    for pin_id, name, owner in pins:
+        w.open(depth + 2, 'ClassifierRole', name=name, xmi__id=pin_id, visibility='public',
+               base='EAID_11111111_5487_4080_A7F4_41526CB0AA00')
+        w.element_tags(depth + 3, 'ActionPin', package_id, package_name, extra=[('owner', owner)])
+        w.close(depth + 2, 'ClassifierRole')
+    w.close(depth + 1, 'Namespace.ownedElement')
+    w.line(depth + 1, '<UML:Collaboration.interaction/>')
+    w.close(depth, 'Collaboration')
+    w.close_package()
+
+    w.diagram(package_name, 'ActivityDiagram', package_id,
+              [item[0] for item in partitions] + [item[0] for item in nodes] + [item[0] for item in pins])
+    return []
+
+
+_WRITERS = {
+    'requirement': _write_requirements,
+    'use_case': _write_use_cases,
+    'activity': _write_activity,
+}
+
+
+def generate_xmi(path, kind, size, seed=0):
+    """
+    EAのXMI 1.1エクスポートと同じ構造（Shift_JIS、UML1.3名前空間、要素ごとに多数のタグ付き値）の
+    合成モデルを書き出します。同じ引数からは同じ内容のファイルができます。
+
+    Args:
+        path (str): 出力するXMIファイルのパス。
+        kind (str): 'requirement'（要求数）, 'use_case'（ユースケース数）, 'activity'（アクション数）のいずれか。
+        size (int): 生成する主要素の件数。
+        seed (int): 乱数の種。
+
+    Returns:
+        int: 書き出したファイルのバイト数。
+
+    Raises:
+        ValueError: kindが不明な場合。
+    """
+    if kind not in _WRITERS:
+        raise ValueError(f"不明な種別です: {kind}")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Shift_JISにない文字（«»など）はEAと同じく文字参照で書く
+    with open(path, 'w', encoding='shift_jis', errors='xmlcharrefreplace', newline='\n') as f:
+        w = _XmiWriter(f, random.Random(f"{kind}:{size}:{seed}"))
+        w.header()
+        stubs = _WRITERS[kind](w, max(1, size))
+        w.footer(stubs)
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='性能測定用に、EAのXMIエクスポートと同じ構造の大規模な合成モデルを生成します')
+    parser.add_argument('kind', choices=KINDS, help='生成する図の種別')
+    parser.add_argument('size', type=int, help='主要素の件数（要求数・ユースケース数・アクション数）')
+    parser.add_argument('-o', '--output', help='出力するXMIファイル（省略時は <種別>_<件数>.xml）')
+    parser.add_argument('--seed', type=int, default=0, help='乱数の種')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    output = args.output or f"{args.kind}_{args.size}.xml"
+    size = generate_xmi(output, args.kind, args.size, args.seed)
+    print(f"Exported: {output} ({size / 1024 / 1024:.1f} MB)")
+    elapsed = time.time() - start_time
+    print(f'実行時間: {elapsed:.2f} 秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+import xml.etree.ElementTree as ET
+import codecs
+import contextlib
+import re
+
+import instrumentation
+
+UML_NS = 'omg.org/UML1.3'
+_UML_PREFIX = '{' + UML_NS + '}'
+
+# 要素として収集するUML要素（ローカル名）
+ELEMENT_KINDS = ('ClassifierRole', 'Actor', 'UseCase', 'ActionState', 'PseudoState')
+
+# expatがそのまま解釈できる文字コード（これ以外はPython側で逐次デコードする）
+_EXPAT_NATIVE_ENCODINGS = ('utf-8', 'utf-16', 'iso8859-1', 'ascii')
+
+_ENCODING_DECL = re.compile(rb'<\?xml[^>]*encoding=[\'"]([A-Za-z0-9._-]+)[\'"]')
+
+_CHUNK_SIZE = 64 * 1024
+
+# これより短いタグ付き値は共有する（日時・真偽値・可視性など、同じ値が要素の数だけ現れる）
+_SHARED_VALUE_LENGTH = 24
+
+
+class ElementRecord:
+    """要素（ClassifierRole・Actor・UseCase・ActionState・PseudoState）"""
+    __slots__ = ('kind', 'name', 'stereotype')
+
+    def __init__(self, kind, name, stereotype=None):
+        self.kind = kind
+        self.name = name
+        self.stereotype = stereotype
+
+
+class DependencyRecord:
+    __slots__ = ('id', 'stereotype', 'client', 'supplier')
+
+    def __init__(self, id, stereotype, client, supplier):
+        self.id = id
+        self.stereotype = stereotype
+        self.client = client
+        self.supplier = supplier
+
+
+class AssociationRecord:
+    """関連（source/targetは1つ目・2つ目のAssociationEndのtype属性が指す要素）"""
+    __slots__ = ('id', 'source', 'target')
+
+    def __init__(self, id, source=None, target=None):
+        self.id = id
+        self.source = source
+        self.target = target
+
+
+class TransitionRecord:
+    __slots__ = ('id', 'source', 'target', 'condition')
+
+    def __init__(self, id, source, target, condition=None):
+        self.id = id
+        self.source = source
+        self.target = target
+        self.condition = condition
+
+
+class DiagramRecord:
+    """ダイアグラム（typeはdiagramType属性）"""
+    __slots__ = ('id', 'name', 'type')
+
+    def __init__(self, id, name, type):
+        self.id = id
+        self.name = name
+        self.type = type
+
+
+class XmiModel:
+    """
+    1パスの解析で収集したXMIの構成要素。
+
+    大きなモデルでもメモリを抑えるため、レコードは __slots__ のクラスで持ち、
+    タグ付き値はタグ名ごとの列（ノード番号 → 値）に持ちます。
+    xmi.idは最初に現れたときにノード番号を振り、関連の端点などで同じidが現れても
+    同じ文字列オブジェクトを共有します。
+
+    Attributes:
+        elements (dict): xmi.idをキーとする ElementRecord の辞書（文書順）。
+        dependencies (list): DependencyRecord のリスト。
+        associations (list): AssociationRecord のリスト。
+        transitions (list): StateMachine.transitions直下の TransitionRecord のリスト。
+        diagrams (list): DiagramRecord のリスト。
+        ids (list): ノード番号 → xmi.id。
+        index (dict): xmi.id → ノード番号。
+        tagged_values (dict): タグ名 → {ノード番号: 値} のタグ付き値の索引。
+            要素配下のタグ付き値は最初の値、関連・依存配下（AssociationEndを含む）は
+            最後の値を保持する。modelElement属性で要素を参照するタグ付き値
+            （XMI.extensions内）は参照先要素のキーで登録し、既存の値を上書きする。
+    """
+
+    def __init__(self):
+        self.elements = {}
+        self.dependencies = []
+        self.associations = []
+        self.transitions = []
+        self.diagrams = []
+        self.ids = []
+        self.index = {}
+        self.tagged_values = {}
+
+    def node(self, xmi_id):
+        """xmi.idのノード番号（初めてのidなら番号を振る）"""
+        node = self.index.get(xmi_id)
+        if node is None:
+            node = self.index[xmi_id] = len(self.ids)
+            self.ids.append(xmi_id)
+        return node
+
+    def shared_id(self, xmi_id):
+        """登録済みのxmi.idと同じ文字列オブジェクトを返す（Noneはそのまま）"""
+        if xmi_id is None:
+            return None
+        return self.ids[self.node(xmi_id)]
+
+    def set_tagged_value(self, xmi_id, tag, value, overwrite=True):
+        """タグ付き値を索引に登録する（overwrite=Falseなら最初の値を保つ）"""
+        column = self.tagged_values.get(tag)
+        if column is None:
+            column = self.tagged_values[tag] = {}
+        node = self.node(xmi_id)
+        if overwrite:
+            column[node] = value
+        else:
+            column.setdefault(node, value)
+
+    def tagged_value(self, xmi_id, tag, default=None):
+        """索引から要素のタグ付き値を取得する"""
+        column = self.tagged_values.get(tag)
+        node = self.index.get(xmi_id)
+        if column is None or node is None:
+            return default
+        return column.get(node, default)
+
+    def tagged_value_count(self):
+        """索引に登録したタグ付き値の数"""
+        return sum(len(column) for column in self.tagged_values.values())
+
+    def iter_tagged_values(self):
+        """すべてのタグ付き値を (xmi.id, タグ名, 値) で返すジェネレータ（タグ名ごとの順）"""
+        ids = self.ids
+        for tag, column in self.tagged_values.items():
+            for node, value in column.items():
+                yield ids[node], tag, value
+
+
+# 名前空間付きのタグ → ローカル名（要素ごとに文字列を切り出さないよう共有する）
+_local_names = {}
+
+
+def _local_name(tag):
+    name = _local_names.get(tag)
+    if name is None:
+        name = tag[len(_UML_PREFIX):] if tag.startswith(_UML_PREFIX) else tag
+        _local_names[tag] = name
+    return name
+
+
+def _detect_encoding(head):
+    """XML宣言から文字コードを判定する（宣言がなければUTF-8）"""
+    match = _ENCODING_DECL.search(head)
+    if not match:
+        return 'utf-8'
+    return codecs.lookup(match.group(1).decode('ascii')).name
+
+
+class _XmiHandler:
+    """iterparseのイベントを受け取り、XmiModelへ振り分ける"""
+
+    def __init__(self, model):
+        self.model = model
+        self.path = []      # 開いている要素のローカル名
+        self.nodes = []     # 開いている要素（解析済み要素の解放用）
+        self.owners = []    # 開いている収集対象 (record, xmi.id, タグ付き値を後勝ちにするか)
+        self.strings = {}   # 名前・ステレオタイプ・短いタグ付き値の共有表（解析の間だけ持つ）
+
+    def shared(self, value):
+        """同じ内容の文字列は1つのオブジェクトにまとめる"""
+        if value is None:
+            return None
+        return self.strings.setdefault(value, value)
+
+    def start(self, elem):
+        name = _local_name(elem.tag)
+        parent = self.path[-1] if self.path else None
+        self.path.append(name)
+        self.nodes.append(elem)
+        attrib = elem.attrib
+        model = self.model
+
+        owner = None
+        if name in ELEMENT_KINDS:
+            xmi_id = attrib.get('xmi.id')
+            if xmi_id:
+                xmi_id = model.shared_id(xmi_id)
+                record = ElementRecord(name, self.shared(attrib.get('name')))
+                model.elements.setdefault(xmi_id, record)
+                owner = (record, xmi_id, False)
+        elif name == 'Dependency':
+            record = DependencyRecord(model.shared_id(attrib.get('xmi.id')), None,
+                                      model.shared_id(attrib.get('client')), model.shared_id(attrib.get('supplier')))
+            model.dependencies.append(record)
+            owner = (record, record.id, True)
+        elif name == 'Association':
+            record = AssociationRecord(model.shared_id(attrib.get('xmi.id')))
+            model.associations.append(record)
+            owner = (record, record.id, True)
+        elif name == 'Transition' and parent == 'StateMachine.transitions':
+            record = TransitionRecord(model.shared_id(attrib.get('xmi.id')), model.shared_id(attrib.get('source')),
+                                      model.shared_id(attrib.get('target')))
+            model.transitions.append(record)
+            owner = (record, None, False)
+        elif name == 'AssociationEnd':
+            record = self._current_owner()[0]
+            if isinstance(record, AssociationRecord):
+                end_type = model.shared_id(attrib.get('type'))
+                if record.source is None:
+                    record.source = end_type
+                else:
+                    record.target = end_type
+        elif name == 'Diagram':
+            model.diagrams.append(DiagramRecord(attrib.get('xmi.id'), attrib.get('name'),
+                                                self.shared(attrib.get('diagramType'))))
+        elif name == 'TaggedValue':
+            self._tagged_value(attrib)
+        elif name == 'Stereotype':
+            record = self._current_owner()[0]
+            if isinstance(record, (ElementRecord, DependencyRecord)) and record.stereotype is None:
+                record.stereotype = self.shared(attrib.get('name'))
+        elif name == 'BooleanExpression' and 'Guard.expression' in self.path:
+            record = self._current_owner()[0]
+            if isinstance(record, TransitionRecord) and record.condition is None:
+                record.condition = attrib.get('body')
+
+        self.owners.append(owner)
+
+    def _current_owner(self):
+        """最も内側の収集対象を返す"""
+        for owner in reversed(self.owners):
+            if owner is not None:
+                return owner
+        return (None, None, False)
+
+    def _tagged_value(self, attrib):
+        tag = attrib.get('tag')
+        value = attrib.get('value')
+        if value is not None and len(value) < _SHARED_VALUE_LENGTH:
+            value = self.shared(value)
+        model_element = attrib.get('modelElement')
+        if model_element:
+            self.model.set_tagged_value(model_element, tag, value)
+            return
+        _, xmi_id, overwrite = self._current_owner()
+        if xmi_id is None:
+            return
+        self.model.set_tagged_value(xmi_id, tag, value, overwrite)
+
+    def end(self, elem):
+        self.path.pop()
+        self.nodes.pop()
+        self.owners.pop()
+        # 処理済みの要素は親から切り離して解放する
+        elem.clear()
+        if self.nodes:
+            self.nodes[-1].remove(elem)
+
+    def consume(self, events):
+        for event, elem in events:
+            if event == 'start':
+                self.start(elem)
+            else:
+                self.end(elem)
+
+
+def parse_xmi(file_path):
+    """
+    Enterprise ArchitectのXMI 1.1ファイルをiterparseで1パス解析します。
+    ファイル全体を読み込まず、チャンク単位でパーサへ渡します。
+    expatが扱えない文字コード（Shift_JISなど）はチャンクごとに逐次デコードします。
+
+    Args:
+        file_path (str or file): 解析対象のXMIファイルのパス、またはバイナリモードのファイルオブジェクト
+            （標準入力・パイプなど。読み終えても閉じない）。
+
+    Returns:
+        XmiModel: 収集した要求・アクター・ユースケース・関連・依存・遷移・タグ付き値。
+
+    Raises:
+        FileNotFoundError: ファイルが存在しない場合。
+        xml.etree.ElementTree.ParseError: XMLの解析に失敗した場合。
+    """
+    model = XmiModel()
+    handler = _XmiHandler(model)
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    span = instrumentation.span
+
+    if hasattr(file_path, 'read'):
+        source = contextlib.nullcontext(file_path)
+        file_path = getattr(file_path, 'name', '<stream>')
+    else:
+        source = open(file_path, 'rb')
+    with span('xmi.parse', file=str(file_path)), source as f:
+        chunk = f.read(_CHUNK_SIZE)
+        encoding = _detect_encoding(chunk[:200])
+        decoder = None
+        if encoding not in _EXPAT_NATIVE_ENCODINGS:
+            decoder = codecs.getincrementaldecoder(encoding)()
+        while chunk:
+            instrumentation.count('xmi.bytes_parsed', len(chunk))
+            # 文字コードの変換と、木の構築・要素の振り分けを別の区間で測る
+            with span('xmi.decode'):
+                data = decoder.decode(chunk) if decoder else chunk
+            with span('xmi.build'):
+                parser.feed(data)
+                handler.consume(parser.read_events())
+            chunk = f.read(_CHUNK_SIZE)
+        with span('xmi.build'):
+            if decoder:
+                parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+            handler.consume(parser.read_events())
+
+    instrumentation.count('xmi.elements', len(model.elements))
+    instrumentation.count('xmi.connectors', len(model.dependencies) + len(model.associations) + len(model.transitions))
+    instrumentation.count('xmi.tagged_values_indexed', model.tagged_value_count())
+    return model